@@ -0,0 +1,69 @@
+"""
+Компактный формат callback_data (utils/callback_codec.py) против формата aiogram по умолчанию:
+длина кнопок и время pack()/unpack() на одну кнопку.
+
+Запуск:  python -m bench.callback_codec [--rounds 100000]
+"""
+import argparse
+import time
+
+from aiogram.filters.callback_data import CallbackData
+
+from keyboards.admin_kb import AdminConfirm
+from keyboards.callbacks import SelectProduct, SelectSubcategory, TopUpAmount
+
+
+class _ProductV1(CallbackData, prefix="select_product"):
+    product_id: int
+
+
+class _SubcategoryV1(CallbackData, prefix="select_subcat"):
+    safe_id: str
+    subcat: str
+
+
+class _AdminConfirmV1(CallbackData, prefix="admin_confirm"):
+    payment_id: int
+
+
+# (название, кнопка v1, кнопка v2)
+CASES = [
+    ("товар", _ProductV1(product_id=123456), SelectProduct(product_id=123456)),
+    ("подкатегория", _SubcategoryV1(safe_id="services", subcat="Маникюр и педикюр"), SelectSubcategory(subcategory_id=1234)),
+    ("платёж", _AdminConfirmV1(payment_id=987654), AdminConfirm(payment_id=987654)),
+    ("сумма", None, TopUpAmount(value=180)),
+]
+
+
+def _per_call(fn, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def main(rounds: int):
+    print(f"{'кнопка':<14}{'v1 байт':>8}{'v2 байт':>8}{'v1 pack':>10}{'v2 pack':>10}{'v1 unpack':>11}{'v2 unpack':>11}  мкс")
+    for name, old, new in CASES:
+        new_data = new.pack()
+        row = f"{name:<14}"
+        if old is not None:
+            old_data = old.pack()
+            old_pack, old_unpack = _per_call(old.pack, rounds), _per_call(lambda: type(old).unpack(old_data), rounds)
+            row += f"{len(old_data.encode()):>8}"
+        else:
+            old_pack = old_unpack = None
+            row += f"{'-':>8}"
+        new_pack, new_unpack = _per_call(new.pack, rounds), _per_call(lambda: type(new).unpack(new_data), rounds)
+        row += f"{len(new_data.encode()):>8}"
+        row += f"{old_pack:>10.2f}" if old_pack is not None else f"{'-':>10}"
+        row += f"{new_pack:>10.2f}"
+        row += f"{old_unpack:>11.2f}" if old_unpack is not None else f"{'-':>11}"
+        row += f"{new_unpack:>11.2f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=100000)
+    main(parser.parse_args().rounds)
@@ -0,0 +1,161 @@
+"""
+Стоимость маршрутизации одного callback-апдейта через Dispatcher.feed_update:
+  - "до": роутеры с цепочками F.data == ... / F.data.startswith(...) в порядке include_router,
+    как было до таблицы префиксов (список фильтров ниже повторяет прежние регистрации);
+  - "после": utils/callback_table.py с теми же регистрациями, что у бота.
+Хэндлеры заменены пустыми, к API и БД запросов нет — меряется только выбор хэндлера.
+
+Запуск:  python -m bench.callback_dispatch [--rounds 2000]
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Update
+
+USER = {"id": 42, "is_bot": False, "first_name": "Bench"}
+CHAT = {"id": 42, "type": "private"}
+
+# (роутер, фильтр data, состояние FSM или None) — регистрации до таблицы, в порядке include_router
+_EXACT, _PREFIX = "==", "startswith"
+OLD_ROUTES = [
+    ("start", _EXACT, "back_to_menu", None),
+    ("menu", _EXACT, "choose_language", None),
+    ("menu", _PREFIX, "setlang_", None),
+    ("menu", _EXACT, "show_categories", None),
+    ("menu", _EXACT, "about_bot", None),
+    ("menu", _EXACT, "show_profile", None),
+    ("menu", _EXACT, "main_menu", None),
+    ("menu", _EXACT, "back_to_menu", None),
+    ("order", _PREFIX, "order_product_", None),
+    ("order", _EXACT, "order_delivery", None),
+    ("order", _EXACT, "order_selfpickup", None),
+    ("order", _EXACT, "order_confirm_selfpickup", None),
+    ("order", _EXACT, "order_back_to_choice", None),
+    ("order", _EXACT, "appointment_main_menu", None),
+    ("balance", _EXACT, "topup_balance", None),
+    ("balance", _PREFIX, "amount_", "BalanceFSM:choosing_amount"),
+    ("balance", _EXACT, "enter_custom_amount", "BalanceFSM:choosing_amount"),
+    ("balance", _EXACT, "back_to_amount_list", "BalanceFSM:entering_custom_amount"),
+    ("balance", _PREFIX, "currency_", "BalanceFSM:choosing_currency"),
+    ("balance", _EXACT, "confirm_done", "BalanceFSM:confirm_payment"),
+    ("balance", _EXACT, "back_main", "BalanceFSM:choosing_amount"),
+    ("balance", _EXACT, "back_to_main_menu", None),
+    ("balance", _EXACT, "back_to_amount", "BalanceFSM:choosing_currency"),
+    ("balance", _EXACT, "back_to_currency", "BalanceFSM:confirm_payment"),
+    ("balance", _EXACT, "back_to_confirm", "BalanceFSM:wait_screenshot"),
+    ("admin", "callback_data", "pending", None),
+    ("admin", "callback_data", "admin_confirm", None),
+    ("admin", "callback_data", "admin_reject", None),
+    ("admin", _PREFIX, "admin_confirm_", None),
+    ("admin", _PREFIX, "admin_reject_", None),
+    ("purchase", _PREFIX, "buy_product_", None),
+    ("purchase", _PREFIX, "pay_balance_", None),
+    ("purchase", _PREFIX, "confirm_purchase_", None),
+    ("appointment", _PREFIX, "request_service_", None),
+    ("appointment", _EXACT, "appointment_edit", "AppointmentFSM:waiting_confirmation"),
+    ("appointment", _EXACT, "appointment_cancel", None),
+    ("appointment", _EXACT, "confirm_appointment", "AppointmentFSM:waiting_confirmation"),
+    ("catalog", _EXACT, "show_categories", None),
+    ("catalog", _PREFIX, "select_category_", None),
+    ("catalog", _PREFIX, "selectSubcat_", None),
+    ("catalog", _PREFIX, "select_product_", None),
+]
+
+# Типичный поток нажатий: (data до, data после) — каталог и покупка чаще всего
+CLICKS = [
+    ("show_categories", "show_categories"),
+    ("select_category_keys", "c:1"),
+    ("selectSubcat_keys_Steam", "s:4"),
+    ("select_product_17", "p:h"),
+    ("buy_product_17", "b:h"),
+    ("pay_balance_17", "pb:h"),
+    ("confirm_purchase_17", "cp:h"),
+    ("back_to_menu", "main_menu"),
+    ("show_profile", "show_profile"),
+    ("request_service_5", "rs:5"),
+]
+
+
+async def _noop(*args, **kwargs):
+    return None
+
+
+def _old_dispatcher() -> Dispatcher:
+    from aiogram.filters import StateFilter
+    from keyboards.admin_kb import AdminConfirm, AdminReject, PendingPage
+
+    typed = {"pending": PendingPage, "admin_confirm": AdminConfirm, "admin_reject": AdminReject}
+    dp = Dispatcher(storage=MemoryStorage())
+    routers: dict[str, Router] = {}
+    for name, kind, value, state in OLD_ROUTES:
+        router = routers.get(name)
+        if router is None:
+            router = routers[name] = Router(name=name)
+            dp.include_router(router)
+        filters = [StateFilter(state)] if state else []
+        if kind == _EXACT:
+            filters.append(F.data == value)
+        elif kind == _PREFIX:
+            filters.append(F.data.startswith(value))
+        else:
+            filters.append(typed[value].filter())
+        router.callback_query.register(_noop, *filters)
+    return dp
+
+
+def _new_dispatcher() -> Dispatcher:
+    # Те же регистрации, что у бота, но с пустыми хэндлерами
+    import bot  # noqa: F401  импорт хэндлеров заполняет таблицу
+    from utils.callback_table import CallbackTable, _Entry, _Route, callbacks
+
+    table = CallbackTable(name="bench")
+    for key, entry in callbacks._entries.items():
+        routes = [_Route(_noop, route.states) for route in entry.routes]
+        table._entries[key] = _Entry(entry.callback_data, entry.parse, routes)
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(table.router)
+    return dp
+
+
+def _update(update_id: int, data: str) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "from": USER, "chat_instance": "1", "data": data,
+            "message": {"message_id": 1, "date": 0, "chat": CHAT, "from": USER, "text": "x"},
+        },
+    })
+
+
+async def _measure(dp: Dispatcher, bot: Bot, clicks: list[str], rounds: int) -> float:
+    updates = [_update(i, data) for i, data in enumerate(clicks * rounds)]
+    for update in updates[:len(clicks)]:
+        await dp.feed_update(bot, update)  # прогрев
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / len(updates) * 1e6
+
+
+async def main(rounds: int):
+    # Строка лога на каждый апдейт стоит больше самой маршрутизации
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    bot = Bot("42:BENCH")
+    try:
+        before = await _measure(_old_dispatcher(), bot, [old for old, _ in CLICKS], rounds)
+        after = await _measure(_new_dispatcher(), bot, [new for _, new in CLICKS], rounds)
+    finally:
+        await bot.session.close()
+    print(f"до (цепочки фильтров):   {before:7.1f} мкс/апдейт")
+    print(f"после (таблица префиксов): {after:7.1f} мкс/апдейт")
+    print(f"ускорение: x{before / after:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    asyncio.run(main(parser.parse_args().rounds))
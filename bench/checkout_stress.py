@@ -0,0 +1,127 @@
+"""
+Нагрузочная проверка checkout(): тысячи параллельных покупок одного товара
+из нескольких процессов и потоков на временной БД.
+
+Проверяет, что:
+  - продано ровно столько, сколько было на складе (не больше);
+  - ни один баланс не ушёл в минус;
+  - списанная сумма = число покупок * цена, записей в Purchase столько же.
+
+Запуск:  python -m bench.checkout_stress [--purchases 4000] [--stock 1000] [--processes 8] [--threads 8]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import db_pool
+
+PRICE = 10.0
+
+
+def _use_db(db_path: str, pool_size: int):
+    config.DB_PATH = db_path
+    db_pool.DB_PATH = db_path
+    db_pool.DB_POOL_SIZE = pool_size
+    db_pool.close_pool()
+
+
+def _prepare(db_path: str, stock: int, users: int, purchases_per_user: int) -> int:
+    from migrations import migrate
+
+    _use_db(db_path, 1)
+    with db_pool.transaction() as conn:
+        migrate(conn)
+        conn.execute(
+            "INSERT INTO Categories (safe_id, display_name) VALUES ('stress', 'Stress')"
+        )
+        cursor = conn.execute(
+            "INSERT INTO Products (category_id, type, name, description, price, photo_path, quantity) "
+            "VALUES ('stress', 'stress', 'Stress item', '', ?, NULL, ?)",
+            (PRICE, stock)
+        )
+        product_id = cursor.lastrowid
+        # Баланс хватает только на часть покупок, чтобы проверялась и ветка "нет денег"
+        conn.executemany(
+            "INSERT INTO Users (telegram_id, telegram_username, balance, language) VALUES (?, ?, ?, 'ru')",
+            [(1000 + i, f"user{i}", PRICE * purchases_per_user) for i in range(users)]
+        )
+    db_pool.close_pool()
+    return product_id
+
+
+def _worker(args) -> Counter:
+    db_path, product_id, user_ids, threads = args
+    import database
+
+    _use_db(db_path, threads)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = executor.map(lambda uid: database.checkout(uid, f"user{uid}", product_id)[0], user_ids)
+        counts = Counter(results)
+    db_pool.close_pool()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--purchases", type=int, default=4000)
+    parser.add_argument("--stock", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--per-user", type=int, default=4, help="на сколько покупок хватает баланса")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    import database
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "stress.sqlite3")
+        product_id = _prepare(db_path, args.stock, args.users, args.per_user)
+
+        attempts = [1000 + i % args.users for i in range(args.purchases)]
+        chunks = [(db_path, product_id, attempts[i::args.processes], args.threads) for i in range(args.processes)]
+
+        started = time.perf_counter()
+        with multiprocessing.get_context("fork").Pool(args.processes) as pool:
+            counts = sum(pool.map(_worker, chunks), Counter())
+        elapsed = time.perf_counter() - started
+
+        _use_db(db_path, 1)
+        with db_pool.connection() as conn:
+            quantity = conn.execute("SELECT quantity FROM Products WHERE id=?", (product_id,)).fetchone()[0]
+            purchases = conn.execute("SELECT COUNT(*) FROM Purchase WHERE product_id=?", (product_id,)).fetchone()[0]
+            min_balance, total_balance = conn.execute("SELECT MIN(balance), SUM(balance) FROM Users").fetchone()
+        db_pool.close_pool()
+
+    sold = counts[database.CHECKOUT_OK]
+    spent = PRICE * args.per_user * args.users - total_balance
+    print(f"Попыток: {args.purchases} за {elapsed:.2f} c ({args.purchases / elapsed:.0f}/c)")
+    print(f"Результаты: {dict(counts)}")
+    print(f"Остаток: {quantity}, записей Purchase: {purchases}, минимальный баланс: {min_balance}")
+
+    errors = []
+    if sold != purchases:
+        errors.append(f"успешных покупок {sold}, а записей Purchase {purchases}")
+    if sold + quantity != args.stock:
+        errors.append(f"продано {sold} + остаток {quantity} != склад {args.stock}")
+    if quantity < 0 or min_balance < 0:
+        errors.append("отрицательный остаток или баланс")
+    if abs(spent - sold * PRICE) > 1e-6:
+        errors.append(f"списано {spent}, ожидалось {sold * PRICE}")
+    if sold != min(args.stock, args.users * args.per_user, args.purchases):
+        errors.append(f"продано {sold}, ожидалось {min(args.stock, args.users * args.per_user, args.purchases)}")
+
+    if errors:
+        for error in errors:
+            print(f"ОШИБКА: {error}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Генератор большой синтетической БД для проверок на масштабе (bench/scale_check.py).
+
+Создаёт схему (migrations.py) и заполняет её пачками executemany в больших транзакциях:
+  - Categories — все категории utils/catalog_map.CATEGORY_MAP с logic_type;
+  - Products — по категориям с перекосом (Zipf: одни категории в разы больше других),
+    у категории десятки подкатегорий тоже разного размера, ~20% товаров с нулевым остатком;
+  - Users — последовательные telegram_id (как растут реальные), языки ru/en/ka, у части ненулевой баланс;
+  - Payments — активность пользователей с перекосом (Парето), статусы в основном confirmed,
+    хвост pending, уникальные screenshot_path, даты по возрастанию за два года;
+  - Purchase — популярность товаров по Zipf (в случайном порядке id), пользователи с перекосом.
+Одинаковый --seed даёт ту же БД.
+
+Запуск:  python -m bench.dataset --db /tmp/scale.sqlite3 [--users 1000000] [--products 200000]
+                                  [--payments 1000000] [--purchases 2000000] [--seed 1]
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import time
+
+FIRST_TELEGRAM_ID = 100_000_000
+SUBCATEGORIES_PER_CATEGORY = 40
+OUT_OF_STOCK_SHARE = 0.2
+PENDING_SHARE = 0.03
+REJECTED_SHARE = 0.07
+CHUNK = 50_000
+TWO_YEARS = 2 * 365 * 24 * 3600
+AMOUNTS = [30.0, 90.0, 180.0, 10.0, 25.0, 50.0, 75.0, 120.0, 250.0, 500.0]
+AMOUNT_WEIGHTS = [30, 30, 15, 4, 4, 5, 3, 4, 3, 2]
+
+# logic_type по категории (handlers/catalog.py: digital — покупка с баланса, physical — заказ,
+# appointment — заявка на услугу)
+LOGIC_TYPES = {
+    "keys": "digital", "subs": "digital", "webs": "appointment", "services": "appointment",
+    "otherserv": "appointment", "pcparts": "physical", "wlanparts": "physical", "electro": "physical",
+}
+
+
+def _zipf_cum_weights(n: int, s: float = 1.1) -> list[float]:
+    return list(itertools.accumulate(1.0 / (rank + 1) ** s for rank in range(n)))
+
+
+def _chunks(rows, size: int = CHUNK):
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _insert(conn: sqlite3.Connection, sql: str, rows) -> int:
+    """
+    Пачки по CHUNK строк одной транзакцией на таблицу.
+    """
+    total = 0
+    conn.execute("BEGIN")
+    for chunk in _chunks(rows):
+        conn.executemany(sql, chunk)
+        total += len(chunk)
+    conn.execute("COMMIT")
+    return total
+
+
+def _date(rng: random.Random, position: float, now: float) -> str:
+    # position 0..1 — доля истории: чем больше id, тем позже дата
+    ts = now - TWO_YEARS * (1 - position) + rng.uniform(0, 3600)
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(min(ts, now)))
+
+
+def _categories(conn: sqlite3.Connection) -> list[int]:
+    from utils.catalog_map import CATEGORY_MAP
+
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO Categories (safe_id, display_name, logic_type) VALUES (?, ?, ?)",
+        [(safe_id, name, LOGIC_TYPES.get(safe_id, "digital")) for safe_id, name in CATEGORY_MAP.items()],
+    )
+    conn.execute("COMMIT")
+    return [row[0] for row in conn.execute("SELECT id FROM Categories ORDER BY id")]
+
+
+def _products(rng: random.Random, category_ids: list[int], count: int):
+    categories = list(category_ids)
+    rng.shuffle(categories)  # самая большая категория — случайная, не первая
+    category_weights = _zipf_cum_weights(len(categories), 0.8)
+    subcategory_weights = _zipf_cum_weights(SUBCATEGORIES_PER_CATEGORY, 1.0)
+    subcategory_numbers = list(range(1, SUBCATEGORIES_PER_CATEGORY + 1))
+    picks = zip(
+        rng.choices(categories, cum_weights=category_weights, k=count),
+        rng.choices(subcategory_numbers, cum_weights=subcategory_weights, k=count),
+    )
+    for n, (category_id, subcategory) in enumerate(picks):
+        quantity = 0 if rng.random() < OUT_OF_STOCK_SHARE else rng.randint(1, 500)
+        price = round(rng.lognormvariate(3.5, 1.0), 2)
+        yield (
+            category_id, f"Sub {category_id}-{subcategory}", f"Товар {n}",
+            f"Описание товара {n}", price, f"data/products/{n % 1000}/{n}.jpg", quantity,
+        )
+
+
+def _users(rng: random.Random, count: int):
+    for n in range(count):
+        language = rng.choices(("ru", "en", "ka"), weights=(70, 25, 5))[0]
+        balance = round(rng.expovariate(1 / 50), 2) if rng.random() < 0.3 else 0.0
+        yield FIRST_TELEGRAM_ID + n, f"user{n}", balance, language
+
+
+def _skewed_users(rng: random.Random, users: int, k: int) -> list[int]:
+    # Парето: малая часть пользователей даёт большую часть платежей и покупок
+    order = list(range(users))
+    rng.shuffle(order)
+    picks = []
+    for _ in range(k):
+        rank = int(rng.paretovariate(1.2)) - 1
+        picks.append(FIRST_TELEGRAM_ID + order[rank % users])
+    return picks
+
+
+def _payments(rng: random.Random, users: int, count: int, now: float):
+    user_ids = _skewed_users(rng, users, count)
+    for n, user_id in enumerate(user_ids):
+        roll = rng.random()
+        if n >= count * (1 - PENDING_SHARE * 3) and roll < PENDING_SHARE * 3:
+            status = "pending"  # непроверенные — в основном свежие
+        elif roll < REJECTED_SHARE:
+            status = "rejected"
+        else:
+            status = "confirmed"
+        amount = rng.choices(AMOUNTS, weights=AMOUNT_WEIGHTS)[0]
+        currency = rng.choice(("Credo Bank (C2C)", "Tron (TRX)"))
+        screenshot = f"data/payments/{n % 256:02x}/{(n // 256) % 256:02x}/shot{n}.jpg"
+        yield user_id, amount, currency, status, screenshot, _date(rng, n / count, now)
+
+
+def _purchases(rng: random.Random, users: int, product_ids: list[int], count: int, now: float):
+    products = list(product_ids)
+    rng.shuffle(products)  # популярные товары разбросаны по id
+    picks = rng.choices(products, cum_weights=_zipf_cum_weights(len(products)), k=count)
+    user_ids = _skewed_users(rng, users, count)
+    for n, (user_id, product_id) in enumerate(zip(user_ids, picks)):
+        yield user_id, f"user{user_id - FIRST_TELEGRAM_ID}", product_id, _date(rng, n / count, now)
+
+
+def generate(db_path: str, users: int, products: int, payments: int, purchases: int, seed: int = 1) -> dict:
+    """
+    Создаёт новую БД db_path (файл не должен существовать) и возвращает число строк по таблицам.
+    """
+    import config
+    import db_pool
+    from migrations import migrate
+
+    if os.path.exists(db_path):
+        raise FileExistsError(f"{db_path} уже существует")
+    config.DB_PATH = db_path
+    db_pool.DB_PATH = db_path
+    db_pool.close_pool()
+    with db_pool.transaction() as conn:
+        migrate(conn)
+    db_pool.close_pool()
+
+    rng = random.Random(seed)
+    now = time.time()
+    counts = {}
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # Только на время заполнения: БД одноразовая, при сбое генерируется заново
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA cache_size=-262144")
+        category_ids = _categories(conn)
+        counts["Categories"] = len(category_ids)
+        counts["Products"] = _insert(
+            conn,
+            "INSERT INTO Products (category_id, type, name, description, price, photo_path, quantity) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            _products(rng, category_ids, products),
+        )
+        counts["Users"] = _insert(
+            conn,
+            "INSERT INTO Users (telegram_id, telegram_username, balance, language) VALUES (?, ?, ?, ?)",
+            _users(rng, users),
+        )
+        counts["Payments"] = _insert(
+            conn,
+            "INSERT INTO Payments (user_id, amount, currency, status, screenshot_path, date) VALUES (?, ?, ?, ?, ?, ?)",
+            _payments(rng, users, payments, now),
+        )
+        product_ids = [row[0] for row in conn.execute("SELECT id FROM Products")]
+        counts["Purchase"] = _insert(
+            conn,
+            "INSERT INTO Purchase (user_id, username, product_id, date) VALUES (?, ?, ?, ?)",
+            _purchases(rng, users, product_ids, purchases, now),
+        )
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    return counts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="путь к новой БД")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--products", type=int, default=200_000)
+    parser.add_argument("--payments", type=int, default=1_000_000)
+    parser.add_argument("--purchases", type=int, default=2_000_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = generate(args.db, args.users, args.products, args.payments, args.purchases, args.seed)
+    size_mb = os.path.getsize(args.db) / 1024 / 1024
+    print(", ".join(f"{table}: {count}" for table, count in counts.items()))
+    print(f"{args.db}: {size_mb:.0f} МБ за {time.perf_counter() - started:.1f} c")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
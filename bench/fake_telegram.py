@@ -0,0 +1,141 @@
+"""
+Локальный фейковый Bot API для проверок без настоящего Telegram.
+
+Принимает запросы aiogram вида POST /bot<token>/<method>, запоминает их (calls)
+и отвечает правдоподобными объектами. Бот направляется на него через
+TELEGRAM_API_SERVER = "http://127.0.0.1:<port>" или AiohttpSession(api=TelegramAPIServer.from_base(...)).
+
+Запуск отдельно:  python -m bench.fake_telegram [--port 8081]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency          # искусственная задержка ответа, сек.
+        self.calls: list[tuple[str, dict]] = []
+        self.updates: list[dict] = []   # отдаются через getUpdates
+        self._new_update = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+        self.url = None
+
+    def _message(self, params: dict, **extra) -> dict:
+        chat_id = int(params.get("chat_id", 0))
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        if "caption" in params:
+            message["caption"] = params["caption"]
+        message.update(extra)
+        return message
+
+    def _result(self, method: str, params: dict):
+        method = method.lower()
+        if method == "getme":
+            return BOT_USER
+        if method in ("sendmessage", "editmessagetext", "editmessagecaption", "editmessagereplymarkup"):
+            return self._message(params)
+        if method == "sendphoto":
+            photo = params.get("photo")
+            if not isinstance(photo, str) or photo.startswith("attach://"):
+                photo = f"fake-file-{next(self._file_ids)}"
+            sizes = [
+                {"file_id": f"{photo}-s", "file_unique_id": f"{photo}-us", "width": 90, "height": 90},
+                {"file_id": photo, "file_unique_id": f"u-{photo}", "width": 1280, "height": 1280},
+            ]
+            return self._message(params, photo=sizes)
+        if method == "getupdates":
+            # Как у Telegram: offset подтверждает всё, что раньше него
+            offset = int(params.get("offset") or 0)
+            self.updates = [update for update in self.updates if update["update_id"] >= offset]
+            return self.updates[:int(params.get("limit") or 100)]
+        if method == "getfile":
+            return {"file_id": params.get("file_id"), "file_unique_id": "u", "file_path": "photos/fake.jpg"}
+        # answerCallbackQuery, setWebhook, deleteWebhook, deleteMessage, ...
+        return True
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = {}
+            for key, value in (await request.post()).items():
+                if isinstance(value, str):
+                    try:
+                        value = json.loads(value)
+                    except ValueError:
+                        pass
+                    params[key] = value
+                else:
+                    params[key] = f"attach://{key}"
+        self.calls.append((method, params))
+        if method.lower() == "getupdates" and params.get("timeout"):
+            # Long polling: ждём новый апдейт, но не дольше timeout
+            offset = int(params.get("offset") or 0)
+            if not any(update["update_id"] >= offset for update in self.updates):
+                self._new_update.clear()
+                try:
+                    await asyncio.wait_for(self._new_update.wait(), timeout=float(params["timeout"]))
+                except asyncio.TimeoutError:
+                    pass
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    async def _file(self, request: web.Request) -> web.Response:
+        return web.Response(body=b"\xff\xd8fake-jpeg\xff\xd9", content_type="image/jpeg")
+
+    def add_update(self, update: dict):
+        self.updates.append(update)
+        self._new_update.set()
+
+    def methods(self) -> list[str]:
+        return [method for method, _ in self.calls]
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        app.router.add_get("/file/bot{token}/{path:.*}", self._file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _serve(port: int):
+    fake = FakeTelegram()
+    print(f"Fake Bot API: {await fake.start(port=port)}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8081)
+    asyncio.run(_serve(parser.parse_args().port))
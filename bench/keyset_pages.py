@@ -0,0 +1,87 @@
+"""
+Листание каталога по БД (keyset) — эталон для bench/scale_check. Бот листает снимок каталога
+в памяти (utils/catalog_cache.py) и в БД за страницами не ходит; здесь те же страницы запросами:
+строки после/перед курсором по индексу, а не OFFSET, — цена страницы не зависит от её номера.
+Товары — по id в idx_products_in_stock (category_id, type, id), подкатегории — по имени
+в UNIQUE (category_id, name) таблицы Subcategories, курсор — id подкатегории.
+PLAN_QUERIES — их планы для migrations.check_query_plans, в формате database.HOT_QUERIES.
+"""
+from config import CATALOG_PAGE_SIZE
+from db_pool import connection
+
+SQL_PRODUCTS_PAGE = """
+    SELECT p.id, p.name, p.price, p.quantity
+    FROM Products p
+    JOIN Categories c ON p.category_id = c.id
+    WHERE c.safe_id = ? AND p.type = ? AND p.quantity > 0 AND p.id > ?
+    ORDER BY p.id
+    LIMIT ?
+"""
+
+SQL_PRODUCTS_PAGE_BACK = """
+    SELECT p.id, p.name, p.price, p.quantity
+    FROM Products p
+    JOIN Categories c ON p.category_id = c.id
+    WHERE c.safe_id = ? AND p.type = ? AND p.quantity > 0 AND p.id < ?
+    ORDER BY p.id DESC
+    LIMIT ?
+"""
+
+SQL_SUBCATEGORIES_PAGE = """
+    SELECT s.id, s.name
+    FROM Subcategories s
+    JOIN Categories c ON s.category_id = c.id
+    WHERE c.safe_id = ? AND s.name > COALESCE((SELECT name FROM Subcategories WHERE id = ?), '') AND EXISTS (
+        SELECT 1 FROM Products p WHERE p.category_id = s.category_id AND p.type = s.name AND p.quantity > 0
+    )
+    ORDER BY s.name
+    LIMIT ?
+"""
+
+SQL_SUBCATEGORIES_PAGE_BACK = """
+    SELECT s.id, s.name
+    FROM Subcategories s
+    JOIN Categories c ON s.category_id = c.id
+    WHERE c.safe_id = ? AND s.name < (SELECT name FROM Subcategories WHERE id = ?) AND EXISTS (
+        SELECT 1 FROM Products p WHERE p.category_id = s.category_id AND p.type = s.name AND p.quantity > 0
+    )
+    ORDER BY s.name DESC
+    LIMIT ?
+"""
+
+PLAN_QUERIES = [
+    ("get_products_page", SQL_PRODUCTS_PAGE, ("keys", "Bronze", 0, 10), "idx_products_in_stock"),
+    ("get_products_page_back", SQL_PRODUCTS_PAGE_BACK, ("keys", "Bronze", 100, 10), "idx_products_in_stock"),
+    ("get_subcategories_page", SQL_SUBCATEGORIES_PAGE, ("keys", 0, 10), "sqlite_autoindex_Subcategories_1"),
+    ("get_subcategories_page_back", SQL_SUBCATEGORIES_PAGE_BACK, ("keys", 1, 10), "sqlite_autoindex_Subcategories_1"),
+]
+
+
+def get_products_page(category_safe_id: str, subcat: str, cursor: int = 0, back: bool = False,
+                      limit: int = CATALOG_PAGE_SIZE) -> list[tuple]:
+    """
+    Страница товаров подкатегории по id: limit товаров с id больше cursor (0 — первая страница)
+    или (back=True) меньше него. Строки всегда по возрастанию id.
+    """
+    with connection() as conn:
+        if back:
+            rows = conn.execute(SQL_PRODUCTS_PAGE_BACK, (category_safe_id, subcat, cursor, limit)).fetchall()
+            rows.reverse()
+        else:
+            rows = conn.execute(SQL_PRODUCTS_PAGE, (category_safe_id, subcat, cursor, limit)).fetchall()
+    return rows
+
+
+def get_subcategories_page(category_safe_id: str, cursor: int = 0, back: bool = False,
+                           limit: int = CATALOG_PAGE_SIZE) -> list[tuple]:
+    """
+    Страница подкатегорий с товарами в наличии, по алфавиту: [(id, name)] после подкатегории
+    с id cursor (0 — первая страница) или (back=True) перед ней.
+    """
+    with connection() as conn:
+        if back:
+            rows = conn.execute(SQL_SUBCATEGORIES_PAGE_BACK, (category_safe_id, cursor, limit)).fetchall()
+            rows.reverse()
+        else:
+            rows = conn.execute(SQL_SUBCATEGORIES_PAGE, (category_safe_id, cursor, limit)).fetchall()
+    return rows
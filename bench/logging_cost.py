@@ -0,0 +1,56 @@
+"""
+Цена логирования в вызывающем потоке (на event loop) для строк с горячего пути:
+  - "до": logging.basicConfig + StreamHandler, f-строка на уровне INFO (как было);
+  - "после": utils/log_setup.py — очередь + фоновый поток, %-формат;
+    запись отключена уровнем (DEBUG при LOG_LEVEL=INFO), включена и включена с выборкой.
+Вывод идёт в /dev/null, меряется только время вызова logger.*().
+
+Запуск:  python -m bench.logging_cost [--rounds 20000] [--json]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+from utils import log_setup
+
+ROWS = [(i, f"Товар {i}", 10.0 + i, 5) for i in range(12)]
+
+
+def _per_call(fn, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def main(rounds: int, fmt: str):
+    devnull = open(os.devnull, "w")
+    stderr, sys.stderr = sys.stderr, devnull
+    logger = logging.getLogger("bench.logging")
+    try:
+        logging.basicConfig(level=logging.INFO, stream=devnull, force=True)
+        before = _per_call(lambda: logging.info(f"get_products(safe_id={'keys'}, subcat={'Steam'}) => {ROWS}"), rounds)
+
+        log_setup.setup_logging(level="INFO", fmt=fmt, log_file=None)
+        disabled = _per_call(lambda: logger.debug("get_products(safe_id=%s, subcat=%s) => %s", "keys", "Steam", ROWS), rounds)
+        enabled = _per_call(lambda: logger.info("get_products(safe_id=%s, subcat=%s) => %s", "keys", "Steam", ROWS), rounds)
+
+        log_setup.setup_logging(level="DEBUG", fmt=fmt, log_file=None)
+        sampled = _per_call(lambda: logger.debug("get_products(safe_id=%s, subcat=%s) => %s", "keys", "Steam", ROWS), rounds)
+        log_setup.stop_logging()
+    finally:
+        sys.stderr = stderr
+    print(f"до: basicConfig, f-строка INFO:        {before:7.2f} мкс/вызов")
+    print(f"после: DEBUG отключён уровнем:         {disabled:7.2f} мкс/вызов")
+    print(f"после: INFO через очередь ({fmt}):     {enabled:7.2f} мкс/вызов")
+    print(f"после: DEBUG включён, с выборкой:      {sampled:7.2f} мкс/вызов")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20000)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    main(args.rounds, "json" if args.json else "text")
@@ -0,0 +1,122 @@
+"""
+Цена метрик (utils/metrics.py) на горячем пути и проверка /metrics:
+  - middleware метрик на один апдейт: внешний (dp.update) и внутренний (хэндлер) вокруг пустого
+    хэндлера — разница при прогоне через весь Dispatcher.feed_update меньше разброса замеров;
+  - кнопки из bench.callback_dispatch через диспетчер с метриками (хэндлеры пустые) —
+    чтобы в /metrics были хэндлеры;
+  - run_db с пустой функцией: голый run_in_executor и run_db с записью времени;
+  - сколько стоит один запрос /metrics (сборка текста) и что ответ — корректный текст Prometheus.
+
+Запуск:  python -m bench.metrics_cost [--rounds 2000]
+"""
+import argparse
+import asyncio
+import logging
+import re
+import socket
+import sys
+import time
+
+import aiohttp
+from aiogram import Bot
+
+from bench.callback_dispatch import CLICKS, _measure, _new_dispatcher, _noop, _update
+from utils.callback_table import _Route
+from utils.metrics import (
+    CONTENT_TYPE, HandlerMetricsMiddleware, UpdateMetricsMiddleware, instrument_dispatcher, start_metrics_server,
+)
+
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]+="(\\.|[^"\\])*",?)*\})? [-+0-9.eInf]+$')
+
+
+def _nothing():
+    return None
+
+
+async def _handler(event, data):
+    return None
+
+
+async def _per_call(fn, rounds: int) -> float:
+    for _ in range(100):
+        await fn()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await fn()
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def main(rounds: int) -> int:
+    import repository
+
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    errors = []
+    clicks = [new for _, new in CLICKS]
+    update = _update(1, clicks[1])
+    data = {"callback_route": _Route(_noop, None)}
+    outer, inner = UpdateMetricsMiddleware(), HandlerMetricsMiddleware("callback_query")
+    plain = min([await _per_call(lambda: _handler(update, data), rounds * 10) for _ in range(3)])
+    with_outer = min([await _per_call(lambda: outer(_handler, update, data), rounds * 10) for _ in range(3)])
+    with_inner = min([await _per_call(lambda: inner(_handler, update, data), rounds * 10) for _ in range(3)])
+
+    bot = Bot("42:BENCH")
+    try:
+        dp = _new_dispatcher()
+        instrument_dispatcher(dp)
+        dispatched = await _measure(dp, bot, clicks, rounds)
+    finally:
+        await bot.session.close()
+
+    loop = asyncio.get_running_loop()
+    executor = repository._get_executor()
+    raw_db = min([await _per_call(lambda: loop.run_in_executor(executor, _nothing), rounds) for _ in range(3)])
+    timed_db = min([await _per_call(lambda: repository.run_db(_nothing), rounds) for _ in range(3)])
+    repository.shutdown_db()
+
+    port = _free_port()
+    runner = await start_metrics_server(port=port)
+    if runner is None:
+        return 1
+    try:
+        async with aiohttp.ClientSession() as session:
+            started = time.perf_counter()
+            async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                text = await response.text()
+                content_type = response.headers.get("Content-Type")
+            scrape = (time.perf_counter() - started) * 1e3
+    finally:
+        await runner.cleanup()
+
+    if content_type != CONTENT_TYPE:
+        errors.append(f"Content-Type: {content_type}")
+    samples = [line for line in text.splitlines() if line and not line.startswith("#")]
+    bad = [line for line in samples if not SAMPLE.match(line)]
+    if bad:
+        errors.append(f"строки не в формате Prometheus: {bad[:3]}")
+    # Хэндлеры в таблице бенчмарка — пустые _noop, имя берётся из маршрута таблицы
+    for needle in ('event="callback_query",handler="bench.callback_dispatch._noop"', 'query="_nothing"', "bot_updates_in_flight 0"):
+        if needle not in text:
+            errors.append(f"в /metrics нет {needle}")
+
+    print(f"middleware на апдейт:       +{with_outer - plain:.2f} мкс внешний, +{with_inner - plain:.2f} мкс хэндлер")
+    print(f"апдейт через диспетчер:     {dispatched:7.1f} мкс (с метриками)")
+    print(f"run_in_executor без метрик: {raw_db:7.1f} мкс")
+    print(f"run_db с метриками:         {timed_db:7.1f} мкс (+{timed_db - raw_db:.1f})")
+    print(f"/metrics: {len(samples)} строк, {scrape:.1f} мс на запрос")
+    for error in errors:
+        print(f"ОШИБКА: {error}")
+    if not errors:
+        print("OK")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    sys.exit(asyncio.run(main(parser.parse_args().rounds)))
@@ -0,0 +1,115 @@
+"""
+Проверка доставки utils/outbox.py при миграции группы в супергруппу (TelegramMigrateToChat):
+в старый чат стоят в очереди два сообщения — одно записано в БД до запуска (как после перезапуска
+или из рабочего процесса), второе поставлено через send_message(). Первая отправка получает
+migrate_to_chat_id; оба сообщения должны уйти в новый чат по порядку, таблица Outbox — опустеть,
+а сообщение в соседний чат — не пострадать.
+
+Запуск:  python -m bench.outbox_check [--timeout 10]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from aiogram.exceptions import TelegramMigrateToChat
+from aiogram.methods import SendMessage
+
+import config
+import db_pool
+
+OLD_CHAT_ID = -100
+NEW_CHAT_ID = -1001234567890
+OTHER_CHAT_ID = 42
+
+
+class _MigratingBot:
+    """
+    Вместо Bot: в OLD_CHAT_ID отвечает ошибкой миграции, остальное запоминает.
+    """
+
+    def __init__(self):
+        self.sent: list[tuple[int, str]] = []
+        self.migrate_errors = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        if chat_id == OLD_CHAT_ID:
+            self.migrate_errors += 1
+            raise TelegramMigrateToChat(
+                method=SendMessage(chat_id=chat_id, text=text),
+                message="Bad Request: group chat was upgraded to a supergroup chat",
+                migrate_to_chat_id=NEW_CHAT_ID,
+            )
+        self.sent.append((chat_id, text))
+
+
+async def check(timeout: float) -> list[str]:
+    import database
+    from repository import run_db, shutdown_db
+    from utils.outbox import Outbox
+
+    errors = []
+    # Записано до запуска (прошлый процесс) — подхватывается из БД в start()
+    await run_db(database.outbox_add, OLD_CHAT_ID, "send_message", '{"text": "первое"}', time.time())
+    outbox = Outbox()
+    bot = _MigratingBot()
+    await outbox.start(bot)
+    try:
+        await outbox.send_message(OLD_CHAT_ID, "второе")
+        await outbox.send_message(OTHER_CHAT_ID, "соседний чат")
+        deadline = time.monotonic() + timeout
+        while outbox.metrics["sent"] < 3 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        stats = outbox.stats()
+    finally:
+        await outbox.stop()
+    left = await run_db(database.outbox_load, 0)
+    shutdown_db()
+
+    delivered = [text for chat_id, text in bot.sent if chat_id == NEW_CHAT_ID]
+    if delivered != ["первое", "второе"]:
+        errors.append(f"в новый чат доставлено {delivered}, ожидалось ['первое', 'второе']")
+    if (OTHER_CHAT_ID, "соседний чат") not in bot.sent:
+        errors.append("сообщение в соседний чат не доставлено")
+    if any(chat_id == OLD_CHAT_ID for chat_id, _ in bot.sent):
+        errors.append("что-то ушло в старый чат")
+    if left:
+        errors.append(f"в Outbox остались строки: {left}")
+    if stats["in_flight"]:
+        errors.append(f"чаты остались в отправке: in_flight={stats['in_flight']}")
+    print(f"ошибок миграции: {bot.migrate_errors}, доставлено: {bot.sent}, статистика: {stats}")
+    return errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="outbox_check_")
+    try:
+        db_path = os.path.join(tmp, "bot.sqlite3")
+        config.DB_PATH = db_path
+        db_pool.DB_PATH = db_path
+        db_pool.close_pool()
+        from migrations import migrate
+
+        with db_pool.transaction() as conn:
+            migrate(conn)
+        errors = asyncio.run(check(args.timeout))
+    finally:
+        db_pool.close_pool()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for error in errors:
+        print(f"ОШИБКА: {error}")
+    if not errors:
+        print("OK")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+Горячие запросы database.py на большой БД (bench/dataset.py): каждая функция вызывается
+--rounds раз со случайными, но реальными параметрами (частые категории чаще, как у живых
+пользователей), p50/p95/max сравниваются с бюджетом. Код возврата 1 — какой-то запрос
+вышел за бюджет p95; заодно проверяются планы запросов (migrations.check_query_plans,
+в том числе запросов bench/keyset_pages.py).
+
+Запуск:  python -m bench.scale_check [--db /tmp/scale.sqlite3] [--rounds 200]
+Без --db БД генерируется во временный каталог с размерами bench/dataset.py по умолчанию
+(миллион пользователей, 200 тыс. товаров, ~1 мин); --users/--products/... меняют их.
+checkout и get_or_create_user пишут в БД — для --db лучше давать копию.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import config
+import db_pool
+
+# Бюджет p95, мс. Запросы на каждый апдейт — единицы миллисекунд; load_catalog вызывается
+# только после изменения каталога (utils/catalog_cache.py), ему можно больше.
+BUDGETS_MS = {
+    "get_user_by_telegram_id": 1.0,
+    "get_or_create_user": 5.0,
+    "get_unique_categories": 5.0,
+    "get_unique_subcategories": 5.0,
+    # Списки каталога — постранично (keyset). Хэндлеры листают снимок в памяти (snapshot_*),
+    # get_*_page — то же листание по БД (bench/keyset_pages.py), эталон. Страница в конце
+    # большой подкатегории должна стоить как первая.
+    "get_subcategories_page": 1.0,
+    "get_products_page": 1.0,
+    "get_products_page_deep": 1.0,
+    "get_products_page_back": 1.0,
+    "snapshot_products_page_deep": 0.1,
+    "get_product_card": 1.0,
+    # Поиск (FTS5) — на сообщение пользователя, не на каждый апдейт. В синтетических названиях
+    # «Товар N» слово «товар» есть у каждого товара: bm25 читает его список документов целиком —
+    # худший случай; редкое слово (номер) — единицы мс, общий префикс «тов» — без ранжирования
+    "search_rare": 10.0,
+    "search_name": 150.0,
+    "search_broad": 50.0,
+    "get_about_stats": 10.0,
+    "load_catalog": 1500.0,
+    "find_payment_by_screenshot": 1.0,
+    "find_pending_payment": 1.0,
+    "list_pending_payments": 2.0,
+    "count_pending_payments": 5.0,
+    "checkout": 5.0,
+}
+SLOW_ROUNDS = {"load_catalog": 5}
+
+
+def _use_db(db_path: str):
+    config.DB_PATH = db_path
+    db_pool.DB_PATH = db_path
+    db_pool.close_pool()
+
+
+def _samples(rng: random.Random) -> dict:
+    """
+    Параметры из самой БД: пользователи, пары (категория, подкатегория) с весом по числу товаров,
+    самая большая подкатегория, товары, скриншоты и pending-платежи.
+    """
+    with db_pool.connection() as conn:
+        users = [row[0] for row in conn.execute("SELECT telegram_id FROM Users ORDER BY random() LIMIT 2000")]
+        pairs = conn.execute("""
+            SELECT c.safe_id, p.type, COUNT(*) FROM Products p JOIN Categories c ON p.category_id = c.id
+            WHERE p.quantity > 0 GROUP BY p.category_id, p.type
+        """).fetchall()
+        products = [row[0] for row in conn.execute("SELECT id FROM Products WHERE quantity > 0 ORDER BY random() LIMIT 2000")]
+        names = [row[0] for row in conn.execute("SELECT name FROM Products WHERE quantity > 0 ORDER BY random() LIMIT 2000")]
+        screenshots = [row[0] for row in conn.execute("SELECT screenshot_path FROM Payments ORDER BY random() LIMIT 2000")]
+        pending = conn.execute(
+            "SELECT user_id, amount FROM Payments WHERE status = 'pending' ORDER BY random() LIMIT 2000"
+        ).fetchall()
+    largest = max(pairs, key=lambda pair: pair[2])
+    with db_pool.connection() as conn:
+        # Курсор последней страницы самой большой подкатегории
+        largest_tail = conn.execute("""
+            SELECT p.id FROM Products p JOIN Categories c ON p.category_id = c.id
+            WHERE c.safe_id = ? AND p.type = ? AND p.quantity > 0
+            ORDER BY p.id DESC LIMIT 1 OFFSET ?
+        """, (largest[0], largest[1], config.CATALOG_PAGE_SIZE)).fetchone()[0]
+    return {
+        "users": users,
+        "pairs": [(safe_id, subcat) for safe_id, subcat, _ in pairs],
+        "pair_weights": [count for _, _, count in pairs],
+        "largest": largest[:2],
+        "largest_size": largest[2],
+        "largest_tail": largest_tail,
+        "products": products,
+        "names": names,
+        "screenshots": screenshots,
+        "pending": pending or [(0, 0.0)],
+    }
+
+
+def _calls(rng: random.Random, samples: dict) -> dict:
+    import database
+    from bench import keyset_pages
+    from utils.catalog_cache import CatalogSnapshot
+    from utils.search import match_expression
+
+    snapshot = CatalogSnapshot(*database.load_catalog())
+
+    def pair():
+        return rng.choices(samples["pairs"], weights=samples["pair_weights"])[0]
+
+    def find_pending_payment():
+        user_id, amount = rng.choice(samples["pending"])
+        with db_pool.connection() as conn:
+            return conn.execute(database.SQL_FIND_PENDING_PAYMENT, (user_id, amount)).fetchone()
+
+    user = lambda: rng.choice(samples["users"])  # noqa: E731
+    return {
+        "get_user_by_telegram_id": lambda: database.get_user_by_telegram_id(user()),
+        "get_or_create_user": lambda: database.get_or_create_user(user(), "scale", "ru"),
+        "get_unique_categories": database.get_unique_categories,
+        "get_unique_subcategories": lambda: database.get_unique_subcategories(pair()[0]),
+        "get_subcategories_page": lambda: keyset_pages.get_subcategories_page(pair()[0]),
+        "get_products_page": lambda: keyset_pages.get_products_page(*pair()),
+        # Страницы в конце самой большой подкатегории: keyset не читает предыдущие строки
+        "get_products_page_deep": lambda: keyset_pages.get_products_page(*samples["largest"], samples["largest_tail"]),
+        "get_products_page_back": lambda: keyset_pages.get_products_page(
+            *samples["largest"], samples["largest_tail"], back=True
+        ),
+        "snapshot_products_page_deep": lambda: snapshot.products_page(*samples["largest"], samples["largest_tail"]),
+        "get_product_card": lambda: database.get_product_card(rng.choice(samples["products"])),
+        "search_rare": lambda: database.search_products(match_expression(rng.choice(samples["names"]).split()[-1]), 11),
+        "search_name": lambda: database.search_products(match_expression(rng.choice(samples["names"])), 11),
+        "search_broad": lambda: database.search_products(match_expression("тов"), 11, rng.choice([0, 10, 50])),
+        "get_about_stats": database.get_about_stats,
+        "load_catalog": database.load_catalog,
+        "find_payment_by_screenshot": lambda: database.find_payment_by_screenshot(rng.choice(samples["screenshots"])),
+        "find_pending_payment": find_pending_payment,
+        "list_pending_payments": lambda: database.list_pending_payments(0, 20),
+        "count_pending_payments": database.count_pending_payments,
+        "checkout": lambda: database.checkout(user(), "scale", rng.choice(samples["products"])),
+    }
+
+
+def _measure(fn, rounds: int) -> list[float]:
+    fn()  # прогрев: страницы индекса в кэше, как у работающего бота
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1e3)
+    return sorted(timings)
+
+
+def check(db_path: str, rounds: int, seed: int) -> list[str]:
+    from bench.keyset_pages import PLAN_QUERIES
+    from migrations import check_query_plans
+
+    _use_db(db_path)
+    rng = random.Random(seed)
+    samples = _samples(rng)
+    with db_pool.connection() as conn:
+        problems = [
+            f"план запроса: {problem}"
+            for problem in check_query_plans(conn) + check_query_plans(conn, PLAN_QUERIES)
+        ]
+        counts = {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("Users", "Products", "Payments", "Purchase")
+        }
+    print(", ".join(f"{table}: {count}" for table, count in counts.items()))
+    print(f"самая большая подкатегория: {samples['largest_size']} товаров в наличии")
+    print(f"{'запрос':28} {'p50':>9} {'p95':>9} {'max':>9} {'бюджет':>9}  мс")
+    for name, fn in _calls(rng, samples).items():
+        timings = _measure(fn, SLOW_ROUNDS.get(name, rounds))
+        p50 = timings[len(timings) // 2]
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        budget = BUDGETS_MS[name]
+        mark = "" if p95 <= budget else "  <-- превышен"
+        print(f"{name:28} {p50:9.3f} {p95:9.3f} {timings[-1]:9.3f} {budget:9.1f}{mark}")
+        if p95 > budget:
+            problems.append(f"{name}: p95 {p95:.2f} мс > {budget} мс")
+    db_pool.close_pool()
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="готовая БД из bench.dataset; без него — сгенерировать временную")
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--products", type=int, default=200_000)
+    parser.add_argument("--payments", type=int, default=1_000_000)
+    parser.add_argument("--purchases", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    tmp = None
+    db_path = args.db
+    if db_path is None:
+        from bench.dataset import generate
+
+        tmp = tempfile.mkdtemp(prefix="scale_check_")
+        db_path = os.path.join(tmp, "scale.sqlite3")
+        started = time.perf_counter()
+        generate(db_path, args.users, args.products, args.payments, args.purchases, args.seed)
+        print(f"БД сгенерирована за {time.perf_counter() - started:.1f} c")
+    elif not os.path.exists(db_path):
+        print(f"{db_path} не найдена — создайте её: python -m bench.dataset --db {db_path}")
+        return 2
+    try:
+        problems = check(db_path, args.rounds, args.seed)
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    for problem in problems:
+        print(f"ОШИБКА: {problem}")
+    if not problems:
+        print("OK")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Листание результатов поиска (utils/search.py, database.search_products) на временной БД,
+где совпадений больше SEARCH_RANK_LIMIT: все страницы общего запроса подряд — каждый товар
+в наличии ровно один раз, без повторов и пропусков, в том числе на стыке страниц, взятых
+из кандидатов, и страниц через SQL_SEARCH_BY_ID. То же для ранжированного запроса
+(совпадений меньше лимита). Товары не в наличии в выдачу не попадают.
+
+Запуск:  python -m bench.search_check [--products 2500]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+import config
+import db_pool
+
+
+def _fill(conn, products: int):
+    conn.execute("INSERT INTO Categories (safe_id, display_name) VALUES ('kb', 'Клавиатуры')")
+    conn.executemany(
+        """
+        INSERT INTO Products (category_id, type, name, description, price, photo_path, quantity)
+        VALUES ((SELECT id FROM Categories WHERE safe_id = 'kb'), ?, ?, ?, 100.0, '', ?)
+        """,
+        [
+            (
+                "Механические" if i % 7 == 0 else "Мембранные",
+                f"Клавиатура {i}",
+                "Тихая" if i % 7 == 0 else "Обычная",
+                0 if i % 11 == 0 else 5,
+            )
+            for i in range(1, products + 1)
+        ],
+    )
+
+
+async def _walk(text: str) -> tuple[list[int], int, set[bool]]:
+    from utils.search import search
+
+    ids, page, ranked = [], 0, set()
+    while True:
+        _, rows, has_next, page_ranked = await search(text, page)
+        ids.extend(row[0] for row in rows)
+        ranked.add(page_ranked)
+        if not has_next:
+            return ids, page + 1, ranked
+        page += 1
+
+
+def _compare(label: str, ids: list[int], expected: set[int]) -> list[str]:
+    errors = []
+    repeated = len(ids) - len(set(ids))
+    if repeated:
+        errors.append(f"{label}: повторов на страницах: {repeated}")
+    missing = expected - set(ids)
+    if missing:
+        errors.append(f"{label}: пропущено {len(missing)} товаров, например {sorted(missing)[:5]}")
+    extra = set(ids) - expected
+    if extra:
+        errors.append(f"{label}: лишние товары {sorted(extra)[:5]}")
+    return errors
+
+
+async def check() -> list[str]:
+    from repository import shutdown_db
+
+    with db_pool.connection() as conn:
+        in_stock = {row[0] for row in conn.execute("SELECT id FROM Products WHERE quantity > 0")}
+        quiet = {row[0] for row in conn.execute(
+            "SELECT id FROM Products WHERE quantity > 0 AND description = 'Тихая'"
+        )}
+    errors = []
+    try:
+        for label, text, expected, want_ranked in (
+            ("общий запрос", "клав", in_stock, False),
+            ("ранжированный запрос", "тихая", quiet, True),
+        ):
+            ids, pages, ranked = await _walk(text)
+            print(f"{label} «{text}»: {pages} страниц, {len(ids)} товаров (ожидалось {len(expected)})")
+            if ranked != {want_ranked}:
+                errors.append(f"{label}: ранжирование {ranked}, ожидалось {want_ranked}")
+            errors += _compare(label, ids, expected)
+    finally:
+        shutdown_db()
+    return errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=2500)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="search_check_")
+    try:
+        db_path = os.path.join(tmp, "bot.sqlite3")
+        config.DB_PATH = db_path
+        db_pool.DB_PATH = db_path
+        db_pool.close_pool()
+        from migrations import migrate
+
+        with db_pool.transaction() as conn:
+            migrate(conn)
+            _fill(conn, args.products)
+        with db_pool.connection() as conn:
+            matches = conn.execute(
+                "SELECT count(*) FROM ProductSearch WHERE ProductSearch MATCH '\"клав\"*'"
+            ).fetchone()[0]
+        errors = []
+        if matches <= config.SEARCH_RANK_LIMIT:
+            errors.append(f"совпадений {matches} — не больше SEARCH_RANK_LIMIT, увеличьте --products")
+        else:
+            errors = asyncio.run(check())
+    finally:
+        db_pool.close_pool()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for error in errors:
+        print(f"ОШИБКА: {error}")
+    if not errors:
+        print("OK")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""
+Проверка многопроцессного режима (supervisor.py) на фейковом Bot API и временной БД:
+  - апдейты от разных пользователей расходятся по рабочим процессам, каждый получает ответ;
+  - убитый рабочий процесс перезапускается, его апдейты не теряются — и те, что он ещё
+    не получил, и те, что были у него в обработке (пачка подтверждается после обработки);
+  - повтор не выполняет уже обработанное (ProcessedUpdates), а прерванная покупка
+    не списывает баланс второй раз (database.checkout по id нажатия);
+  - /health (Supervisor.health) видит все процессы живыми;
+  - метрики (Supervisor.render_metrics) содержат хэндлеры каждого рабочего процесса.
+
+Запуск:  python -m bench.supervisor_smoke [--workers 2] [--users 20]
+"""
+import argparse
+import asyncio
+import functools
+import os
+import sys
+import tempfile
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+import supervisor
+from bench.fake_telegram import FakeTelegram
+
+SMOKE_PRICE = 10.0
+SMOKE_BALANCE = 100.0  # хватит на несколько покупок — второе списание при повторе было бы видно
+
+
+def _smoke_worker(api_url: str, db_path: str, index: int, count: int, conn):
+    # Рабочий процесс запускается через spawn и читает config.py заново — направляем его
+    # на временную БД и фейковый API здесь же
+    import config
+    import db_pool
+    import bot as bot_app
+
+    config.DB_PATH = db_path
+    db_pool.DB_PATH = db_path
+    bot_app.TELEGRAM_API_SERVER = api_url
+    bot_app.IMAGE_OPTIMIZER_ENABLED = False
+    bot_app.load_admin = lambda: True
+    supervisor._worker_main(index, count, conn)
+
+
+def _message(update_id: int, user_id: int, text: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"u{user_id}", "language_code": "ru"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": user_id, "type": "private"}, "from": user,
+        },
+    }
+
+
+async def _wait_for(predicate, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        await asyncio.sleep(0.1)
+    return predicate()
+
+
+def _confirm_purchase(update_id: int, user_id: int, product_id: int) -> dict:
+    from keyboards.callbacks import ConfirmPurchase
+
+    user = {"id": user_id, "is_bot": False, "first_name": f"u{user_id}", "language_code": "ru"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": str(user_id),
+            "data": ConfirmPurchase(product_id=product_id).pack(),
+            "message": {
+                "message_id": update_id, "date": int(time.time()), "text": "…",
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "FakeBot"},
+            },
+        },
+    }
+
+
+def _seed_purchase(user_ids: list[int]) -> int:
+    """
+    Товар с запасом и баланс SMOKE_BALANCE у каждого из user_ids; возвращает id товара.
+    """
+    from db_pool import transaction
+
+    with transaction() as conn:
+        conn.execute("INSERT INTO Categories (safe_id, display_name) VALUES ('smoke', 'Smoke')")
+        product_id = conn.execute("""
+            INSERT INTO Products (category_id, type, name, description, price, photo_path, quantity)
+            VALUES ((SELECT id FROM Categories WHERE safe_id = 'smoke'), 'Smoke', 'Smoke', '', ?, '', 1000)
+            RETURNING id
+        """, (SMOKE_PRICE,)).fetchone()[0]
+        conn.executemany(
+            "UPDATE Users SET balance = ? WHERE telegram_id = ?", [(SMOKE_BALANCE, u) for u in user_ids]
+        )
+    return product_id
+
+
+def _purchases(user_ids: list[int]) -> dict[int, tuple[int, float]]:
+    from db_pool import connection
+
+    with connection() as conn:
+        return {
+            u: conn.execute(
+                "SELECT (SELECT COUNT(*) FROM Purchase WHERE user_id = ?), balance FROM Users WHERE telegram_id = ?",
+                (u, u),
+            ).fetchone()
+            for u in user_ids
+        }
+
+
+def _answered(fake: FakeTelegram) -> dict[int, int]:
+    counts: dict[int, int] = {}
+    for method, params in fake.calls:
+        if method.lower().startswith("send"):
+            chat_id = int(params.get("chat_id", 0))
+            counts[chat_id] = counts.get(chat_id, 0) + 1
+    return counts
+
+
+async def main(workers: int, users: int) -> int:
+    import config
+    import database
+    import db_pool
+    from repository import init_db, shutdown_db
+
+    tmp = tempfile.mkdtemp(prefix="supervisor_smoke_")
+    db_path = os.path.join(tmp, "bot.sqlite3")
+    config.DB_PATH = db_path
+    db_pool.DB_PATH = db_path
+    await init_db()
+
+    fake = FakeTelegram()
+    api_url = await fake.start()
+    bot = Bot("42:SMOKE", session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+
+    sup = supervisor.Supervisor(workers, worker_target=functools.partial(_smoke_worker, api_url, db_path))
+    sup.start()
+    watcher = asyncio.create_task(sup.watch())
+    poller = asyncio.create_task(supervisor._poll_updates(bot, sup, ["message", "callback_query"]))
+    errors = []
+    update_ids = iter(range(1, 10 ** 6))
+    user_ids = [100 + i for i in range(users)]
+    try:
+        # Ждём, пока все рабочие процессы поднимутся (первый heartbeat)
+        if not await _wait_for(lambda: all(worker.ready for worker in sup.workers), 120):
+            errors.append("рабочие процессы не запустились")
+        # По две команды от каждого пользователя
+        for _ in range(2):
+            for user_id in user_ids:
+                fake.add_update(_message(next(update_ids), user_id, "/start"))
+        started = time.monotonic()
+        if not await _wait_for(lambda: all(_answered(fake).get(u, 0) >= 2 for u in user_ids), 60):
+            errors.append(f"ответили не всем: {_answered(fake)}")
+        print(f"{2 * users} апдейтов обработано за {time.monotonic() - started:.2f} c")
+
+        shards = {supervisor.shard_of(u, workers) for u in user_ids}
+        if len(shards) != min(workers, users):
+            errors.append(f"пользователи попали не во все процессы: {shards}")
+
+        victim = sup.workers[-1]
+        old_pid = victim.process.pid
+        victim.process.kill()
+        victim_users = [u for u in user_ids if supervisor.shard_of(u, workers) == victim.index]
+        before = _answered(fake)
+        for user_id in victim_users:
+            fake.add_update(_message(next(update_ids), user_id, "/start"))
+        if not await _wait_for(lambda: victim.process.pid != old_pid and victim.process.is_alive(), 30):
+            errors.append("убитый рабочий процесс не перезапущен")
+        if not await _wait_for(
+            lambda: all(_answered(fake).get(u, 0) > before.get(u, 0) for u in victim_users), 60
+        ):
+            errors.append("после перезапуска апдейты пользователей не обработаны")
+
+        # Процесс убит посреди покупки: списание прошло, ответы зависли в медленном Bot API,
+        # пачка не подтверждена — новый процесс обрабатывает её заново, но второй раз не списывает.
+        # Один апдейт отмечаем обработанным сразу после падения (упавший процесс успел его
+        # закончить, но не подтвердить пачку) — повтор его пропускает
+        if not await _wait_for(lambda: victim.ready, 60):
+            errors.append("перезапущенный процесс не прислал heartbeat")
+        product_id = _seed_purchase(victim_users)
+        old_pid = victim.process.pid
+        before = _answered(fake)
+        fake.latency = 5.0
+        presses = {user_id: _confirm_purchase(next(update_ids), user_id, product_id) for user_id in victim_users}
+        for update in presses.values():
+            fake.add_update(update)
+        if not await _wait_for(
+            lambda: all(_answered(fake).get(u, 0) > before.get(u, 0) for u in victim_users), 30
+        ):
+            errors.append("апдейты не дошли до обработки")
+        if not victim.unacked:
+            errors.append("пачка в обработке уже подтверждена — после падения её не повторить")
+        victim.process.kill()
+        finished_user, *replayed_users = victim_users
+        database.mark_update_processed(presses[finished_user]["update_id"], time.time())
+        killed_at = _answered(fake)
+        fake.latency = 0.0
+        if not await _wait_for(lambda: victim.process.pid != old_pid and victim.process.is_alive(), 30):
+            errors.append("убитый рабочий процесс не перезапущен")
+        if not await _wait_for(
+            lambda: all(_answered(fake).get(u, 0) > killed_at.get(u, 0) for u in replayed_users), 60
+        ):
+            errors.append("апдейты, бывшие в обработке при падении, потеряны")
+        elif not await _wait_for(lambda: not victim.unacked, 30):
+            errors.append(f"после повторной обработки остались неподтверждённые пачки: {len(victim.unacked)}")
+        if _answered(fake).get(finished_user, 0) != killed_at.get(finished_user, 0):
+            errors.append("уже обработанный апдейт выполнен повторно")
+        charged = _purchases(victim_users)
+        if any(charged.get(u) != (1, SMOKE_BALANCE - SMOKE_PRICE) for u in victim_users):
+            errors.append(f"повтор покупки списал ещё раз: (покупок, баланс) = {charged}")
+
+        await asyncio.sleep(supervisor.WORKER_HEARTBEAT_INTERVAL * 2)
+        health = sup.health()
+        if not health["ok"]:
+            errors.append(f"health: {health}")
+        print(f"health: {health}")
+
+        text = await sup.render_metrics()
+        for worker in sup.workers:
+            # Перезапущенный процесс обрабатывал только покупки
+            event, handler = (
+                ("callback_query", "handlers.purchase.confirm_purchase_callback") if worker is victim
+                else ("message", "handlers.start.cmd_start")
+            )
+            sample = f'bot_handler_seconds_count{{worker="{worker.index}",event="{event}",handler="{handler}"}}'
+            if sample not in text:
+                errors.append(f"в метриках нет {sample}")
+    finally:
+        poller.cancel()
+        watcher.cancel()
+        await asyncio.gather(poller, watcher, return_exceptions=True)
+        await sup.stop(timeout=10)
+        await bot.session.close()
+        await fake.stop()
+        shutdown_db()
+
+    for error in errors:
+        print(f"ОШИБКА: {error}")
+    if not errors:
+        print("OK")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.workers, args.users)))
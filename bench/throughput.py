@@ -0,0 +1,480 @@
+"""
+Пропускная способность бота: настоящий диспетчер из bot.py (все роутеры, таблица кнопок,
+SQLiteStorage, кэши) на временной БД против фейкового Bot API (bench/fake_telegram.py).
+Сценарии проигрывают заранее построенные потоки апдейтов; апдейты одного пользователя идут
+по порядку, разные пользователи — параллельно (как в polling/webhook), не больше --concurrency сразу:
+  - start      — /start от новых пользователей (создание профиля, приветствие);
+  - catalog    — категории -> категория -> подкатегория -> товар -> «Купить»;
+  - search     — «Поиск», запрос (часть — в другой раскладке), следующая страница, /search <запрос>;
+  - topup      — пополнение через BalanceFSM: сумма, валюта, «Оплачено», скриншот;
+  - checkout   — одновременные «Подтвердить покупку» одного товара (остатка хватает на часть);
+  - admin      — админ подтверждает платежи из topup.
+Для каждого сценария: апдейтов в секунду, p50/p95/p99 задержки апдейта, запросов к Bot API
+на апдейт, ошибки; по хэндлерам — число вызовов и среднее время (bot_handler_seconds, utils/metrics.py).
+
+Результат можно сохранить как базовую линию и сравнивать с ней следующие прогоны:
+  python -m bench.throughput --save baseline.json
+  python -m bench.throughput --compare baseline.json   # код 1, если сценарий стал медленнее --tolerance
+Прогон воспроизводим: те же пользователи, товары и порядок апдейтов при том же --seed.
+Сравнивать имеет смысл прогоны на одной машине.
+
+Запуск:  python -m bench.throughput [--users 200] [--concurrency 100] [--scenarios start,catalog] [--verbose]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+
+from bench.fake_telegram import FakeTelegram
+
+ADMIN_ID = 1
+FIRST_USER_ID = 10_000
+FIRST_BUYER_ID = 500_000
+PRICE = 10.0
+SUBCATEGORIES = ["Bronze", "Silver", "Gold"]
+PRODUCTS_PER_SUBCATEGORY = 5
+SCENARIOS = ["start", "catalog", "search", "topup", "checkout", "admin"]
+
+
+class _ErrorCounter(logging.Handler):
+    """
+    Вместо вывода логов — счёт записей ERROR и выше (и первая из них для отчёта).
+    """
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+        self.first = None
+
+    def emit(self, record: logging.LogRecord):
+        self.count += 1
+        if self.first is None:
+            self.first = f"{record.name}: {record.getMessage()}"
+
+
+class Context:
+    """
+    Временная БД, фейковый API, бот и диспетчер из bot.py; счётчик update_id/message_id.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.tmp = Path(tempfile.mkdtemp(prefix="throughput_"))
+        self.fake = FakeTelegram(latency=args.api_latency / 1000)
+        self.bot = None
+        self.dp = None
+        self.storage = None
+        self._ids = iter(range(1, 10 ** 9))
+        self.users = [FIRST_USER_ID + i for i in range(args.users)]
+        self.buyers = [FIRST_BUYER_ID + i for i in range(args.users)]
+
+    async def start(self):
+        import config
+        import db_pool
+
+        db_path = str(self.tmp / "bot.sqlite3")
+        config.DB_PATH = db_path
+        db_pool.DB_PATH = db_path
+        db_pool.close_pool()
+
+        import bot as bot_app
+        import encryption
+        from handlers.admin import admin_router
+        from utils import screenshots
+        from utils.fsm_storage import SQLiteStorage
+        from utils.outbox import outbox
+
+        api_url = await self.fake.start()
+        bot_app.TELEGRAM_API_SERVER = api_url
+        bot_app.IMAGE_OPTIMIZER_ENABLED = False
+        screenshots.SCREENSHOTS_DIR = self.tmp / "payments"
+        # Секреты без secret.key: админ и реквизиты подставляются напрямую
+        encryption._secrets = {"admin_id": ADMIN_ID, "ltc": "bench-ltc", "trx": "bench-trx"}
+        admin_router.__dict__["SUPER_ADMIN_ID"] = ADMIN_ID
+
+        await self._seed()
+        self.bot = bot_app.create_bot()
+        self.storage = SQLiteStorage()
+        self.dp = bot_app.create_dispatcher(self.storage)
+        await bot_app.startup(self.bot, with_media=False)
+        # Уведомления только пишутся в Outbox (как в рабочих процессах supervisor.py): доставка
+        # с лимитами Telegram растянула бы прогон и к обработке апдейта не относится
+        outbox.store_only = True
+
+    async def _seed(self):
+        from repository import init_db, run_db
+
+        await init_db()
+        photo = self.tmp / "product.jpg"
+        photo.write_bytes(b"\xff\xd8bench-jpeg\xff\xd9")
+        await run_db(_seed_db, str(photo), len(self.buyers), self.args.users // 4 or 1)
+
+    async def stop(self):
+        from repository import shutdown_db
+        from utils.callback_codec import callback_tokens
+
+        await self.storage.close()
+        await callback_tokens.flush()
+        await self.bot.session.close()
+        await self.fake.stop()
+        shutdown_db()
+
+    # --- апдейты ---
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"u{user_id}", "username": f"u{user_id}", "language_code": "ru"}
+
+    def message(self, user_id: int, text: str = None, **extra) -> dict:
+        update_id = next(self._ids)
+        message = {
+            "message_id": update_id, "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"}, "from": self._user(user_id),
+        }
+        if text is not None:
+            message["text"] = text
+        message.update(extra)
+        return {"update_id": update_id, "message": message}
+
+    def photo(self, user_id: int, file_unique_id: str) -> dict:
+        sizes = [{"file_id": f"file-{file_unique_id}", "file_unique_id": file_unique_id, "width": 800, "height": 600}]
+        return self.message(user_id, photo=sizes)
+
+    def callback(self, user_id: int, data) -> dict:
+        update_id = next(self._ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id), "from": self._user(user_id), "chat_instance": str(user_id),
+                "data": data if isinstance(data, str) else data.pack(),
+                "message": {
+                    "message_id": update_id, "date": int(time.time()), "text": "…",
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": 1, "is_bot": True, "first_name": "FakeBot"},
+                },
+            },
+        }
+
+
+def _seed_db(photo_path: str, buyers: int, hot_stock: int):
+    """
+    Все категории CATEGORY_MAP по SUBCATEGORIES x PRODUCTS_PER_SUBCATEGORY товаров, покупатели
+    с балансом на одну покупку и «горячий» товар для сценария checkout.
+    """
+    from db_pool import transaction
+    from utils.catalog_map import CATEGORY_MAP
+
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT INTO Categories (safe_id, display_name) VALUES (?, ?)", list(CATEGORY_MAP.items())
+        )
+        rows = []
+        for (category_id,) in conn.execute("SELECT id FROM Categories ORDER BY id").fetchall():
+            for subcategory in SUBCATEGORIES:
+                for n in range(PRODUCTS_PER_SUBCATEGORY):
+                    rows.append((category_id, subcategory, f"{subcategory} {n}", "Описание", PRICE, photo_path, 1000))
+        conn.executemany(
+            "INSERT INTO Products (category_id, type, name, description, price, photo_path, quantity) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.execute("UPDATE Products SET quantity = ? WHERE id = (SELECT MIN(id) FROM Products)", (hot_stock,))
+        conn.executemany(
+            "INSERT INTO Users (telegram_id, telegram_username, balance, language) VALUES (?, ?, ?, 'ru')",
+            [(FIRST_BUYER_ID + i, f"buyer{i}", PRICE) for i in range(buyers)],
+        )
+
+
+# --- сценарии: список потоков апдейтов, по одному на пользователя ---
+
+def scenario_start(ctx: Context) -> list[list[dict]]:
+    return [[ctx.message(user_id, "/start")] for user_id in ctx.users]
+
+
+def scenario_catalog(ctx: Context) -> list[list[dict]]:
+    from keyboards.callbacks import BuyProduct, SelectCategory, SelectProduct, SelectSubcategory, ShowCategories
+    from utils.catalog_cache import catalog_cache
+
+    catalog = catalog_cache.snapshot
+    streams = []
+    for user_id in ctx.users:
+        safe_id, _ = ctx.random.choice(catalog.categories)
+        subcategory = ctx.random.choice(catalog.get_subcategories(safe_id))
+        product_id = ctx.random.choice(catalog.get_products(safe_id, subcategory))[0]
+        streams.append([
+            ctx.callback(user_id, ShowCategories()),
+            ctx.callback(user_id, SelectCategory(category_id=catalog.category_id(safe_id))),
+            ctx.callback(user_id, SelectSubcategory(subcategory_id=catalog.subcategory_id(safe_id, subcategory))),
+            ctx.callback(user_id, SelectProduct(product_id=product_id)),
+            ctx.callback(user_id, BuyProduct(product_id=product_id)),
+        ])
+    return streams
+
+
+def scenario_search(ctx: Context) -> list[list[dict]]:
+    from keyboards.callbacks import SearchPage, ShowSearch
+    from utils.search import normalize, swap_layout
+
+    streams = []
+    for user_id in ctx.users:
+        subcategory = ctx.random.choice(SUBCATEGORIES)
+        query = subcategory[:ctx.random.randint(2, len(subcategory))].lower()
+        typed = swap_layout(query) if ctx.random.random() < 0.3 else query  # набрано в раскладке ЙЦУКЕН
+        streams.append([
+            ctx.callback(user_id, ShowSearch()),
+            ctx.message(user_id, typed),
+            ctx.callback(user_id, SearchPage(page=1, query=normalize(query))),
+            ctx.message(user_id, "/search опис"),
+        ])
+    return streams
+
+
+def scenario_topup(ctx: Context) -> list[list[dict]]:
+    from keyboards.callbacks import PaymentDone, TopUpAmount, TopUpBalance, TopUpCurrency
+
+    return [
+        [
+            ctx.callback(user_id, TopUpBalance()),
+            ctx.callback(user_id, TopUpAmount(value=90)),
+            ctx.callback(user_id, TopUpCurrency(code=ctx.random.choice(["dollar", "euro"]))),
+            ctx.callback(user_id, PaymentDone()),
+            ctx.photo(user_id, f"bench-{ctx.args.seed}-{user_id}"),
+        ]
+        for user_id in ctx.users
+    ]
+
+
+def scenario_checkout(ctx: Context) -> list[list[dict]]:
+    from keyboards.callbacks import ConfirmPurchase
+
+    product_id = _hot_product()
+    return [[ctx.callback(user_id, ConfirmPurchase(product_id=product_id))] for user_id in ctx.buyers]
+
+
+def scenario_admin(ctx: Context) -> list[list[dict]]:
+    from keyboards.admin_kb import AdminConfirm
+
+    payment_ids = _pending_payment_ids()
+    return [[ctx.callback(ADMIN_ID, AdminConfirm(payment_id=payment_id)) for payment_id in payment_ids]]
+
+
+def _hot_product() -> int:
+    from db_pool import connection
+
+    with connection() as conn:
+        return conn.execute("SELECT MIN(id) FROM Products").fetchone()[0]
+
+
+def _pending_payment_ids() -> list[int]:
+    from db_pool import connection
+
+    with connection() as conn:
+        return [row[0] for row in conn.execute("SELECT id FROM Payments WHERE status = 'pending' ORDER BY id")]
+
+
+# --- прогон ---
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _handler_totals() -> dict:
+    from utils.metrics import metrics
+
+    return {
+        handler: (sum(counts), total)
+        for (_, handler), (counts, total) in metrics.handler_seconds.values().items()
+    }
+
+
+async def run_scenario(ctx: Context, name: str, streams: list[list[dict]], log_errors: _ErrorCounter) -> dict:
+    from utils.outbox import outbox
+
+    limiter = asyncio.Semaphore(ctx.args.concurrency)
+    latencies: list[float] = []
+    errors: list[str] = []
+
+    async def feed(data: dict):
+        update = Update.model_validate(data, context={"bot": ctx.bot})
+        async with limiter:
+            started = time.perf_counter()
+            try:
+                result = await ctx.dp.feed_update(ctx.bot, update)
+                if isinstance(result, TelegramMethod):
+                    # Как в polling: метод, возвращённый хэндлером, отправляется отдельным запросом
+                    await ctx.bot(result)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+            latencies.append(time.perf_counter() - started)
+
+    async def play(stream: list[dict]):
+        for data in stream:
+            await feed(data)
+
+    calls_before = len(ctx.fake.calls)
+    handlers_before = _handler_totals()
+    enqueued_before = outbox.metrics["enqueued"]
+    log_errors_before = log_errors.count
+    log_errors.first = None
+    started = time.perf_counter()
+    await asyncio.gather(*(play(stream) for stream in streams))
+    seconds = time.perf_counter() - started
+
+    updates = len(latencies)
+    methods: dict[str, int] = {}
+    for method, _ in ctx.fake.calls[calls_before:]:
+        methods[method] = methods.get(method, 0) + 1
+    handlers = {}
+    for handler, (count, total) in _handler_totals().items():
+        count_before, total_before = handlers_before.get(handler, (0, 0.0))
+        if count > count_before:
+            handlers[handler] = {
+                "count": count - count_before,
+                "mean_ms": round((total - total_before) / (count - count_before) * 1e3, 3),
+            }
+    return {
+        "updates": updates,
+        "seconds": round(seconds, 3),
+        "updates_per_s": round(updates / seconds, 1) if seconds else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1e3, 2),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1e3, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1e3, 2),
+        "api_calls_per_update": round(sum(methods.values()) / updates, 2) if updates else 0.0,
+        "api_methods": dict(sorted(methods.items())),
+        "outbox_enqueued": outbox.metrics["enqueued"] - enqueued_before,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "log_errors": log_errors.count - log_errors_before,
+        "first_log_error": log_errors.first,
+        "handlers": dict(sorted(handlers.items())),
+    }
+
+
+def _print(name: str, result: dict):
+    print(
+        f"{name:9} {result['updates']:6} апд. {result['updates_per_s']:8.1f} апд/с  "
+        f"p50 {result['p50_ms']:7.2f}  p95 {result['p95_ms']:7.2f}  p99 {result['p99_ms']:7.2f} мс  "
+        f"API/апд {result['api_calls_per_update']:4.2f}  ошибок {result['errors']}, в логе {result['log_errors']}"
+    )
+    if result["first_error"]:
+        print(f"          первая ошибка: {result['first_error']}")
+    if result["first_log_error"]:
+        print(f"          первая ошибка в логе: {result['first_log_error']}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Сравнение с базовой линией: таблица изменений и список регрессий (апд/с упали или p95 вырос
+    больше, чем на tolerance). Хэндлеры, чьё среднее время выросло, выводятся для поиска причины.
+    """
+    regressions = []
+    print(f"\nСравнение с базовой линией ({baseline['meta']['created']}), допуск {tolerance:.0%}:")
+    for key in ("users", "concurrency", "api_latency", "seed"):
+        if results["meta"]["args"].get(key) != baseline["meta"]["args"].get(key):
+            print(f"ВНИМАНИЕ: --{key.replace('_', '-')} отличается от базовой линии "
+                  f"({results['meta']['args'].get(key)} против {baseline['meta']['args'].get(key)})")
+    for name, now in results["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            print(f"{name:9} нет в базовой линии")
+            continue
+        speed = now["updates_per_s"] / before["updates_per_s"] - 1 if before["updates_per_s"] else 0.0
+        p95 = now["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        calls = now["api_calls_per_update"] - before["api_calls_per_update"]
+        print(f"{name:9} апд/с {speed:+7.1%}   p95 {p95:+7.1%}   API/апд {calls:+.2f}")
+        if speed < -tolerance or p95 > tolerance:
+            regressions.append(f"{name}: апд/с {speed:+.1%}, p95 {p95:+.1%}")
+        for handler, stats in now["handlers"].items():
+            old = before["handlers"].get(handler)
+            if old and old["mean_ms"] and stats["mean_ms"] / old["mean_ms"] - 1 > tolerance:
+                print(f"          {handler}: {old['mean_ms']:.3f} -> {stats['mean_ms']:.3f} мс")
+    return regressions
+
+
+async def main(args) -> int:
+    import bot  # noqa: F401  bot.py настраивает логирование при импорте — до подмены вывода
+
+    log_errors = _ErrorCounter()
+    if not args.verbose:
+        from utils.log_setup import stop_logging
+
+        stop_logging()
+        root = logging.getLogger()
+        root.handlers[:] = [log_errors]
+        root.setLevel(logging.ERROR)
+
+    names = args.scenarios.split(",")
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        print(f"Неизвестные сценарии: {unknown}, есть: {SCENARIOS}")
+        return 2
+    if "admin" in names and "topup" not in names:
+        print("Сценарию admin нужны платежи из topup")
+        return 2
+
+    ctx = Context(args)
+    await ctx.start()
+    results = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args) | {"save": None, "compare": None},
+        },
+        "scenarios": {},
+    }
+    builders = {
+        "start": scenario_start, "catalog": scenario_catalog, "search": scenario_search, "topup": scenario_topup,
+        "checkout": scenario_checkout, "admin": scenario_admin,
+    }
+    try:
+        # Пользователи сценариев catalog и topup должны существовать — /start идёт первым всегда
+        if "start" not in names:
+            await run_scenario(ctx, "start", scenario_start(ctx), log_errors)
+        for name in SCENARIOS:
+            if name in names:
+                result = await run_scenario(ctx, name, builders[name](ctx), log_errors)
+                results["scenarios"][name] = result
+                _print(name, result)
+    finally:
+        await ctx.stop()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Сохранено: {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"РЕГРЕССИЯ: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="пользователей в каждом сценарии")
+    parser.add_argument("--concurrency", type=int, default=100, help="апдейтов в обработке одновременно")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа фейкового API, мс")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="сохранить результат в JSON (базовая линия)")
+    parser.add_argument("--compare", help="сравнить с сохранённой базовой линией")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимое ухудшение апд/с и p95")
+    parser.add_argument("--verbose", action="store_true", help="выводить логи бота")
+    sys.exit(asyncio.run(main(parser.parse_args())))
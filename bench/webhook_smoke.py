@@ -0,0 +1,97 @@
+"""
+Проверка режима webhook на фейковом Bot API (bench/fake_telegram.py):
+  - запрос без/с неверным секретом отклоняется (401);
+  - `return call.answer()` уходит в теле HTTP-ответа, а не отдельным запросом к API;
+  - обычные вызовы (message.answer) доходят до API.
+
+Запуск:  python -m bench.webhook_smoke
+"""
+import asyncio
+import sys
+
+from aiogram import Bot, Dispatcher, Router, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import CallbackQuery, Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from bench.fake_telegram import FakeTelegram
+from webhook import build_app
+
+SECRET = "smoke-secret"
+USER = {"id": 42, "is_bot": False, "first_name": "Test"}
+
+
+def _router() -> Router:
+    router = Router()
+
+    @router.callback_query(F.data == "ping")
+    async def ping(call: CallbackQuery):
+        return call.answer()
+
+    @router.message(F.text)
+    async def echo(message: Message):
+        await message.answer(message.text)
+
+    return router
+
+
+async def main() -> int:
+    fake = FakeTelegram()
+    api_url = await fake.start()
+    bot = Bot("42:SMOKE", session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+    dp = Dispatcher()
+    dp.include_router(_router())
+
+    client = TestClient(TestServer(build_app(dp, bot, SECRET, path="/webhook")))
+    await client.start_server()
+    errors = []
+    try:
+        callback_update = {
+            "update_id": 1,
+            "callback_query": {"id": "cb1", "from": USER, "chat_instance": "1", "data": "ping"},
+        }
+        response = await client.post("/webhook", json=callback_update)
+        if response.status != 401:
+            errors.append(f"без секрета: {response.status}, ожидалось 401")
+        response = await client.post(
+            "/webhook", json=callback_update, headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}
+        )
+        if response.status != 401:
+            errors.append(f"с неверным секретом: {response.status}, ожидалось 401")
+
+        response = await client.post(
+            "/webhook", json=callback_update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+        )
+        body = await response.text()
+        if response.status != 200 or "answerCallbackQuery" not in body:
+            errors.append(f"callback: ответ {response.status} без answerCallbackQuery")
+        if "answerCallbackQuery" in fake.methods():
+            errors.append("answerCallbackQuery ушёл отдельным запросом к API")
+
+        message_update = {
+            "update_id": 2,
+            "message": {
+                "message_id": 1, "date": 0, "text": "hello",
+                "chat": {"id": 42, "type": "private"}, "from": USER,
+            },
+        }
+        response = await client.post(
+            "/webhook", json=message_update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+        )
+        if response.status != 200 or "sendMessage" not in fake.methods():
+            errors.append("message.answer не дошёл до API")
+    finally:
+        await client.close()
+        await bot.session.close()
+        await fake.stop()
+
+    for error in errors:
+        print(f"ОШИБКА: {error}")
+    if not errors:
+        print("OK")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -2,41 +2,70 @@ import asyncio
 import logging
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage  # <-- добавляем
-from config import API_TOKEN, ADMIN_ID_ENCRYPTED, DEFAULT_DECRYPT_PASSWORD
-from encryption import decrypt_admin_data
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from config import API_TOKEN, DEFAULT_DECRYPT_PASSWORD, TELEGRAM_API_SERVER, BOT_MODE, WORKER_PROCESSES
+from encryption import load_secrets, get_admin_id
 from handlers.start import start_router
 from handlers.menu import menu_router
 from handlers.purchase import purchase_router
 from handlers.catalog import catalog_router
+from handlers.search import search_router
 from handlers.appointment import appointment_router
 from handlers.order import order_router  # импорт нового модуля оформления заказов
 from handlers.balance import balance_router
 from handlers.admin import admin_router
-from database import init_db, initialize_demo_products
+from repository import init_db, initialize_demo_products, shutdown_db
+from utils.i18n import load_translations, start_translations_watcher
+from utils.media import media_registry
+from utils.outbox import outbox
+from utils.fsm_storage import SQLiteStorage
+from utils.image_optimizer import start_image_optimizer, load_manifest
+from repository import get_product_photo_paths
+from config import IMAGE_OPTIMIZER_ENABLED
+from webhook import run_webhook
+from utils.callback_table import callbacks
+from utils.callback_codec import callback_tokens
+from utils.catalog_cache import catalog_cache
+from utils.log_setup import setup_logging
+from utils.metrics import instrument_bot, instrument_dispatcher, start_metrics_server
 
-logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
-async def main():
+setup_logging()
+
+
+def load_admin() -> bool:
+    # Расшифровываем ADMIN_ID и реквизиты один раз — дальше хэндлеры берут их из памяти
     try:
-        admin_id_decrypted = decrypt_admin_data(ADMIN_ID_ENCRYPTED, DEFAULT_DECRYPT_PASSWORD)
-        actual_admin_id = int(admin_id_decrypted.decode("utf-8"))
+        load_secrets(DEFAULT_DECRYPT_PASSWORD)
     except Exception as e:
-        logging.error(f"Ошибка дешифрования ADMIN_ID: {e}")
-        return
+        logger.error("Ошибка загрузки секретов: %s", e)
+        return False
+    actual_admin_id = get_admin_id()
+    if actual_admin_id is None:
+        return False
 
     # Передаём расшифрованный ID в модуль admin.py
     admin_router.__dict__["SUPER_ADMIN_ID"] = actual_admin_id
+    return True
 
 
-    # Включаем in-memory-хранилище FSM
-    bot = Bot(token=API_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-    dp = Dispatcher(storage=MemoryStorage())
+def create_bot() -> Bot:
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_SERVER)) if TELEGRAM_API_SERVER else None
+    bot = Bot(token=API_TOKEN, session=session, default=DefaultBotProperties(parse_mode="HTML"))
+    instrument_bot(bot)
+    return bot
 
-    init_db()
-    initialize_demo_products()
 
-    # Роутеры
+def create_dispatcher(storage=None) -> Dispatcher:
+    """
+    Диспетчер со всеми роутерами. Роутеры — синглтоны модулей,
+    поэтому в одном процессе диспетчер создаётся один раз.
+    """
+    dp = Dispatcher(storage=storage)
+    # Все инлайн-кнопки — через таблицу префиксов (utils/callback_table.py)
+    dp.include_router(callbacks.router)
     dp.include_router(start_router)
     dp.include_router(menu_router)
     dp.include_router(order_router)
@@ -45,8 +74,77 @@ async def main():
     dp.include_router(purchase_router)
     dp.include_router(appointment_router)
     dp.include_router(catalog_router)
+    dp.include_router(search_router)
+    callbacks.check(dp)
+    instrument_dispatcher(dp)
+    return dp
+
+
+async def prepare_media(bot: Bot):
+    # Сначала пережимаем картинки (пул процессов), потом предзагружаем уже оптимизированные
+    # в служебный чат (если MEDIA_STORAGE_CHAT_ID задан).
+    if IMAGE_OPTIMIZER_ENABLED:
+        try:
+            await start_image_optimizer(await get_product_photo_paths())
+        except Exception as e:
+            logger.error("Ошибка оптимизации картинок: %s", e)
+    await media_registry.warm_up(bot)
+
+
+async def startup(bot: Bot, with_media: bool = True) -> asyncio.Task | None:
+    """
+    БД, переводы, реестр file_id. with_media=False — картинки готовит другой процесс,
+    здесь только читаем уже готовый манифест.
+    """
+    await init_db()
+    await initialize_demo_products()
+    # Снимок каталога нужен сразу: по нему разбираются старые кнопки категорий (safe_id -> id)
+    await catalog_cache.get()
+    load_translations()
+    start_translations_watcher()
+    await media_registry.load()
+    if not with_media:
+        await asyncio.to_thread(load_manifest)
+        return None
+    # В фоне — старт не задерживается
+    return asyncio.create_task(prepare_media(bot))
+
 
-    await dp.start_polling(bot)
+async def main():
+    if not load_admin():
+        return
+
+    if WORKER_PROCESSES > 1:
+        # Апдейты принимает супервизор и раздаёт рабочим процессам, см. supervisor.py
+        from supervisor import run_supervisor
+        await run_supervisor(WORKER_PROCESSES)
+        return
+
+    bot = create_bot()
+    # Состояния FSM хранятся в SQLite (переживают перезапуск), см. utils/fsm_storage.py
+    storage = SQLiteStorage()
+    dp = create_dispatcher(storage)
+
+    media_task = await startup(bot)
+
+    # Фоновая доставка уведомлений (и недоставленных до перезапуска)
+    await outbox.start(bot)
+    metrics_runner = await start_metrics_server()
+
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            # Переход с webhook обратно на polling: пока webhook установлен, getUpdates не работает
+            await bot.delete_webhook(drop_pending_updates=False)
+            await dp.start_polling(bot)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await storage.close()
+        await outbox.stop()
+        await callback_tokens.flush()
+        shutdown_db()
 
 if __name__ == "__main__":
     asyncio.run(main())
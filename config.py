@@ -11,12 +11,104 @@ DEFAULT_DECRYPT_PASSWORD = "kerasys854"
 # Токен бота
 API_TOKEN = "7534771450:AAFNi_QQy2d1WhdbImr98fsCfbaVJ5a742Y"
 
+# Адрес Bot API. None — api.telegram.org; можно указать локальный Bot API сервер
+# или тестовый фейк (bench/fake_telegram.py), например "http://127.0.0.1:8081"
+TELEGRAM_API_SERVER = None
+
+# Режим получения апдейтов: "polling" (getUpdates) или "webhook" (aiohttp-сервер, webhook.py)
+BOT_MODE = "polling"
+WEBHOOK_BASE_URL = ""            # публичный https-адрес бота, например "https://bot.example.com"
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_PORT = 8080
+WEBHOOK_SECRET = None            # X-Telegram-Bot-Api-Secret-Token; None — случайный при каждом запуске
+
 # Путь к ключу
 SECRET_KEY_PATH = str(Path(__file__).parent / "secret.key")
 
 # Путь к БД  (SQLite)
 DB_PATH = str(Path(__file__).parent / "bot_store.sqlite3")
 
+# Пул соединений SQLite (db_pool.py)
+DB_POOL_SIZE = 4                 # сколько "тёплых" соединений держим открытыми
+DB_BUSY_TIMEOUT = 5.0            # сек. ожидания блокировки на запись
+DB_CACHE_SIZE_KB = 16384         # PRAGMA cache_size (в KiB, на соединение)
+DB_MMAP_SIZE = 64 * 1024 * 1024  # PRAGMA mmap_size (байт)
+DB_STATEMENT_CACHE = 256         # размер кэша подготовленных выражений на соединение
+
+# Как часто (сек.) кэш каталога сверяет версию каталога в БД (utils/catalog_cache.py)
+CATALOG_VERSION_POLL_SECONDS = 5.0
+
+# Сколько товаров / подкатегорий на одной странице списка каталога (кнопки ◀ / ▶ листают дальше).
+# В инлайн-клавиатуре Telegram не больше 100 кнопок.
+CATALOG_PAGE_SIZE = 10
+
+# Поиск товаров (utils/search.py, FTS5): сколько слов запроса учитывать, остальные отбрасываются
+SEARCH_MAX_TERMS = 8
+SEARCH_RANK_LIMIT = 1000        # больше совпадений — запрос слишком общий: без ранжирования, по порядку id
+
+# Кэш профилей пользователей (utils/user_cache.py)
+USER_CACHE_SIZE = 10000          # максимум пользователей в памяти (LRU)
+USER_CACHE_TTL_SECONDS = 300.0   # через сколько строку перечитываем из БД
+
+# Переводы (utils/i18n.py): загружаются один раз при старте.
+# Горячая перезагрузка при изменении translations/*.json — для переводчиков, в проде можно выключить.
+TRANSLATIONS_HOT_RELOAD = False
+TRANSLATIONS_RELOAD_INTERVAL = 2.0
+
+# Реестр file_id картинок (utils/media.py).
+# Если задан id служебного чата/канала, при старте туда предзагружаются все картинки,
+# чтобы пользователи сразу получали их по file_id. None — загрузка при первой отправке.
+MEDIA_STORAGE_CHAT_ID = None
+
+# Оптимизация картинок (utils/image_optimizer.py, нужен Pillow)
+IMAGE_OPTIMIZER_ENABLED = True
+IMAGE_MAX_SIDE = 1280            # больше Telegram всё равно не показывает
+IMAGE_JPEG_QUALITY = 85
+IMAGE_OPTIMIZER_WORKERS = 2      # процессов в пуле
+
+# Хранилище FSM в SQLite (utils/fsm_storage.py)
+FSM_STATE_TTL_SECONDS = 24 * 3600   # брошенный на полпути сценарий (оплата, заказ) сбрасывается через сутки
+FSM_FLUSH_INTERVAL = 0.5            # изменения пишутся в БД пачкой раз в столько секунд
+FSM_CACHE_SIZE = 10000              # сколько ключей держим в памяти
+
+# Очередь исходящих уведомлений (utils/outbox.py). Лимиты Telegram: ~30 сообщений/с всего, ~1/с в один чат
+OUTBOX_GLOBAL_RATE = 25.0        # сообщений в секунду на бота (с запасом)
+OUTBOX_CHAT_RATE = 1.0           # сообщений в секунду в один чат
+OUTBOX_CHAT_BURST = 3            # сколько можно отправить в чат подряд, прежде чем включится лимит
+OUTBOX_CONCURRENCY = 8           # одновременных запросов к Bot API
+OUTBOX_MAX_ATTEMPTS = 8          # после стольких временных ошибок сообщение отбрасывается
+OUTBOX_MAX_BACKOFF = 300.0       # максимальная пауза между повторами, сек.
+
+# Многопроцессный режим (supervisor.py): апдейты принимает один процесс-супервизор
+# и раздаёт рабочим процессам по from_user.id. 1 — всё в одном процессе, как раньше.
+WORKER_PROCESSES = 1
+WORKER_HEARTBEAT_INTERVAL = 1.0     # как часто рабочий процесс отчитывается супервизору, сек.
+WORKER_HEARTBEAT_TIMEOUT = 15.0     # без отчёта дольше — процесс считается зависшим и перезапускается
+WORKER_MAX_CONCURRENT_UPDATES = 100 # апдейтов одновременно в обработке у одного рабочего процесса
+PROCESSED_UPDATES_TTL_SECONDS = 3600  # столько помним обработанные update_id — повтор после падения процесса не выполняется
+OUTBOX_POLL_INTERVAL = 0.5          # как часто супервизор забирает из БД уведомления, записанные рабочими
+
+# Логирование (utils/log_setup.py): записи форматируются и пишутся в фоновом потоке
+LOG_LEVEL = "INFO"
+LOG_LEVELS = {                      # уровни отдельных логгеров (имя модуля -> уровень)
+    "aiogram.event": "WARNING",     # строка "Update id=... is handled" на каждый апдейт
+    # "handlers.catalog": "DEBUG",
+}
+LOG_FORMAT = "text"                 # "text" или "json" (одна JSON-строка на запись)
+LOG_FILE = None                     # путь к файлу; None — только stderr
+LOG_DEBUG_RATE = 20.0               # DEBUG-записей в секунду с одного места в коде, остальные отбрасываются
+LOG_DEBUG_BURST = 50                # столько DEBUG-записей подряд проходит без ограничения
+
+# Метрики Prometheus (utils/metrics.py): GET /metrics на локальном порту.
+# В многопроцессном режиме порт открывает супервизор и отдаёт метрики всех процессов (метка worker)
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"          # только локально; наружу — через Prometheus/агент на этой машине
+METRICS_PORT = 9108
+
+# callback_data длиннее 64 байт (см. utils/callback_codec.py) заменяется токеном; столько секунд он живёт
+CALLBACK_TOKEN_TTL_SECONDS = 3 * 24 * 3600
+
 # -- Зашифрованные реквизиты для оплаты (пример) --
 # Чтобы получить это значение, офлайн:
 #   from cryptography.fernet import Fernet
@@ -1,96 +1,150 @@
-import sqlite3
-from contextlib import closing
-from config import DB_PATH
+from db_pool import connection, transaction
+from config import SEARCH_RANK_LIMIT
+from migrations import migrate, check_query_plans
 import logging
 
-def init_db():
-    with closing(sqlite3.connect(DB_PATH)) as conn:
-        cursor = conn.cursor()
+logger = logging.getLogger(__name__)
 
-        # Таблица пользователей
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            telegram_id INTEGER UNIQUE,
-            telegram_username TEXT,
-            balance REAL DEFAULT 0,
-            language TEXT
-        )
-        """)
+# Горячие запросы вынесены в константы: их же проверяет migrations.check_query_plans()
+SQL_GET_RATE = "SELECT rate_to_y FROM RatesY WHERE currency = ?"
 
-        # Новая таблица категорий
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Categories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            safe_id TEXT UNIQUE,
-            display_name TEXT
-        )
-        """)
+# Категории и подкатегории перебираются по справочникам (их единицы и десятки), а наличие
+# товаров проверяется одним шагом по индексу: DISTINCT по Products читал бы все товары в наличии
+SQL_UNIQUE_CATEGORIES = """
+    SELECT DISTINCT display_name
+    FROM Categories
+    WHERE EXISTS (
+        SELECT 1 FROM Products p WHERE p.category_id = Categories.id AND p.quantity > 0
+    )
+"""
 
-        # Таблица товаров/услуг с внешним ключом на Categories
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            category_id INTEGER,
-            type TEXT,
-            name TEXT,
-            description TEXT,
-            price REAL,
-            photo_path TEXT,
-            quantity INTEGER,
-            FOREIGN KEY(category_id) REFERENCES Categories(id)
-        )
-        """)
+SQL_UNIQUE_SUBCATEGORIES = """
+    SELECT s.name
+    FROM Subcategories s
+    JOIN Categories c ON s.category_id = c.id
+    WHERE c.safe_id = ? AND EXISTS (
+        SELECT 1 FROM Products p WHERE p.category_id = s.category_id AND p.type = s.name AND p.quantity > 0
+    )
+    ORDER BY s.name
+"""
 
-        # Таблица платежей
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Payments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            amount REAL,
-            currency TEXT,
-            status TEXT,
-            screenshot_path TEXT,
-            date TEXT
-        )
-        """)
+SQL_GET_PRODUCTS = """
+    SELECT p.id, p.name, p.price, p.quantity
+    FROM Products p
+    JOIN Categories c ON p.category_id = c.id
+    WHERE c.safe_id = ? AND p.type = ? AND p.quantity > 0
+"""
 
-        # Таблица покупок
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Purchase (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            username TEXT,
-            product_id INTEGER,
-            date TEXT
-        )
-        """)
+# Поиск (utils/search.py) по FTS5-индексу ProductSearch, только товары в наличии.
+# bm25 считается для каждого совпадения, поэтому ранжируются только запросы, у которых совпадений
+# не больше SEARCH_RANK_LIMIT: кандидаты читаются в порядке rowid с LIMIT и сортируются по рангу.
+# Слишком общий запрос («тов» — весь каталог) ранжировать дорого и бессмысленно — он идёт по id.
+# Веса колонок bm25: название важнее подкатегории и категории, описание — меньше всего.
+SQL_SEARCH_CANDIDATES = """
+    SELECT p.id, p.name, p.price, p.quantity, bm25(ProductSearch, 10.0, 1.0, 4.0, 2.0)
+    FROM ProductSearch
+    JOIN Products p ON p.id = ProductSearch.rowid
+    WHERE ProductSearch MATCH ? AND p.quantity > 0
+    ORDER BY ProductSearch.rowid
+    LIMIT ?
+"""
 
-        # Таблица курсов валют
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS RatesY (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            currency TEXT,
-            rate_to_y REAL
-        )
-        """)
+SQL_SEARCH_BY_ID = """
+    SELECT p.id, p.name, p.price, p.quantity
+    FROM ProductSearch
+    JOIN Products p ON p.id = ProductSearch.rowid
+    WHERE ProductSearch MATCH ? AND p.quantity > 0
+    ORDER BY ProductSearch.rowid
+    LIMIT ? OFFSET ?
+"""
 
-        conn.commit()
+SQL_FIND_PENDING_PAYMENT = """
+    SELECT id
+    FROM Payments
+    WHERE user_id=? AND amount=? AND status='pending'
+    ORDER BY id DESC
+    LIMIT 1
+"""
+
+SQL_LIST_PENDING_PAYMENTS = """
+    SELECT id, user_id, amount, currency, date
+    FROM Payments
+    WHERE status='pending' AND id > ?
+    ORDER BY id
+    LIMIT ?
+"""
+
+SQL_FIND_PAYMENT_BY_SCREENSHOT = """
+    SELECT id, status
+    FROM Payments
+    WHERE screenshot_path=?
+    ORDER BY id DESC
+    LIMIT 1
+"""
+
+SQL_LOAD_CATALOG = """
+    SELECT c.id, c.safe_id, c.display_name, s.id, p.type, p.id, p.name, p.price, p.quantity
+    FROM Products p
+    JOIN Categories c ON p.category_id = c.id
+    LEFT JOIN Subcategories s ON s.category_id = p.category_id AND s.name = p.type
+    WHERE p.quantity > 0
+    ORDER BY p.category_id, p.type, p.id
+"""
+
+# (имя, SQL, пример параметров, индекс, который должен использоваться)
+HOT_QUERIES = [
+    ("get_rate", SQL_GET_RATE, ("USD",), "idx_ratesy_currency"),
+    ("get_unique_categories", SQL_UNIQUE_CATEGORIES, (), "idx_products_in_stock"),
+    ("get_unique_subcategories", SQL_UNIQUE_SUBCATEGORIES, ("keys",), "idx_products_in_stock"),
+    ("get_products", SQL_GET_PRODUCTS, ("keys", "Bronze"), "idx_products_in_stock"),
+    ("load_catalog", SQL_LOAD_CATALOG, (), "idx_products_in_stock"),
+    ("find_pending_payment", SQL_FIND_PENDING_PAYMENT, (1, 30.0), "idx_payments_pending_user_amount"),
+    ("list_pending_payments", SQL_LIST_PENDING_PAYMENTS, (0, 20), "idx_payments_pending_queue"),
+    ("find_payment_by_screenshot", SQL_FIND_PAYMENT_BY_SCREENSHOT, ("data/payments/x.jpg",), "idx_payments_screenshot"),
+    # FTS5: совпадения берутся из самого полнотекстового индекса, товары — по rowid
+    ("search_products", SQL_SEARCH_CANDIDATES, ('"ключ"*', 1001), None),
+    ("search_products_by_id", SQL_SEARCH_BY_ID, ('"ключ"*', 10, 2000), None),
+]
+
+def init_db():
+    """
+    Приводит схему БД к актуальной версии (см. migrations.py)
+    и предупреждает в логе, если горячие запросы перестали попадать в индексы.
+    """
+    with transaction() as conn:
+        migrate(conn)
+    with connection() as conn:
+        for problem in check_query_plans(conn):
+            logger.warning("[init_db] План запроса: %s", problem)
 
 def get_user_by_telegram_id(telegram_id: int):
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM Users WHERE telegram_id = ?", (telegram_id,))
         row = cursor.fetchone()
-        logging.info(f"[get_user_by_telegram_id] row={row} for telegram_id={telegram_id}")
+        logger.debug("[get_user_by_telegram_id] row=%s for telegram_id=%s", row, telegram_id)
         return row
 
+def get_or_create_user(telegram_id: int, username: str, language: str):
+    """
+    Один запрос для /start: создаёт пользователя (если его нет) или обновляет username,
+    и возвращает строку Users. language используется только для нового пользователя.
+    """
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO Users (telegram_id, telegram_username, language)
+            VALUES (?, ?, ?)
+            ON CONFLICT(telegram_id) DO UPDATE SET telegram_username = excluded.telegram_username
+            RETURNING id, telegram_id, telegram_username, balance, language
+        """, (telegram_id, username, language))
+        return cursor.fetchone()
+
 def add_new_user(telegram_id: int, username: str, language: str):
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with transaction() as conn:
         cursor = conn.cursor()
         cursor.execute("INSERT INTO Users (telegram_id, telegram_username, language) VALUES (?, ?, ?)",
                        (telegram_id, username, language))
-        conn.commit()
 
 def get_balance(telegram_id: int) -> float:
     user = get_user_by_telegram_id(telegram_id)
@@ -99,22 +153,21 @@ def get_balance(telegram_id: int) -> float:
     return 0.0
 
 def update_user_balance(telegram_id: int, new_balance: float):
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with transaction() as conn:
         cursor = conn.cursor()
         cursor.execute("UPDATE Users SET balance = ? WHERE telegram_id = ?", (new_balance, telegram_id))
-        conn.commit()
 
 def get_rate(currency: str) -> float:
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT rate_to_y FROM RatesY WHERE currency = ?", (currency,))
+        cursor.execute(SQL_GET_RATE, (currency,))
         row = cursor.fetchone()
         if row:
             rate_str = str(row[0]).replace(",", ".")
             try:
                 rate_val = float(rate_str)
             except ValueError:
-                logging.error(f"Некорректный формат курса: {row[0]}")
+                logger.error("Некорректный формат курса: %s", row[0])
                 return 1.0
             return rate_val
         else:
@@ -124,14 +177,9 @@ def get_unique_categories() -> list[str]:
     """
     Возвращает список display_name категорий, для которых есть товары с quantity > 0.
     """
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT DISTINCT c.display_name
-            FROM Products p
-            JOIN Categories c ON p.category_id = c.id
-            WHERE p.quantity > 0
-        """)
+        cursor.execute(SQL_UNIQUE_CATEGORIES)
         rows = cursor.fetchall()
         return [r[0] for r in rows]
 
@@ -140,39 +188,182 @@ def get_unique_subcategories(category_safe_id: str) -> list[str]:
     Возвращает список уникальных подкатегорий (p.type) для товаров,
     где категория соответствует заданному safe_id.
     """
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT DISTINCT p.type
-            FROM Products p
-            JOIN Categories c ON p.category_id = c.id
-            WHERE c.safe_id = ? AND p.quantity > 0
-        """, (category_safe_id,))
+        cursor.execute(SQL_UNIQUE_SUBCATEGORIES, (category_safe_id,))
         rows = cursor.fetchall()
         return [r[0] for r in rows]
 
 def get_products(category_safe_id: str, subcat: str) -> list[tuple]:
-    import logging
-    logging.info(f"get_products(category_safe_id={category_safe_id}, subcat={subcat}) called")
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT p.id, p.name, p.price, p.quantity
-            FROM Products p
-            JOIN Categories c ON p.category_id = c.id
-            WHERE c.safe_id = ? AND p.type = ? AND p.quantity > 0
-        """, (category_safe_id, subcat))
+        cursor.execute(SQL_GET_PRODUCTS, (category_safe_id, subcat))
         rows = cursor.fetchall()
-    logging.info(f"get_products => {rows}")
+    logger.debug("get_products(category_safe_id=%s, subcat=%s) => %s строк", category_safe_id, subcat, len(rows))
     return rows
 
+def search_products(match: str, limit: int, offset: int = 0) -> tuple[list[tuple], bool]:
+    """
+    Товары в наличии по FTS5-выражению match (см. utils/search.match_expression):
+    ([(id, name, price, quantity)], ранжированы ли). Если совпадений больше SEARCH_RANK_LIMIT —
+    по возрастанию id, иначе лучшие первыми.
+    """
+    with connection() as conn:
+        rows = conn.execute(SQL_SEARCH_CANDIDATES, (match, SEARCH_RANK_LIMIT + 1)).fetchall()
+        if len(rows) <= SEARCH_RANK_LIMIT:
+            rows.sort(key=lambda row: (row[4], row[0]))
+            return [row[:4] for row in rows[offset:offset + limit]], True
+        if offset + limit <= len(rows):
+            # Первые страницы общего запроса уже прочитаны (кандидаты идут по rowid)
+            return [row[:4] for row in rows[offset:offset + limit]], False
+        return conn.execute(SQL_SEARCH_BY_ID, (match, limit, offset)).fetchall(), False
+
+def get_catalog_version() -> int:
+    with connection() as conn:
+        row = conn.execute("SELECT version FROM CatalogVersion WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+def load_catalog() -> tuple[int, list[tuple]]:
+    """
+    Возвращает (версия каталога, строки SQL_LOAD_CATALOG), прочитанные в одной транзакции,
+    чтобы версия точно соответствовала данным.
+    """
+    with connection() as conn:
+        conn.execute("BEGIN")
+        try:
+            version = conn.execute("SELECT version FROM CatalogVersion WHERE id = 1").fetchone()
+            rows = conn.execute(SQL_LOAD_CATALOG).fetchall()
+        finally:
+            conn.commit()
+        return (version[0] if version else 0), rows
+
+def load_media_cache() -> list[tuple]:
+    """
+    Все сохранённые (path, content_hash, file_id) — загружаются в память при старте.
+    """
+    with connection() as conn:
+        return conn.execute("SELECT path, content_hash, file_id FROM MediaCache").fetchall()
+
+def save_media_file_id(path: str, content_hash: str, file_id: str):
+    with transaction() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO MediaCache (path, content_hash, file_id, date)
+            VALUES (?, ?, ?, datetime('now'))
+        """, (path, content_hash, file_id))
+
+def delete_media_file_id(path: str, content_hash: str):
+    with transaction() as conn:
+        conn.execute("DELETE FROM MediaCache WHERE path = ? AND content_hash = ?", (path, content_hash))
+
+def get_product_photo_paths() -> list[str]:
+    with connection() as conn:
+        rows = conn.execute("SELECT DISTINCT photo_path FROM Products WHERE photo_path IS NOT NULL").fetchall()
+        return [r[0] for r in rows]
+
+def outbox_add(chat_id: int, method: str, payload: str, created_at: float) -> int:
+    with transaction() as conn:
+        cursor = conn.execute(
+            "INSERT INTO Outbox (chat_id, method, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+            (chat_id, method, payload, created_at, created_at)
+        )
+        return cursor.lastrowid
+
+def outbox_delete(message_id: int):
+    with transaction() as conn:
+        conn.execute("DELETE FROM Outbox WHERE id=?", (message_id,))
+
+def outbox_reschedule(message_id: int, chat_id: int, attempts: int, next_attempt_at: float):
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE Outbox SET chat_id=?, attempts=?, next_attempt_at=? WHERE id=?",
+            (chat_id, attempts, next_attempt_at, message_id)
+        )
+
+def outbox_migrate_chat(old_chat_id: int, new_chat_id: int):
+    """
+    Группа стала супергруппой: все недоставленные сообщения старого чата — в новый.
+    """
+    with transaction() as conn:
+        conn.execute("UPDATE Outbox SET chat_id=? WHERE chat_id=?", (new_chat_id, old_chat_id))
+
+def outbox_load(after_id: int = 0) -> list[tuple]:
+    """
+    Недоставленные сообщения с id > after_id: [(id, chat_id, method, payload, attempts, next_attempt_at, created_at)].
+    """
+    with connection() as conn:
+        return conn.execute(
+            "SELECT id, chat_id, method, payload, attempts, next_attempt_at, created_at FROM Outbox WHERE id > ? ORDER BY id",
+            (after_id,)
+        ).fetchall()
+
+def fsm_load(key: str):
+    """
+    (state, data_json, updated_at) или None.
+    """
+    with connection() as conn:
+        return conn.execute("SELECT state, data, updated_at FROM FSMState WHERE key=?", (key,)).fetchone()
+
+def fsm_save_many(rows: list[tuple]):
+    """
+    Пачка изменений FSM одной транзакцией: [(key, state, data_json, updated_at)].
+    Пустое состояние без данных (после state.clear()) удаляется.
+    """
+    upserts = [row for row in rows if row[1] is not None or row[2] != "{}"]
+    deletes = [(row[0],) for row in rows if row[1] is None and row[2] == "{}"]
+    with transaction() as conn:
+        if upserts:
+            conn.executemany("""
+                INSERT INTO FSMState (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET state=excluded.state, data=excluded.data, updated_at=excluded.updated_at
+            """, upserts)
+        if deletes:
+            conn.executemany("DELETE FROM FSMState WHERE key=?", deletes)
+
+def fsm_delete_expired(before: float) -> int:
+    with transaction() as conn:
+        return conn.execute("DELETE FROM FSMState WHERE updated_at < ?", (before,)).rowcount
+
+def callback_token_get(token: str, now: float):
+    """
+    (data, expires_at) живого токена callback_data или None.
+    """
+    with connection() as conn:
+        return conn.execute(
+            "SELECT data, expires_at FROM CallbackTokens WHERE token=? AND expires_at > ?", (token, now)
+        ).fetchone()
+
+def callback_tokens_put(rows: list[tuple], now: float):
+    """
+    Пачка токенов [(token, data, expires_at)] одной транзакцией; заодно удаляет истёкшие.
+    """
+    with transaction() as conn:
+        conn.executemany("""
+            INSERT INTO CallbackTokens (token, data, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(token) DO UPDATE SET expires_at=MAX(expires_at, excluded.expires_at)
+        """, rows)
+        conn.execute("DELETE FROM CallbackTokens WHERE expires_at < ?", (now,))
+
+def update_processed(update_id: int) -> bool:
+    with connection() as conn:
+        return conn.execute("SELECT 1 FROM ProcessedUpdates WHERE update_id=?", (update_id,)).fetchone() is not None
+
+def mark_update_processed(update_id: int, now: float):
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO ProcessedUpdates (update_id, processed_at) VALUES (?, ?)", (update_id, now)
+        )
+
+def processed_updates_delete_expired(before: float) -> int:
+    with transaction() as conn:
+        return conn.execute("DELETE FROM ProcessedUpdates WHERE processed_at < ?", (before,)).rowcount
+
 def initialize_demo_products():
     """
     Заполняет таблицу Products демонстрационными данными, если в ней нет записей.
     Для каждой категории (по safe_id) вставляются товары с подкатегориями.
     Предполагается, что в таблице Categories уже есть записи с safe_id: 'keys', 'subs', 'misc', 'services'
     """
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with transaction() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM Products")
         count = cursor.fetchone()[0]
@@ -200,12 +391,251 @@ def initialize_demo_products():
                         """,
                         (safe, subcat, pname, f"Описание для {pname}", price, photo_path, quantity)
                     )
-        conn.commit()
 
 def update_user_language(telegram_id: int, language: str):
-    from contextlib import closing
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with transaction() as conn:
         cursor = conn.cursor()
         cursor.execute("UPDATE Users SET language = ? WHERE telegram_id = ?", (language, telegram_id))
-        conn.commit()
-        logging.info(f"Обновлен язык для {telegram_id}: {language}")
+        logger.info("Обновлен язык для %s: %s", telegram_id, language)
+
+def get_product_card(product_id: int):
+    """
+    Карточка товара: name, description, price, photo_path, display_name, safe_id, type, logic_type,
+    id подкатегории (Subcategories).
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT p.name, p.description, p.price, p.photo_path,
+                   c.display_name, c.safe_id, p.type, c.logic_type, s.id
+            FROM Products p
+            JOIN Categories c ON p.category_id = c.id
+            LEFT JOIN Subcategories s ON s.category_id = p.category_id AND s.name = p.type
+            WHERE p.id = ?
+        """, (product_id,))
+        return cursor.fetchone()
+
+def get_product_price(product_id: int):
+    """
+    Возвращает (price, photo_path, name, quantity) товара или None.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT price, photo_path, name, quantity FROM Products WHERE id=?", (product_id,))
+        return cursor.fetchone()
+
+def get_product_order_info(product_id: int):
+    """
+    Возвращает (name, price, display_name) товара для оформления заказа или None.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT p.name, p.price, c.display_name
+            FROM Products p
+            JOIN Categories c ON p.category_id = c.id
+            WHERE p.id = ?
+        """, (product_id,))
+        return cursor.fetchone()
+
+def get_product_name(product_id: int):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM Products WHERE id = ?", (product_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+# Результаты checkout()
+CHECKOUT_OK = "ok"
+CHECKOUT_NO_USER = "no_user"
+CHECKOUT_NO_PRODUCT = "no_product"
+CHECKOUT_OUT_OF_STOCK = "out_of_stock"
+CHECKOUT_NO_FUNDS = "no_funds"
+
+def checkout(telegram_id: int, username: str, product_id: int, callback_id: str | None = None):
+    """
+    Покупка товара с баланса одной транзакцией (BEGIN IMMEDIATE).
+    Остаток и баланс меняются условными UPDATE (quantity > 0, balance >= price),
+    поэтому параллельные нажатия не продадут больше, чем есть, и не уведут баланс в минус.
+    callback_id — id нажатия кнопки: повтор того же нажатия (апдейт заново после падения
+    рабочего процесса) ничего не списывает и возвращает уже сделанную покупку.
+    Возвращает (статус, price, name, photo_path, new_balance); при ошибке всё откатывается.
+    """
+    with transaction() as conn:
+        cursor = conn.cursor()
+        if callback_id is not None:
+            cursor.execute("""
+                SELECT p.price, p.name, p.photo_path, u.balance
+                FROM Purchase pu
+                JOIN Products p ON p.id = pu.product_id
+                JOIN Users u ON u.telegram_id = pu.user_id
+                WHERE pu.callback_id = ?
+            """, (callback_id,))
+            done = cursor.fetchone()
+            if done:
+                return (CHECKOUT_OK, *done)
+        cursor.execute("SELECT price, name, photo_path FROM Products WHERE id=?", (product_id,))
+        product = cursor.fetchone()
+        if not product:
+            return CHECKOUT_NO_PRODUCT, None, None, None, None
+        price, name, photo_path = product
+
+        cursor.execute("UPDATE Products SET quantity = quantity - 1 WHERE id=? AND quantity > 0", (product_id,))
+        if cursor.rowcount == 0:
+            return CHECKOUT_OUT_OF_STOCK, price, name, photo_path, None
+
+        cursor.execute(
+            "UPDATE Users SET balance = balance - ? WHERE telegram_id=? AND balance >= ? RETURNING balance",
+            (price, telegram_id, price)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            # Возвращаем списанную единицу товара; commit() после rollback() ничего не делает
+            conn.rollback()
+            cursor.execute("SELECT 1 FROM Users WHERE telegram_id=?", (telegram_id,))
+            status = CHECKOUT_NO_FUNDS if cursor.fetchone() else CHECKOUT_NO_USER
+            return status, price, name, photo_path, None
+
+        cursor.execute("""
+            INSERT INTO Purchase (user_id, username, product_id, date, callback_id)
+            VALUES (?, ?, ?, datetime('now'), ?)
+        """, (telegram_id, username, product_id, callback_id))
+        return CHECKOUT_OK, price, name, photo_path, row[0]
+
+def add_purchase(telegram_id: int, username: str, product_id) -> int:
+    """
+    Записывает заказ в Purchase и возвращает его номер.
+    """
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO Purchase (user_id, username, product_id, date)
+            VALUES (?, ?, ?, datetime('now'))
+        """, (telegram_id, username, product_id))
+        return cursor.lastrowid
+
+def add_payment(telegram_id: int, amount: float, currency: str, screenshot_path: str) -> int:
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO Payments (user_id, amount, currency, status, screenshot_path, date)
+            VALUES (?, ?, ?, ?, ?, datetime('now'))
+        """, (telegram_id, amount, currency, 'pending', screenshot_path))
+        return cursor.lastrowid
+
+def find_payment_by_screenshot(screenshot_path: str):
+    """
+    Последний платёж с этим скриншотом: (payment_id, status) или None.
+    """
+    with connection() as conn:
+        return conn.execute(SQL_FIND_PAYMENT_BY_SCREENSHOT, (screenshot_path,)).fetchone()
+
+def _confirm_payment(conn, payment_id: int):
+    # Статус меняется только из 'pending': повторное нажатие / второй админ получат None
+    row = conn.execute(
+        "UPDATE Payments SET status='confirmed' WHERE id=? AND status='pending' RETURNING user_id, amount",
+        (payment_id,)
+    ).fetchone()
+    if not row:
+        return None
+    user_id, amount = row
+    user_row = conn.execute(
+        "UPDATE Users SET balance = balance + ? WHERE telegram_id=? RETURNING balance",
+        (amount, user_id)
+    ).fetchone()
+    if not user_row:
+        # Зачислять некому — платёж остаётся pending
+        conn.rollback()
+        return user_id, amount, None
+    return user_id, amount, user_row[0]
+
+def _reject_payment(conn, payment_id: int):
+    return conn.execute(
+        "UPDATE Payments SET status='rejected' WHERE id=? AND status='pending' RETURNING user_id, amount",
+        (payment_id,)
+    ).fetchone()
+
+def confirm_payment(payment_id: int):
+    """
+    Подтверждает pending-платёж по id и зачисляет сумму на баланс (одна транзакция).
+    Возвращает None, если платежа нет или он уже обработан, (user_id, amount, None) —
+    если не найден пользователь, иначе (user_id, amount, new_balance).
+    """
+    with transaction() as conn:
+        return _confirm_payment(conn, payment_id)
+
+def reject_payment(payment_id: int):
+    """
+    Отклоняет pending-платёж по id. Возвращает (user_id, amount) или None, если платежа нет
+    или он уже обработан.
+    """
+    with transaction() as conn:
+        return _reject_payment(conn, payment_id)
+
+def list_pending_payments(after_id: int = 0, limit: int = 20) -> list[tuple]:
+    """
+    Страница очереди платежей на проверку: [(id, user_id, amount, currency, date)] с id > after_id.
+    Читается из частичного индекса idx_payments_pending_queue.
+    """
+    with connection() as conn:
+        return conn.execute(SQL_LIST_PENDING_PAYMENTS, (after_id, limit)).fetchall()
+
+def count_pending_payments() -> int:
+    with connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM Payments WHERE status='pending'").fetchone()[0]
+
+def confirm_pending_payment(telegram_id: int, amount: float):
+    """
+    Старый способ (кнопки уже отправленных уведомлений, /confirm <user_id> <amount>):
+    подтверждает последний pending-платёж пользователя на сумму amount.
+    Возвращает None, если платёж не найден, (payment_id, None) — если не найден пользователь,
+    иначе (payment_id, new_balance).
+    """
+    with transaction() as conn:
+        row = conn.execute(SQL_FIND_PENDING_PAYMENT, (telegram_id, amount)).fetchone()
+        if not row:
+            return None
+        payment_id = row[0]
+        result = _confirm_payment(conn, payment_id)
+        return payment_id, result[2] if result else None
+
+def reject_pending_payment(telegram_id: int, amount: float):
+    """
+    Старый способ: отклоняет последний pending-платёж пользователя на сумму amount.
+    Возвращает payment_id или None, если платёж не найден.
+    """
+    with transaction() as conn:
+        row = conn.execute(SQL_FIND_PENDING_PAYMENT, (telegram_id, amount)).fetchone()
+        if not row:
+            return None
+        _reject_payment(conn, row[0])
+        return row[0]
+
+def add_appointment_request(telegram_id: int, product_id, description: str) -> int:
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO appointments_requests (user_id, product_id, description, status, date)
+            VALUES (?, ?, ?, 'pending', datetime('now'))
+            """,
+            (telegram_id, product_id, description)
+        )
+        return cursor.lastrowid
+
+def get_about_stats() -> tuple[int, int]:
+    """
+    Возвращает (количество товаров, количество уникальных категорий) для раздела «О боте».
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        # Оба запроса идут по idx_products_category, а не по строкам Products
+        cursor.execute("SELECT COUNT(*) FROM Products")
+        product_count = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT COUNT(DISTINCT display_name)
+            FROM Categories
+            WHERE EXISTS (SELECT 1 FROM Products p WHERE p.category_id = Categories.id)
+        """)
+        category_count = cursor.fetchone()[0]
+        return product_count, category_count
@@ -0,0 +1,153 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from config import (
+    DB_PATH, DB_POOL_SIZE, DB_BUSY_TIMEOUT,
+    DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_STATEMENT_CACHE
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """
+    Пул долгоживущих соединений SQLite.
+    Соединения открываются лениво (не больше size штук), настраиваются один раз
+    (WAL, synchronous, cache_size, mmap_size) и переиспользуются, поэтому
+    подготовленные выражения остаются в кэше sqlite3 между запросами.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, size: int = DB_POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_BUSY_TIMEOUT,
+            isolation_level=None,          # транзакции открываем явно (см. transaction())
+            check_same_thread=False,       # соединение может переходить между потоками пула
+            cached_statements=DB_STATEMENT_CACHE,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт.")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        # Все соединения заняты — ждём освобождения
+        return self._idle.get(timeout=DB_BUSY_TIMEOUT)
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            # Незавершённая транзакция не должна попасть к следующему пользователю
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    @contextmanager
+    def connection(self):
+        """
+        Соединение в режиме autocommit: каждое чтение — отдельная короткая транзакция.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Транзакция на запись: BEGIN IMMEDIATE сразу берёт RESERVED-блокировку,
+        поэтому конкурирующие писатели ждут busy_timeout, а не падают на COMMIT.
+        """
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+
+_pool: ConnectionPool | None = None
+_pool_pid: int | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Общий пул процесса. После fork() создаётся новый пул —
+    соединения SQLite нельзя разделять между процессами.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+                _pool_pid = pid
+                logger.info("[db_pool] Пул соединений создан: %s, size=%s", DB_PATH, DB_POOL_SIZE)
+    return _pool
+
+
+def close_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.close()
+        _pool = None
+        _pool_pid = None
+
+
+def connection():
+    return get_pool().connection()
+
+
+def transaction():
+    return get_pool().transaction()
@@ -1,6 +1,9 @@
+import logging
 from cryptography.fernet import Fernet
 from config import get_fernet, DEFAULT_DECRYPT_PASSWORD
 
+logger = logging.getLogger(__name__)
+
 def decrypt_admin_data(encrypted_data: bytes, password: str) -> bytes:
     if password != DEFAULT_DECRYPT_PASSWORD:
         raise ValueError("Неверный пароль для дешифрования административных данных.")
@@ -16,3 +19,57 @@ def decrypt_payment_details(encrypted_details: bytes, password: str) -> str:
     f = get_fernet()
     decrypted = f.decrypt(encrypted_details)
     return decrypted.decode("utf-8")
+
+# --- Расшифрованные секреты в памяти ---
+# Расшифровываем один раз при старте (load_secrets), хэндлеры берут готовые значения.
+# reload_secrets() — явный хук для ротации ключа/реквизитов без перезапуска.
+_secrets: dict = {}
+
+def _decrypt_all() -> dict:
+    from config import ADMIN_ID_ENCRYPTED, LTC_PAYMENT_DETAILS_ENCRYPTED, TRX_PAYMENT_DETAILS_ENCRYPTED
+
+    f = get_fernet()  # ключ читается с диска один раз на загрузку
+    secrets = {"admin_id": None, "ltc": None, "trx": None}
+    try:
+        secrets["admin_id"] = int(f.decrypt(ADMIN_ID_ENCRYPTED).decode("utf-8"))
+    except Exception as e:
+        logger.error("Ошибка дешифрования ADMIN_ID: %s", e)
+    for name, encrypted in (("ltc", LTC_PAYMENT_DETAILS_ENCRYPTED), ("trx", TRX_PAYMENT_DETAILS_ENCRYPTED)):
+        try:
+            secrets[name] = f.decrypt(encrypted).decode("utf-8")
+        except Exception as e:
+            logger.error("Ошибка при дешифровании реквизитов %s: %s", name.upper(), e)
+    return secrets
+
+def load_secrets(password: str = DEFAULT_DECRYPT_PASSWORD):
+    """
+    Расшифровывает ADMIN_ID и реквизиты оплаты и держит их в памяти.
+    """
+    global _secrets
+    if password != DEFAULT_DECRYPT_PASSWORD:
+        raise ValueError("Неверный пароль для дешифрования административных данных.")
+    _secrets = _decrypt_all()
+
+def reload_secrets(password: str = DEFAULT_DECRYPT_PASSWORD):
+    """
+    Перечитывает secret.key и заново расшифровывает секреты (после ротации ключа или реквизитов).
+    Новые значения подменяют старые целиком.
+    """
+    load_secrets(password)
+    logger.info("Секреты перезагружены.")
+
+def get_admin_id():
+    """
+    Расшифрованный ADMIN_ID или None, если расшифровать не удалось.
+    """
+    if not _secrets:
+        load_secrets()
+    return _secrets.get("admin_id")
+
+def get_payment_details(name: str):
+    """
+    Расшифрованные реквизиты ("ltc" / "trx") или None, если расшифровать не удалось.
+    """
+    if not _secrets:
+        load_secrets()
+    return _secrets.get(name)
@@ -1,85 +1,100 @@
+import asyncio
 import logging
-import sqlite3
 from aiogram.filters import Command
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 
-from config import DB_PATH
+from repository import (
+    confirm_payment, reject_payment, list_pending_payments, count_pending_payments,
+    confirm_pending_payment, reject_pending_payment,
+)
+from utils.outbox import outbox
+from keyboards.admin_kb import (
+    AdminConfirm, AdminReject, PendingPage, AdminConfirmLegacy, AdminRejectLegacy, pending_payments_kb,
+)
+from keyboards.callbacks import MainMenu
+from utils.callback_table import callbacks
+from encryption import reload_secrets, get_admin_id
+
+logger = logging.getLogger(__name__)
 
 admin_router = Router()
 
+PENDING_PAGE_SIZE = 20
+
+
+async def _notify_confirmed(user_id: int, amount: float, new_balance: float):
+    # Создаём кнопку "К покупкам"
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="К покупкам", callback_data=MainMenu().pack())]]
+    )
+    await outbox.send_message(
+        user_id,
+        text=(
+            f"✅ Ваш платеж на сумму {amount} GEL подтвержден!\n"
+            f"💳 Текущий баланс: {new_balance} GEL"
+        ),
+        reply_markup=keyboard
+    )
+
+
+async def _notify_rejected(user_id: int, amount: float):
+    await outbox.send_message(
+        user_id,
+        text=f"Ваш платеж на сумму {amount}Y отклонен администратором."
+    )
+
+
 #
-# === Команды /confirm /rejectpay (как было ранее) ===
+# === Команды /confirm /rejectpay ===
+# Основной формат — по номеру платежа: /confirm <payment_id>.
+# Старый формат /confirm <user_id> <amount> оставлен для совместимости.
 #
 @admin_router.message(Command("confirm"))
 async def confirm_payment_cmd(message: Message):
     admin_id = admin_router.__dict__.get("SUPER_ADMIN_ID")
-    logging.info(f"Admin command from {message.from_user.id}, SUPER_ADMIN_ID={admin_id}")
+    logger.info("Admin command from %s, SUPER_ADMIN_ID=%s", message.from_user.id, admin_id)
 
     if message.from_user.id != admin_id:
         return
 
     parts = message.text.split()
-    if len(parts) < 3:
-        await message.answer("Usage: /confirm <user_id> <amount>")
+    if len(parts) < 2:
+        await message.answer("Usage: /confirm <payment_id>  (или /confirm <user_id> <amount>)")
         return
 
-    user_id = int(parts[1])
-    amount = float(parts[2])
-
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, status 
-                FROM Payments 
-                WHERE user_id=? AND amount=? AND status='pending'
-                ORDER BY id DESC
-                LIMIT 1
-            """, (user_id, amount))
-            row = cursor.fetchone()
-            if not row:
-                await message.answer("Не найден платеж со статусом 'pending' для этого пользователя и суммы.")
+        if len(parts) == 2:
+            payment_id = int(parts[1])
+            result = await confirm_payment(payment_id)
+            if not result:
+                await message.answer(f"Платеж #{payment_id} не найден или уже обработан.")
                 return
-
-            payment_id, old_status = row
-            cursor.execute("UPDATE Payments SET status='confirmed' WHERE id=?", (payment_id,))
-
-            # Увеличим баланс пользователя на amount
-            cursor.execute("SELECT balance FROM Users WHERE telegram_id=?", (user_id,))
-            user_row = cursor.fetchone()
-            if not user_row:
-                await message.answer("Пользователь не найден в БД.")
+            user_id, amount, new_balance = result
+        else:
+            user_id = int(parts[1])
+            amount = float(parts[2])
+            legacy = await confirm_pending_payment(user_id, amount)
+            if not legacy:
+                await message.answer("Не найден платеж со статусом 'pending' для этого пользователя и суммы.")
                 return
+            payment_id, new_balance = legacy
 
-            old_balance = user_row[0]
-            new_balance = old_balance + amount
-            cursor.execute("UPDATE Users SET balance=? WHERE telegram_id=?", (new_balance, user_id))
-            conn.commit()
-
-        # Создаём кнопку "К покупкам"
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[[InlineKeyboardButton(text="К покупкам", callback_data="back_to_menu")]]
-        )
-
-        # Уведомляем пользователя о подтверждении платежа
-        await message.bot.send_message(
-            chat_id=user_id,
-            text=(
-                f"✅ Ваш платеж на сумму {amount} GEL подтвержден!\n"
-                f"💳 Текущий баланс: {new_balance} GEL"
-            ),
-            reply_markup=keyboard
-        )
+        if new_balance is None:
+            await message.answer("Пользователь не найден в БД.")
+            return
 
+        await _notify_confirmed(user_id, amount, new_balance)
         await message.answer(
             f"Платеж (id={payment_id}) пользователя {user_id} подтвержден. "
             f"Баланс: {new_balance}$"
         )
-        logging.info(f"Payment #{payment_id} confirmed for user_id={user_id}, new_balance={new_balance}")
+        logger.info("Payment #%s confirmed for user_id=%s, new_balance=%s", payment_id, user_id, new_balance)
 
+    except ValueError:
+        await message.answer("Usage: /confirm <payment_id>  (или /confirm <user_id> <amount>)")
     except Exception as e:
-        logging.exception("Ошибка при подтверждении платежа.")
+        logger.exception("Ошибка при подтверждении платежа.")
         await message.answer(f"Ошибка при подтверждении платежа: {str(e)}")
 
 @admin_router.message(Command("rejectpay"))
@@ -89,156 +104,238 @@ async def reject_payment_cmd(message: Message):
         return
 
     parts = message.text.split()
-    if len(parts) < 3:
-        await message.answer("Usage: /rejectpay <user_id> <amount>")
+    if len(parts) < 2:
+        await message.answer("Usage: /rejectpay <payment_id>  (или /rejectpay <user_id> <amount>)")
         return
 
-    user_id = int(parts[1])
-    amount = float(parts[2])
-
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, status
-                FROM Payments
-                WHERE user_id=? AND amount=? AND status='pending'
-                ORDER BY id DESC
-                LIMIT 1
-            """, (user_id, amount))
-            row = cursor.fetchone()
-            if not row:
+        if len(parts) == 2:
+            payment_id = int(parts[1])
+            result = await reject_payment(payment_id)
+            if not result:
+                await message.answer(f"Платеж #{payment_id} не найден или уже обработан.")
+                return
+            user_id, amount = result
+        else:
+            user_id = int(parts[1])
+            amount = float(parts[2])
+            payment_id = await reject_pending_payment(user_id, amount)
+            if not payment_id:
                 await message.answer("Нет платежа 'pending' для этого пользователя и суммы.")
                 return
 
-            payment_id, old_status = row
-            cursor.execute("UPDATE Payments SET status='rejected' WHERE id=?", (payment_id,))
-            conn.commit()
-
         await message.answer(f"Платеж (id={payment_id}) пользователя {user_id} отклонен.")
-        await message.bot.send_message(
-            chat_id=user_id,
-            text=f"Ваш платеж на сумму {amount}Y отклонен администратором."
-        )
-        logging.info(f"Payment #{payment_id} rejected for user_id={user_id}")
+        await _notify_rejected(user_id, amount)
+        logger.info("Payment #%s rejected for user_id=%s", payment_id, user_id)
 
+    except ValueError:
+        await message.answer("Usage: /rejectpay <payment_id>  (или /rejectpay <user_id> <amount>)")
     except Exception as e:
-        logging.exception("Ошибка при отклонении платежа.")
+        logger.exception("Ошибка при отклонении платежа.")
         await message.answer(f"Ошибка при отклонении платежа: {str(e)}")
 
+#
+# === Очередь платежей на проверку: /pending ===
+#
+async def _pending_page(after_id: int = 0):
+    rows = await list_pending_payments(after_id, PENDING_PAGE_SIZE + 1)
+    has_more = len(rows) > PENDING_PAGE_SIZE
+    rows = rows[:PENDING_PAGE_SIZE]
+    if not rows:
+        return "Платежей на проверке нет.", None
+
+    total = await count_pending_payments()
+    lines = [f"🕓 <b>Платежи на проверке: {total}</b>"]
+    for payment_id, user_id, amount, currency, date in rows:
+        lines.append(f"#{payment_id} · <code>{user_id}</code> · {amount} GEL · {currency} · {date}")
+    next_after_id = rows[-1][0] if has_more else None
+    return "\n".join(lines), pending_payments_kb([row[0] for row in rows], next_after_id)
+
+@admin_router.message(Command("pending"))
+async def pending_payments_cmd(message: Message):
+    admin_id = admin_router.__dict__.get("SUPER_ADMIN_ID")
+    if message.from_user.id != admin_id:
+        return
+
+    text, markup = await _pending_page()
+    await message.answer(text, parse_mode="HTML", reply_markup=markup)
+
+@callbacks(PendingPage)
+async def pending_page_callback(call: CallbackQuery, callback_data: PendingPage):
+    admin_id = admin_router.__dict__.get("SUPER_ADMIN_ID")
+    if call.from_user.id != admin_id:
+        return call.answer()
+
+    text, markup = await _pending_page(callback_data.after_id)
+    await call.message.answer(text, parse_mode="HTML", reply_markup=markup)
+    return call.answer()
+
 #
 # === Обработка инлайн-кнопок "Подтвердить платеж" и "Отклонить платеж" ===
-# (callback_data="admin_confirm_<user_id>_<amount>" / "admin_reject_<user_id>_<amount>")
+# (callback_data="admin_confirm:<payment_id>" / "admin_reject:<payment_id>", см. keyboards/admin_kb.py)
 #
 
-@admin_router.callback_query(F.data.startswith("admin_confirm_"))
-async def admin_confirm_callback(call: CallbackQuery):
+@callbacks(AdminConfirm)
+async def admin_confirm_callback(call: CallbackQuery, callback_data: AdminConfirm):
     admin_id = admin_router.__dict__.get("SUPER_ADMIN_ID")
     if call.from_user.id != admin_id:
         # Не админ — игнорируем
-        await call.answer()
-        return
+        return call.answer()
 
+    payment_id = callback_data.payment_id
     try:
-        # Формат: "admin_confirm_<user_id>_<amount>"
-        parts = call.data.split("_")
-        user_id = int(parts[2])
-        amount = float(parts[3])
-
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, status 
-                FROM Payments
-                WHERE user_id=? AND amount=? AND status='pending'
-                ORDER BY id DESC
-                LIMIT 1
-            """, (user_id, amount))
-            row = cursor.fetchone()
-            if not row:
-                await call.message.answer("Не найден платеж со статусом 'pending' для этого пользователя и суммы.")
-                await call.answer()
-                return
+        # Переход pending -> confirmed и зачисление на баланс (одна транзакция)
+        result = await confirm_payment(payment_id)
+        if not result:
+            await call.answer(f"Платеж #{payment_id} не найден или уже обработан.", show_alert=True)
+            return
+
+        user_id, amount, new_balance = result
+        if new_balance is None:
+            await call.message.answer("Пользователь не найден в БД.")
+            return call.answer()
+
+        await _notify_confirmed(user_id, amount, new_balance)
+        await call.message.answer(
+            f"Платеж (id={payment_id}) пользователя {user_id} подтвержден. Баланс: {new_balance}$"
+        )
+        logger.info("[Inline] Payment #%s confirmed for user_id=%s, new_balance=%s", payment_id, user_id, new_balance)
 
-            payment_id, old_status = row
-            cursor.execute("UPDATE Payments SET status='confirmed' WHERE id=?", (payment_id,))
+    except Exception as e:
+        logger.exception("Ошибка при инлайн-подтверждении платежа (confirm).")
+        await call.message.answer(f"Ошибка при подтверждении платежа: {str(e)}")
 
-            # Увеличиваем баланс
-            cursor.execute("SELECT balance FROM Users WHERE telegram_id=?", (user_id,))
-            user_row = cursor.fetchone()
-            if not user_row:
-                await call.message.answer("Пользователь не найден в БД.")
-                await call.answer()
-                return
+    return call.answer()
+
+@callbacks(AdminReject)
+async def admin_reject_callback(call: CallbackQuery, callback_data: AdminReject):
+    admin_id = admin_router.__dict__.get("SUPER_ADMIN_ID")
+    if call.from_user.id != admin_id:
+        return call.answer()
 
-            old_balance = user_row[0]
-            new_balance = old_balance + amount
-            cursor.execute("UPDATE Users SET balance=? WHERE telegram_id=?", (new_balance, user_id))
-            conn.commit()
+    payment_id = callback_data.payment_id
+    try:
+        result = await reject_payment(payment_id)
+        if not result:
+            await call.answer(f"Платеж #{payment_id} не найден или уже обработан.", show_alert=True)
+            return
 
-        # Уведомляем пользователя
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[[InlineKeyboardButton(text="К покупкам", callback_data="back_to_menu")]]
-        )
-        await call.bot.send_message(
-            chat_id=user_id,
-            text=(f"✅ Ваш платеж на сумму {amount} GEL подтвержден!\n"
-                  f"💳 Текущий баланс: {new_balance} GEL"),
-            reply_markup=keyboard
-        )
+        user_id, amount = result
+        await call.message.answer(f"Платеж (id={payment_id}) пользователя {user_id} отклонён.")
+        await _notify_rejected(user_id, amount)
+        logger.info("[Inline] Payment #%s rejected for user_id=%s", payment_id, user_id)
 
+    except Exception as e:
+        logger.exception("Ошибка при инлайн-отклонении платежа (reject).")
+        await call.message.answer(f"Ошибка при отклонении платежа: {str(e)}")
+
+    return call.answer()
+
+#
+# Кнопки старого формата "admin_confirm_<user_id>_<amount>" в уже отправленных уведомлениях
+#
+def _parse_legacy_payment(rest: str) -> dict:
+    user_id, amount = rest.split("_", 1)
+    return {"user_id": user_id, "amount": amount}
+
+callbacks.legacy("admin_confirm_", AdminConfirmLegacy, _parse_legacy_payment)
+callbacks.legacy("admin_reject_", AdminRejectLegacy, _parse_legacy_payment)
+
+@callbacks(AdminConfirmLegacy)
+async def admin_confirm_legacy_callback(call: CallbackQuery, callback_data: AdminConfirmLegacy):
+    admin_id = admin_router.__dict__.get("SUPER_ADMIN_ID")
+    if call.from_user.id != admin_id:
+        return call.answer()
+
+    try:
+        user_id = callback_data.user_id
+        amount = callback_data.amount
+
+        result = await confirm_pending_payment(user_id, amount)
+        if not result:
+            await call.answer("Не найден платеж со статусом 'pending' для этого пользователя и суммы.", show_alert=True)
+            return
+
+        payment_id, new_balance = result
+        if new_balance is None:
+            await call.message.answer("Пользователь не найден в БД.")
+            return call.answer()
+
+        await _notify_confirmed(user_id, amount, new_balance)
         await call.message.answer(
             f"Платеж (id={payment_id}) пользователя {user_id} подтвержден. Баланс: {new_balance}$"
         )
-        logging.info(f"[Inline] Payment #{payment_id} confirmed for user_id={user_id}, new_balance={new_balance}")
+        logger.info("[Inline] Payment #%s confirmed for user_id=%s, new_balance=%s", payment_id, user_id, new_balance)
 
     except Exception as e:
-        logging.exception("Ошибка при инлайн-подтверждении платежа (confirm).")
+        logger.exception("Ошибка при инлайн-подтверждении платежа (confirm).")
         await call.message.answer(f"Ошибка при подтверждении платежа: {str(e)}")
 
-    await call.answer()
+    return call.answer()
 
-@admin_router.callback_query(F.data.startswith("admin_reject_"))
-async def admin_reject_callback(call: CallbackQuery):
+@callbacks(AdminRejectLegacy)
+async def admin_reject_legacy_callback(call: CallbackQuery, callback_data: AdminRejectLegacy):
     admin_id = admin_router.__dict__.get("SUPER_ADMIN_ID")
     if call.from_user.id != admin_id:
-        await call.answer()
-        return
+        return call.answer()
 
     try:
-        parts = call.data.split("_")
-        user_id = int(parts[2])
-        amount = float(parts[3])
-
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, status
-                FROM Payments
-                WHERE user_id=? AND amount=? AND status='pending'
-                ORDER BY id DESC
-                LIMIT 1
-            """, (user_id, amount))
-            row = cursor.fetchone()
-            if not row:
-                await call.message.answer("Нет платежа 'pending' для этого пользователя и суммы.")
-                await call.answer()
-                return
+        user_id = callback_data.user_id
+        amount = callback_data.amount
 
-            payment_id, old_status = row
-            cursor.execute("UPDATE Payments SET status='rejected' WHERE id=?", (payment_id,))
-            conn.commit()
+        payment_id = await reject_pending_payment(user_id, amount)
+        if not payment_id:
+            await call.answer("Нет платежа 'pending' для этого пользователя и суммы.", show_alert=True)
+            return
 
         await call.message.answer(f"Платеж (id={payment_id}) пользователя {user_id} отклонён.")
-        await call.bot.send_message(
-            chat_id=user_id,
-            text=f"Ваш платеж на сумму {amount}Y отклонен администратором."
-        )
-        logging.info(f"[Inline] Payment #{payment_id} rejected for user_id={user_id}")
+        await _notify_rejected(user_id, amount)
+        logger.info("[Inline] Payment #%s rejected for user_id=%s", payment_id, user_id)
 
     except Exception as e:
-        logging.exception("Ошибка при инлайн-отклонении платежа (reject).")
+        logger.exception("Ошибка при инлайн-отклонении платежа (reject).")
         await call.message.answer(f"Ошибка при отклонении платежа: {str(e)}")
 
-    await call.answer()
+    return call.answer()
+
+
+#
+# === /outbox — состояние очереди уведомлений ===
+#
+@admin_router.message(Command("outbox"))
+async def outbox_stats_cmd(message: Message):
+    admin_id = admin_router.__dict__.get("SUPER_ADMIN_ID")
+    if message.from_user.id != admin_id:
+        return
+
+    stats = outbox.stats()
+    avg = stats["delivery_seconds_sum"] / stats["sent"] if stats["sent"] else 0.0
+    await message.answer(
+        f"📬 Очередь уведомлений\n"
+        f"В очереди: {stats['queued']}, отправляется: {stats['in_flight']}\n"
+        f"Поставлено: {stats['enqueued']}, доставлено: {stats['sent']}, не доставлено: {stats['failed']}\n"
+        f"Повторов: {stats['retried']}, из них flood control: {stats['rate_limited']}\n"
+        f"Задержка доставки: средняя {avg:.2f} c, максимальная {stats['delivery_seconds_max']:.2f} c"
+    )
+
+#
+# === /reloadsecrets — перечитать secret.key и заново расшифровать ADMIN_ID и реквизиты ===
+#
+@admin_router.message(Command("reloadsecrets"))
+async def reload_secrets_cmd(message: Message):
+    admin_id = admin_router.__dict__.get("SUPER_ADMIN_ID")
+    if message.from_user.id != admin_id:
+        return
+
+    try:
+        # Чтение ключа и расшифровка — вне event loop
+        await asyncio.to_thread(reload_secrets)
+    except Exception as e:
+        logger.exception("Ошибка при перезагрузке секретов.")
+        await message.answer(f"Ошибка при перезагрузке секретов: {str(e)}")
+        return
 
+    new_admin_id = get_admin_id()
+    if new_admin_id is not None:
+        admin_router.__dict__["SUPER_ADMIN_ID"] = new_admin_id
+    await message.answer("Секреты перезагружены.")
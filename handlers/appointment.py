@@ -1,18 +1,21 @@
 import logging
-import sqlite3
 import os
 
-from aiogram import Router, F
-from aiogram.types import CallbackQuery, Message, FSInputFile
+from aiogram import Router
+from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from pathlib import Path
 
-from config import DB_PATH, ADMIN_ID_ENCRYPTED, DEFAULT_DECRYPT_PASSWORD
-from encryption import decrypt_admin_data
-from database import get_user_by_telegram_id
-from handlers.start import show_main_menu  # Функция для отображения главного меню
+from encryption import get_admin_id
+from repository import get_product_name, add_appointment_request
+from utils.media import send_photo
+from utils.outbox import outbox
+from utils.callback_table import callbacks
+from keyboards.callbacks import MainMenu, RequestService, AppointmentEdit, AppointmentCancel, ConfirmAppointment
+
+logger = logging.getLogger(__name__)
 
 appointment_router = Router()
 
@@ -20,30 +23,25 @@ class AppointmentFSM(StatesGroup):
     waiting_description = State()
     waiting_confirmation = State()
 
-@appointment_router.callback_query(F.data.startswith("request_service_"))
-async def start_service_appointment(call: CallbackQuery, state: FSMContext):
+callbacks.legacy("request_service_", RequestService, lambda rest: {"product_id": rest})
+
+@callbacks(RequestService)
+async def start_service_appointment(call: CallbackQuery, state: FSMContext, callback_data: RequestService):
     """
-    Пользователь нажал кнопку «Оставить заявку» для услуги.
-    Callback_data: "request_service_{product_id}"
+    Пользователь нажал кнопку «Оставить заявку» для услуги (RequestService).
     Получаем product_id и через запрос в БД – название услуги.
     Затем отправляем запрос с текстом, в который встроено название услуги,
     и добавляем кнопку «Отмена» для выхода из процесса заявки.
     """
-    data_parts = call.data.split("_", 2)
-    product_id = data_parts[2]
-    logging.info(f"[start_service_appointment] product_id={product_id}")
+    product_id = callback_data.product_id
+    logger.debug("[start_service_appointment] product_id=%s", product_id)
 
     # Запрашиваем имя услуги из таблицы Products
     service_name = None
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM Products WHERE id = ?", (product_id,))
-            row = cursor.fetchone()
-            if row:
-                service_name = row[0]
+        service_name = await get_product_name(product_id)
     except Exception as e:
-        logging.exception("Ошибка при получении имени услуги")
+        logger.exception("Ошибка при получении имени услуги")
         service_name = "Услуга"
 
     # Сохраняем product_id и service_name в FSM
@@ -51,7 +49,7 @@ async def start_service_appointment(call: CallbackQuery, state: FSMContext):
 
     # Формируем клавиатуру с кнопкой "Отмена"
     kb = InlineKeyboardBuilder()
-    kb.button(text="Отмена", callback_data="appointment_cancel")
+    kb.button(text="Отмена", callback_data=AppointmentCancel())
     kb.adjust(1)
 
     text_prompt = (
@@ -64,9 +62,9 @@ async def start_service_appointment(call: CallbackQuery, state: FSMContext):
     try:
         await call.message.edit_text(text=text_prompt, reply_markup=kb.as_markup())
     except Exception as e:
-        logging.error(f"Ошибка редактирования сообщения: {e}")
+        logger.error("Ошибка редактирования сообщения: %s", e)
         await call.message.answer(text=text_prompt, reply_markup=kb.as_markup())
-    await call.answer()
+    return call.answer()
 
 @appointment_router.message(AppointmentFSM.waiting_description)
 async def handle_user_description(message: Message, state: FSMContext):
@@ -80,9 +78,9 @@ async def handle_user_description(message: Message, state: FSMContext):
     await state.update_data(description=user_description)
 
     kb = InlineKeyboardBuilder()
-    kb.button(text="Подтвердить", callback_data="confirm_appointment")
-    kb.button(text="Редактировать", callback_data="appointment_edit")
-    kb.button(text="Отмена", callback_data="appointment_cancel")
+    kb.button(text="Подтвердить", callback_data=ConfirmAppointment())
+    kb.button(text="Редактировать", callback_data=AppointmentEdit())
+    kb.button(text="Отмена", callback_data=AppointmentCancel())
     kb.adjust(1)
 
     text_confirm = (
@@ -95,7 +93,7 @@ async def handle_user_description(message: Message, state: FSMContext):
     await state.set_state(AppointmentFSM.waiting_confirmation)
     await message.answer(text_confirm, reply_markup=kb.as_markup())
 
-@appointment_router.callback_query(AppointmentFSM.waiting_confirmation, F.data == "appointment_edit")
+@callbacks(AppointmentEdit, AppointmentFSM.waiting_confirmation)
 async def edit_appointment_description(call: CallbackQuery, state: FSMContext):
     """
     Кнопка «Редактировать»: позволяет изменить введённый текст заявки.
@@ -104,13 +102,13 @@ async def edit_appointment_description(call: CallbackQuery, state: FSMContext):
     await state.set_state(AppointmentFSM.waiting_description)
     try:
         await call.message.edit_text(prompt_text)
-        logging.info("Описание заявки успешно отредактировано.")
+        logger.info("Описание заявки успешно отредактировано.")
     except Exception as e:
-        logging.error(f"Ошибка редактирования сообщения: {e}")
+        logger.error("Ошибка редактирования сообщения: %s", e)
         await call.message.answer(prompt_text)
-    await call.answer()
+    return call.answer()
 #Отмена и возврат к стартовому меню 
-@appointment_router.callback_query(F.data == "appointment_cancel")
+@callbacks(AppointmentCancel)
 async def cancel_appointment(call: CallbackQuery, state: FSMContext):
     """
     Кнопка «Отмена»: отменяет заявку и возвращает пользователя в главное меню.
@@ -121,28 +119,28 @@ async def cancel_appointment(call: CallbackQuery, state: FSMContext):
     
     # Формируем клавиатуру с кнопкой "⬅️ В главное меню"
     kb = InlineKeyboardBuilder()
-    kb.button(text="⬅️ В главное меню", callback_data="back_to_menu")
+    kb.button(text="⬅️ В главное меню", callback_data=MainMenu())
     kb.adjust(1)
     
     # Определяем путь к приветственному фото
     welcome_photo_path = Path(__file__).parent.parent / "data" / "welcome.jpg"
     try:
-        photo_file = FSInputFile(str(welcome_photo_path))
         # Отправляем фото с подписью (например, можно задать текст "Возврат в главное меню")
-        await call.message.answer_photo(
-            photo=photo_file,
+        await send_photo(
+            call.message.answer_photo,
+            welcome_photo_path,
             caption="Возврат в главное меню",
             parse_mode="HTML",
             reply_markup=kb.as_markup()
         )
     except Exception as e:
-        logging.error(f"Ошибка отправки фото в appointment_cancel: {e}")
+        logger.error("Ошибка отправки фото в appointment_cancel: %s", e)
         await call.message.answer(
             "Возврат в главное меню",
             reply_markup=kb.as_markup()
         )
-    await call.answer()
-@appointment_router.callback_query(AppointmentFSM.waiting_confirmation, F.data == "confirm_appointment")
+    return call.answer()
+@callbacks(ConfirmAppointment, AppointmentFSM.waiting_confirmation)
 async def confirm_appointment_callback(call: CallbackQuery, state: FSMContext):
     """
     Пользователь подтверждает заявку.
@@ -155,29 +153,14 @@ async def confirm_appointment_callback(call: CallbackQuery, state: FSMContext):
     user_description = data.get("description", "")
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO appointments_requests (user_id, product_id, description, status, date)
-                VALUES (?, ?, ?, 'pending', datetime('now'))
-                """,
-                (call.from_user.id, product_id, user_description)
-            )
-            conn.commit()
-            appointment_id = cursor.lastrowid
+        appointment_id = await add_appointment_request(call.from_user.id, product_id, user_description)
     except Exception as e:
-        logging.exception("Ошибка при сохранении заявки в БД.")
+        logger.exception("Ошибка при сохранении заявки в БД.")
         await call.message.answer("Ошибка при сохранении заявки. Попробуйте позже.")
         await state.clear()
         return
 
-    try:
-        admin_id_decrypted = decrypt_admin_data(ADMIN_ID_ENCRYPTED, DEFAULT_DECRYPT_PASSWORD)
-        admin_id = int(admin_id_decrypted.decode("utf-8"))
-    except Exception as e:
-        logging.error(f"[confirm_appointment_callback] Ошибка дешифрования ADMIN_ID: {e}")
-        admin_id = None
+    admin_id = get_admin_id()  # расшифрован один раз при старте
 
     if admin_id:
         try:
@@ -189,18 +172,18 @@ async def confirm_appointment_callback(call: CallbackQuery, state: FSMContext):
                 f"Appointment ID: {appointment_id}\n\n"
                 f"Сообщение:\n{user_description}"
             )
-            await call.message.bot.send_message(chat_id=admin_id, text=text_for_admin)
+            await outbox.send_message(admin_id, text_for_admin)
         except Exception as e:
-            logging.exception(f"Ошибка при отправке заявки админу: {e}")
+            logger.exception("Ошибка при отправке заявки админу: %s", e)
     else:
-        logging.error("Администратор не задан (admin_id is None).")
+        logger.error("Администратор не задан (admin_id is None).")
 
     kb_user = InlineKeyboardBuilder()
-    kb_user.button(text="В главное меню", callback_data="back_to_menu")
+    kb_user.button(text="В главное меню", callback_data=MainMenu())
     kb_user.adjust(1)
     await call.message.answer(
         f"Ваша заявка на услугу «{service_name}» принята! Мы свяжемся с вами в рабочее время.",
         reply_markup=kb_user.as_markup()
     )
     await state.clear()
-    await call.answer()
+    return call.answer()
@@ -1,19 +1,26 @@
-import os
 import logging
-import sqlite3
 
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.types import InlineKeyboardButton, FSInputFile
+from aiogram.types import InlineKeyboardButton
 
-from config import DB_PATH, DEFAULT_DECRYPT_PASSWORD
-from config import LTC_PAYMENT_DETAILS_ENCRYPTED, TRX_PAYMENT_DETAILS_ENCRYPTED
-from encryption import decrypt_payment_details, decrypt_admin_data
-from database import get_rate
+from encryption import get_payment_details, get_admin_id
+from repository import get_rate, add_payment, find_payment_by_screenshot
 from utils.helpers import format_float
+from utils.screenshots import save_screenshot
+from utils.outbox import outbox
+from keyboards.cache import keyboard_cache
+from keyboards.admin_kb import payment_review_kb
+from keyboards.callbacks import (
+    MainMenu, TopUpBalance, TopUpAmount, EnterCustomAmount, BackToAmountList, TopUpCurrency,
+    PaymentDone, TopUpBack, BackToAmount, BackToCurrency, BackToConfirm,
+)
+from utils.callback_table import callbacks
+
+logger = logging.getLogger(__name__)
 
 balance_router = Router()
 
@@ -25,38 +32,50 @@ class BalanceFSM(StatesGroup):
     wait_screenshot = State()
 
 def kb_amounts():
-    kb = InlineKeyboardBuilder()
-    kb.button(text="50 Gel", callback_data="amount_30")
-    kb.button(text="100 Gel", callback_data="amount_90")
-    kb.button(text="150 Gel", callback_data="amount_180")
-    kb.button(text="Указать свою сумму", callback_data="enter_custom_amount")
-    kb.button(text="Назад", callback_data="back_main")
-    kb.adjust(1)
-    return kb.as_markup()
+    def build():
+        kb = InlineKeyboardBuilder()
+        kb.button(text="50 Gel", callback_data=TopUpAmount(value=30))
+        kb.button(text="100 Gel", callback_data=TopUpAmount(value=90))
+        kb.button(text="150 Gel", callback_data=TopUpAmount(value=180))
+        kb.button(text="Указать свою сумму", callback_data=EnterCustomAmount())
+        kb.button(text="Назад", callback_data=TopUpBack())
+        kb.adjust(1)
+        return kb.as_markup()
+    return keyboard_cache.get("kb_amounts", None, build)
 
 def kb_currencies():
-    kb = InlineKeyboardBuilder()
-    kb.button(text="Credo Bank (C2C)", callback_data="currency_dollar")
-    kb.button(text="Tron (TRX)", callback_data="currency_euro")
-    kb.button(text="Назад", callback_data="back_to_amount")
-    kb.adjust(1)
-    return kb.as_markup()
+    def build():
+        kb = InlineKeyboardBuilder()
+        kb.button(text="Credo Bank (C2C)", callback_data=TopUpCurrency(code="dollar"))
+        kb.button(text="Tron (TRX)", callback_data=TopUpCurrency(code="euro"))
+        kb.button(text="Назад", callback_data=BackToAmount())
+        kb.adjust(1)
+        return kb.as_markup()
+    return keyboard_cache.get("kb_currencies", None, build)
 
 def kb_confirm_or_back():
-    kb = InlineKeyboardBuilder()
-    kb.button(text="Оплачено", callback_data="confirm_done")
-    kb.button(text="Назад", callback_data="back_to_currency")
-    kb.adjust(1)
-    return kb.as_markup()
+    def build():
+        kb = InlineKeyboardBuilder()
+        kb.button(text="Оплачено", callback_data=PaymentDone())
+        kb.button(text="Назад", callback_data=BackToCurrency())
+        kb.adjust(1)
+        return kb.as_markup()
+    return keyboard_cache.get("kb_confirm_or_back", None, build)
 
 def kb_wait_screenshot():
-    kb = InlineKeyboardBuilder()
-    kb.button(text="Назад", callback_data="back_to_confirm")
-    kb.adjust(1)
-    return kb.as_markup()
+    def build():
+        kb = InlineKeyboardBuilder()
+        kb.button(text="Назад", callback_data=BackToConfirm())
+        kb.adjust(1)
+        return kb.as_markup()
+    return keyboard_cache.get("kb_wait_screenshot", None, build)
+
 
+callbacks.legacy("amount_", TopUpAmount, lambda rest: {"value": rest})
+callbacks.legacy("currency_", TopUpCurrency, lambda rest: {"code": rest})
 
-@balance_router.callback_query(F.data == "topup_balance")
+
+@callbacks(TopUpBalance)
 async def on_start_topup(call: CallbackQuery, state: FSMContext):
     await state.set_state(BalanceFSM.choosing_amount)
     await call.message.edit_text(
@@ -65,9 +84,9 @@ async def on_start_topup(call: CallbackQuery, state: FSMContext):
     )
 
 
-@balance_router.callback_query(BalanceFSM.choosing_amount, F.data.startswith("amount_"))
-async def on_amount_chosen(call: CallbackQuery, state: FSMContext):
-    amount_y = int(call.data.split("_")[1])
+@callbacks(TopUpAmount, BalanceFSM.choosing_amount)
+async def on_amount_chosen(call: CallbackQuery, state: FSMContext, callback_data: TopUpAmount):
+    amount_y = callback_data.value
     await state.update_data(amount=amount_y)
     await state.set_state(BalanceFSM.choosing_currency)
     await call.message.edit_text(
@@ -79,34 +98,34 @@ async def on_amount_chosen(call: CallbackQuery, state: FSMContext):
 #
 # Новый обработчик: Пользователь выбрал "Указать свою сумму"
 #
-@balance_router.callback_query(BalanceFSM.choosing_amount, F.data == "enter_custom_amount")
+@callbacks(EnterCustomAmount, BalanceFSM.choosing_amount)
 async def on_enter_custom_amount(call: CallbackQuery, state: FSMContext):
     """
     Переводим бота в состояние ручного ввода суммы.
     """
     await state.set_state(BalanceFSM.entering_custom_amount)
     kb = InlineKeyboardBuilder()
-    kb.button(text="Назад", callback_data="back_to_amount_list")
+    kb.button(text="Назад", callback_data=BackToAmountList())
     kb.adjust(1)
 
     await call.message.edit_text(
         text="Введите сумму в GEL (только число). Минимальная сумма пополнения 10 GEL",
         reply_markup=kb.as_markup()
     )
-    await call.answer()
+    return call.answer()
 
 
 #
 # Обработчик "Назад" из состояния ручного ввода
 #
-@balance_router.callback_query(BalanceFSM.entering_custom_amount, F.data == "back_to_amount_list")
+@callbacks(BackToAmountList, BalanceFSM.entering_custom_amount)
 async def back_to_amount_list(call: CallbackQuery, state: FSMContext):
     await state.set_state(BalanceFSM.choosing_amount)
     await call.message.edit_text(
         text="Выберите сумму пополнения (GEL):",
         reply_markup=kb_amounts()
     )
-    await call.answer()
+    return call.answer()
 
 
 #
@@ -134,28 +153,27 @@ async def handle_custom_amount(message: Message, state: FSMContext):
     )
 
 
-@balance_router.callback_query(BalanceFSM.choosing_currency, F.data.startswith("currency_"))
-async def on_currency_chosen(call: CallbackQuery, state: FSMContext):
-    currency_code = call.data.split("_")[1]  # "dollar" или "euro"
+@callbacks(TopUpCurrency, BalanceFSM.choosing_currency)
+async def on_currency_chosen(call: CallbackQuery, state: FSMContext, callback_data: TopUpCurrency):
+    currency_code = callback_data.code  # "dollar" или "euro"
     data = await state.get_data()
     amount_y = data.get("amount", 0)
 
     if currency_code == "dollar":
-        rate = get_rate("USD")
+        rate = await get_rate("USD")
         currency_str = "Credo Bank (C2C)"
-        encrypted_details = LTC_PAYMENT_DETAILS_ENCRYPTED
+        details_name = "ltc"
     else:
-        rate = get_rate("EUR")
+        rate = await get_rate("EUR")
         currency_str = "Tron (TRX)"
-        encrypted_details = TRX_PAYMENT_DETAILS_ENCRYPTED
+        details_name = "trx"
 
     total = amount_y * rate
     await state.update_data(currency=currency_str, total=total)
 
-    try:
-        payment_details = decrypt_payment_details(encrypted_details, DEFAULT_DECRYPT_PASSWORD)
-    except Exception as e:
-        logging.error(f"Ошибка при дешифровании реквизитов: {e}")
+    # Реквизиты расшифрованы один раз при старте; None — расшифровать не удалось
+    payment_details = get_payment_details(details_name)
+    if payment_details is None:
         payment_details = "Реквизиты недоступны, свяжитесь с администратором."
 
     await state.set_state(BalanceFSM.confirm_payment)
@@ -171,7 +189,7 @@ async def on_currency_chosen(call: CallbackQuery, state: FSMContext):
     )
 
 
-@balance_router.callback_query(BalanceFSM.confirm_payment, F.data == "confirm_done")
+@callbacks(PaymentDone, BalanceFSM.confirm_payment)
 async def on_confirm_done(call: CallbackQuery, state: FSMContext):
     await state.set_state(BalanceFSM.wait_screenshot)
     await call.message.edit_text(
@@ -184,76 +202,53 @@ async def on_confirm_done(call: CallbackQuery, state: FSMContext):
 async def handle_screenshot(message: Message, state: FSMContext):
     try:
         photo = message.photo[-1]
-        file_id = photo.file_id
-        file_info = await message.bot.get_file(file_id)
-        file_bytes = await message.bot.download_file(file_info.file_path)
-
-        screenshot_path = f"data/payments/{message.from_user.id}_{photo.file_unique_id}.jpg"
-        os.makedirs(os.path.dirname(screenshot_path), exist_ok=True)
-
-        with open(screenshot_path, "wb") as f:
-            f.write(file_bytes.getvalue())
+        # Потоковая загрузка на диск; тот же файл (тот же file_unique_id) повторно не скачивается
+        screenshot_path = await save_screenshot(message.bot, photo)
+
+        existing = await find_payment_by_screenshot(screenshot_path)
+        if existing:
+            payment_id, status = existing
+            await message.answer(
+                f"Этот скриншот уже отправлен (платёж #{payment_id}, статус: {status}). "
+                "Если вы оплатили ещё раз, пришлите скриншот нового платежа."
+            )
+            logger.info("Повторный скриншот платежа #%s от user_id=%s", payment_id, message.from_user.id)
+            return
 
         data = await state.get_data()
         amount_y = data.get("amount", 0.0)
         currency = data.get("currency", "USD")
 
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO Payments (user_id, amount, currency, status, screenshot_path, date)
-                VALUES (?, ?, ?, ?, ?, datetime('now'))
-            """, (message.from_user.id, amount_y, currency, 'pending', screenshot_path))
-            conn.commit()
+        payment_id = await add_payment(message.from_user.id, amount_y, currency, screenshot_path)
 
         await message.answer("Скриншот получен и отправлен администратору на проверку.")
-        logging.info(f"Платёж в ожидании: user_id={message.from_user.id}, amount={amount_y}, currency={currency}")
+        logger.info("Платёж в ожидании: user_id=%s, amount=%s, currency=%s", message.from_user.id, amount_y, currency)
 
-        # Получаем admin_id через дешифрование
-        from config import ADMIN_ID_ENCRYPTED
-        from encryption import decrypt_admin_data
-
-        try:
-            admin_id_decrypted = decrypt_admin_data(ADMIN_ID_ENCRYPTED, DEFAULT_DECRYPT_PASSWORD)
-            admin_id = int(admin_id_decrypted.decode("utf-8"))
-        except Exception as e:
-            logging.error(f"Ошибка дешифрования ADMIN_ID: {e}")
-            admin_id = None
+        admin_id = get_admin_id()  # расшифрован один раз при старте (encryption.load_secrets)
 
         if admin_id:
             try:
-                fs_file = FSInputFile(screenshot_path)
-                admin_kb = InlineKeyboardBuilder()
-                admin_kb.button(
-                    text="Подтвердить платеж",
-                    callback_data=f"admin_confirm_{message.from_user.id}_{amount_y}"
-                )
-                admin_kb.button(
-                    text="Отклонить платеж",
-                    callback_data=f"admin_reject_{message.from_user.id}_{amount_y}"
-                )
-                admin_kb.adjust(1)
-
-                await message.bot.send_photo(
-                    chat_id=admin_id,
-                    photo=fs_file,
+                # Фото уже на серверах Telegram — пересылаем по file_id, без повторной загрузки
+                await outbox.send_photo(
+                    admin_id,
+                    photo=photo.file_id,
                     caption=(
-                        f"🆕 <b>Новый платёж!</b>\n"
+                        f"🆕 <b>Новый платёж #{payment_id}!</b>\n"
                         f"👤 Пользователь: <b>{message.from_user.full_name}</b>\n"
                         f"🔢 User ID: <code>{message.from_user.id}</code>\n"
                         f"💰 Сумма: <b>{amount_y} GEL</b>\n"
                         f"💱 Валюта: <b>{currency}</b>"
                     ),
                     parse_mode="HTML",
-                    reply_markup=admin_kb.as_markup()
+                    reply_markup=payment_review_kb(payment_id)
                 )
             except Exception as e:
-                logging.exception(f"Ошибка при отправке уведомления администратору: {e}")
+                logger.exception("Ошибка при отправке уведомления администратору: %s", e)
         else:
-            logging.error("Администратор не задан (admin_id is None).")
+            logger.error("Администратор не задан (admin_id is None).")
 
     except Exception as e:
-        logging.exception("Ошибка при обработке скриншота или записи в БД.")
+        logger.exception("Ошибка при обработке скриншота или записи в БД.")
         await message.answer("Произошла ошибка при загрузке скриншота. Повторите попытку или свяжитесь с администратором.")
 
     await state.clear()
@@ -261,7 +256,7 @@ async def handle_screenshot(message: Message, state: FSMContext):
 #
 # ---- Кнопки "Назад" ----
 #
-@balance_router.callback_query(BalanceFSM.choosing_amount, F.data == "back_main")
+@callbacks(TopUpBack, BalanceFSM.choosing_amount)
 async def back_to_previous_step(call: CallbackQuery, state: FSMContext):
     """
     Возвращает пользователя на предыдущий шаг (к выбору оплаты или пополнения баланса).
@@ -269,8 +264,8 @@ async def back_to_previous_step(call: CallbackQuery, state: FSMContext):
     await state.clear()
     kb = InlineKeyboardBuilder()
     kb.button(text="Оплатить с баланса", callback_data="pay_balance")
-    kb.button(text="Пополнить баланс", callback_data="topup_balance")
-    kb.button(text="⬅️ В главное меню", callback_data="back_to_main_menu")
+    kb.button(text="Пополнить баланс", callback_data=TopUpBalance())
+    kb.button(text="⬅️ В главное меню", callback_data=MainMenu())
     kb.adjust(1)
 
     await call.message.edit_text(
@@ -279,29 +274,7 @@ async def back_to_previous_step(call: CallbackQuery, state: FSMContext):
     )
 
 
-@balance_router.callback_query(F.data == "back_to_main_menu")
-async def back_to_main_menu(call: CallbackQuery, state: FSMContext):
-    """
-    Полностью выходит из взаимодействия и отправляет главное меню.
-    """
-    await state.clear()
-    from keyboards.menu_kb import main_menu_kb
-    from utils.helpers import get_user_language
-    from pathlib import Path
-    import json
-
-    lang_code = get_user_language(call.from_user)
-    translations_path = Path(__file__).parent.parent / "translations" / f"{lang_code}.json"
-    with open(translations_path, "r", encoding="utf-8") as f:
-        t = json.load(f)
-
-    await call.message.edit_text(
-        text=t["start_greeting"],
-        reply_markup=main_menu_kb(t)
-    )
-
-
-@balance_router.callback_query(BalanceFSM.choosing_currency, F.data == "back_to_amount")
+@callbacks(BackToAmount, BalanceFSM.choosing_currency)
 async def back_to_amount(call: CallbackQuery, state: FSMContext):
     await state.set_state(BalanceFSM.choosing_amount)
     await call.message.edit_text(
@@ -310,7 +283,7 @@ async def back_to_amount(call: CallbackQuery, state: FSMContext):
     )
 
 
-@balance_router.callback_query(BalanceFSM.confirm_payment, F.data == "back_to_currency")
+@callbacks(BackToCurrency, BalanceFSM.confirm_payment)
 async def back_to_currency(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     amount_y = data.get("amount", 0)
@@ -321,7 +294,7 @@ async def back_to_currency(call: CallbackQuery, state: FSMContext):
     )
 
 
-@balance_router.callback_query(BalanceFSM.wait_screenshot, F.data == "back_to_confirm")
+@callbacks(BackToConfirm, BalanceFSM.wait_screenshot)
 async def back_to_confirm(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     amount_y = data.get("amount", 0)
@@ -1,43 +1,66 @@
 import logging
-import sqlite3
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import CallbackQuery
-from aiogram.types import FSInputFile
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from database import (
-    get_unique_categories,      # должна возвращать список display_name (например, ["🔑 Ключи", "🛒 Подписки", "🛍️ Разное"])
-    get_unique_subcategories,   # теперь принимает safe_id (например, "keys", "subs", "misc")
-    get_products                # теперь принимает safe_id и subcat и делает JOIN с Categories
+from repository import get_product_card
+from utils.catalog_cache import catalog_cache  # снимок каталога в памяти: safe_id -> подкатегория -> товары
+from keyboards.catalog_kb import categories_kb, subcategories_kb, products_kb
+from keyboards.callbacks import (
+    ShowCategories, SelectCategory, SelectSubcategory, SubcategoriesPage, ProductsPage, SelectProduct,
+    RequestService, OrderProduct, BuyProduct,
 )
-from config import DB_PATH
-from utils.catalog_map import CATEGORY_MAP, REVERSE_CATEGORY_MAP  # CATEGORY_MAP: {safe_id: display_name}, REVERSE_CATEGORY_MAP: {display_name: safe_id}
+from utils.media import send_photo
+from utils.callback_table import callbacks
+
+logger = logging.getLogger(__name__)
 
 catalog_router = Router()
 
-@catalog_router.callback_query(F.data == "show_categories")
+def _category_id(safe_id: str) -> int:
+    # Старые кнопки несут safe_id; id ищем в последнем снимке каталога (загружается при старте).
+    # 0 — категории нет в наличии, хэндлер покажет список категорий
+    snapshot = catalog_cache.snapshot
+    return snapshot.category_id(safe_id) if snapshot else 0
+
+
+def _subcategory_id(safe_id: str, subcat: str) -> int:
+    snapshot = catalog_cache.snapshot
+    return snapshot.subcategory_id(safe_id, subcat) if snapshot else 0
+
+
+# Кнопки со старыми форматами callback_data на уже отправленных сообщениях:
+# "select_category_keys" / "selectSubcat_keys_Steam" и "select_category:keys" / "select_subcat:keys:Steam"
+callbacks.legacy("select_category_", SelectCategory, lambda rest: {"category_id": _category_id(rest)})
+callbacks.legacy("selectSubcat_", SelectSubcategory, lambda rest: {"subcategory_id": _subcategory_id(*rest.split("_", 1))})
+callbacks.legacy("select_product_", SelectProduct, lambda rest: {"product_id": rest})
+callbacks.previous(
+    "select_category", SelectCategory,
+    lambda data: SelectCategory(category_id=_category_id(data.split(":", 1)[1]))
+)
+callbacks.previous(
+    "select_subcat", SelectSubcategory,
+    lambda data: SelectSubcategory(subcategory_id=_subcategory_id(*data.split(":", 2)[1:]))
+)
+
+@callbacks(ShowCategories)
 async def show_categories_callback(call: CallbackQuery):
     """
     Шаг 1: Выводим список категорий.
     Каждая кнопка показывает красивое название (display_name), а в callback_data передаётся безопасный идентификатор (safe_id).
     """
-    categories = get_unique_categories()  # Ожидается, что эта функция теперь возвращает список display_name
+    catalog = await catalog_cache.get()
+    categories = catalog.categories  # [(safe_id, display_name)] — только категории с товарами в наличии
     if categories:
-        kb = InlineKeyboardBuilder()
-        for cat in categories:
-            # По display_name получаем safe_id (если нет – оставляем само display_name)
-            safe_id = REVERSE_CATEGORY_MAP.get(cat, cat)
-            kb.button(text=cat, callback_data=f"select_category_{safe_id}")
-        kb.button(text="Назад", callback_data="main_menu")
-        kb.adjust(1)
+        markup = categories_kb(catalog)
 
         text_to_show = "Выберите категорию:"
         if call.message.text:
-            await call.message.edit_text(text=text_to_show, reply_markup=kb.as_markup())
+            await call.message.edit_text(text=text_to_show, reply_markup=markup)
         elif call.message.caption:
-            await call.message.edit_caption(caption=text_to_show, reply_markup=kb.as_markup())
+            await call.message.edit_caption(caption=text_to_show, reply_markup=markup)
         else:
-            await call.message.answer(text=text_to_show, reply_markup=kb.as_markup())
+            await call.message.answer(text=text_to_show, reply_markup=markup)
     else:
         no_cat_text = "В базе нет доступных категорий."
         if call.message.text:
@@ -46,54 +69,76 @@ async def show_categories_callback(call: CallbackQuery):
             await call.message.edit_caption(no_cat_text)
         else:
             await call.message.answer(no_cat_text)
-    await call.answer()
+    return call.answer()
 
 
-@catalog_router.callback_query(F.data.startswith("select_category_"))
-async def select_category_callback(call: CallbackQuery):
+@callbacks(SelectCategory)
+async def select_category_callback(call: CallbackQuery, callback_data: SelectCategory):
     """
-    Шаг 2: Пользователь выбрал категорию.
-    Callback_data имеет формат "select_category_{safe_id}".
-    Получаем display‑имя для показа и далее по safe_id запрашиваем подкатегории.
+    Шаг 2: Пользователь выбрал категорию (SelectCategory, в кнопке — id категории).
+    По id находим safe_id, display‑имя для показа и подкатегории.
     """
-    logging.info(f"select_category_callback raw call.data={call.data}")
-    safe_id = call.data.split("_", 2)[2]  # Например, "keys"
-    # По словарю получаем красивое имя категории
-    category_display = CATEGORY_MAP.get(safe_id, safe_id)
-    # Получаем подкатегории по safe_id (функция должна учитывать новый внешний ключ)
-    subcats = get_unique_subcategories(safe_id)
+    logger.debug("select_category_callback raw call.data=%s", call.data)
+    return await _show_subcategories(call, callback_data.category_id)
+
+
+@callbacks(SubcategoriesPage)
+async def subcategories_page_callback(call: CallbackQuery, callback_data: SubcategoriesPage):
+    """
+    Листание подкатегорий: ◀ / ▶ под списком (SubcategoriesPage: id категории и подкатегории-курсора).
+    """
+    return await _show_subcategories(call, callback_data.category_id, callback_data.cursor, callback_data.back)
 
-    kb = InlineKeyboardBuilder()
-    for sc in subcats:
-        kb.button(text=sc, callback_data=f"selectSubcat_{safe_id}_{sc}")
-    kb.button(text="Назад", callback_data="show_categories")
-    kb.adjust(1)
+
+async def _show_subcategories(call: CallbackQuery, category_id: int, cursor: int = 0, back: bool = False):
+    catalog = await catalog_cache.get()
+    safe_id = catalog.category_by_id.get(category_id)  # Например, "keys"
+    if safe_id is None:
+        # Товары категории закончились (или кнопка совсем старая) — назад к списку категорий
+        return await show_categories_callback(call)
+    # Красивое имя категории и подкатегории берём из снимка каталога
+    category_display = catalog.get_display_name(safe_id)
+    markup = subcategories_kb(catalog, safe_id, cursor, back)
 
     text_to_show = f"Вы выбрали категорию: {category_display}\nВыберите подкатегорию:"
     if call.message.text:
-        await call.message.edit_text(text=text_to_show, reply_markup=kb.as_markup())
+        await call.message.edit_text(text=text_to_show, reply_markup=markup)
     elif call.message.caption:
-        await call.message.edit_caption(caption=text_to_show, reply_markup=kb.as_markup())
+        await call.message.edit_caption(caption=text_to_show, reply_markup=markup)
     else:
-        await call.message.answer(text=text_to_show, reply_markup=kb.as_markup())
-    await call.answer()
+        await call.message.answer(text=text_to_show, reply_markup=markup)
+    return call.answer()
 
 #  далее выбор подкатегории
-@catalog_router.callback_query(F.data.startswith("selectSubcat_"))
-async def select_subcategory_callback(call: CallbackQuery):
+@callbacks(SelectSubcategory)
+async def select_subcategory_callback(call: CallbackQuery, callback_data: SelectSubcategory):
     """
-    Шаг 3: Пользователь выбрал подкатегорию.
-    Callback_data имеет формат "selectSubcat_{safe_id}_{subcat}".
-    Используем safe_id для запроса товаров через JOIN.
+    Шаг 3: Пользователь выбрал подкатегорию (SelectSubcategory: id подкатегории).
+    По id находим категорию (safe_id) и название подкатегории, товары берём из снимка каталога.
     """
-    logging.info(f"select_subcategory_callback raw call.data={call.data}")
-    _, safe_id, subcat = call.data.split("_", 2)
-    # Получаем display‑имя категории из словаря
-    category_display = CATEGORY_MAP.get(safe_id, safe_id)
-    logging.info(f"Parsed safe_id={safe_id} -> category_display={category_display}, subcat={subcat}")
+    logger.debug("select_subcategory_callback raw call.data=%s", call.data)
+    return await _show_products(call, callback_data.subcategory_id)
 
-    products = get_products(safe_id, subcat)
-    logging.info(f"get_products(safe_id={safe_id}, subcat={subcat}) => {products}")
+
+@callbacks(ProductsPage)
+async def products_page_callback(call: CallbackQuery, callback_data: ProductsPage):
+    """
+    Листание товаров подкатегории: ◀ / ▶ под списком (ProductsPage: id подкатегории и товара-курсора).
+    """
+    return await _show_products(call, callback_data.subcategory_id, callback_data.cursor, callback_data.back)
+
+
+async def _show_products(call: CallbackQuery, subcategory_id: int, cursor: int = 0, back: bool = False):
+    catalog = await catalog_cache.get()
+    key = catalog.subcategory_by_id.get(subcategory_id)
+    if key is None:
+        return await show_categories_callback(call)
+    safe_id, subcat = key
+    category_display = catalog.get_display_name(safe_id)
+    logger.debug("Parsed safe_id=%s -> category_display=%s, subcat=%s", safe_id, category_display, subcat)
+
+    products = catalog.get_products(safe_id, subcat)
+    logger.debug("get_products(safe_id=%s, subcat=%s) => %s товаров", safe_id, subcat, len(products))
 
     if not products:
         empty_text = f"В подкатегории '{subcat}' пока нет товаров."
@@ -103,65 +148,45 @@ async def select_subcategory_callback(call: CallbackQuery):
             await call.message.edit_caption(empty_text)
         else:
             await call.message.answer(empty_text)
-        await call.answer()
-        return
+        return call.answer()
 
     try:
-        kb = InlineKeyboardBuilder()
-        for (prod_id, name, price, qty) in products:
-            button_text = f"{name} — {price} (GEL)"
-            logging.info(f"Добавляем кнопку: {button_text} -> select_product_{prod_id}")
-            kb.button(text=button_text, callback_data=f"select_product_{prod_id}")
-        # Кнопка «Назад» возвращает к выбору категории (используем safe_id)
-        kb.button(text="⬅ Назад", callback_data=f"select_category_{safe_id}")
-        kb.adjust(1)
+        markup = products_kb(catalog, safe_id, subcat, cursor, back)
 
         text_response = f"📦 Товары в категории {category_display}, подкатегории {subcat}:"
-        logging.info(f"Отправляем сообщение: {text_response}")
+        logger.debug("Отправляем сообщение: %s", text_response)
 
         if call.message.text:
-            await call.message.edit_text(text=text_response, reply_markup=kb.as_markup())
+            await call.message.edit_text(text=text_response, reply_markup=markup)
         elif call.message.caption:
-            await call.message.edit_caption(caption=text_response, reply_markup=kb.as_markup())
+            await call.message.edit_caption(caption=text_response, reply_markup=markup)
         else:
-            await call.message.answer(text_response, reply_markup=kb.as_markup())
+            await call.message.answer(text_response, reply_markup=markup)
     except Exception as e:
-        logging.error(f"Ошибка при обработке товаров в подкатегории {subcat}: {e}")
+        logger.error("Ошибка при обработке товаров в подкатегории %s: %s", subcat, e)
         if call.message.text:
             await call.message.edit_text("Произошла ошибка при загрузке товаров.")
         elif call.message.caption:
             await call.message.edit_caption("Произошла ошибка при загрузке товаров.")
         else:
             await call.message.answer("Произошла ошибка при загрузке товаров.")
-    await call.answer()
+    return call.answer()
 
 
-@catalog_router.callback_query(F.data.startswith("select_product_"))
-async def select_product_callback(call: CallbackQuery):
-    import logging
-    from aiogram.types import FSInputFile
-    prod_id = int(call.data.split("_")[2])
-    logging.info(f"select_product_callback: prod_id={prod_id}")
+@callbacks(SelectProduct)
+async def select_product_callback(call: CallbackQuery, callback_data: SelectProduct):
+    prod_id = callback_data.product_id
+    logger.debug("select_product_callback: prod_id=%s", prod_id)
 
     # Расширяем запрос: теперь выбираем также safe_id и logic_type
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT p.name, p.description, p.price, p.photo_path, 
-                   c.display_name, c.safe_id, p.type, c.logic_type
-            FROM Products p
-            JOIN Categories c ON p.category_id = c.id
-            WHERE p.id = ?
-        """, (prod_id,))
-        row = cursor.fetchone()
+    row = await get_product_card(prod_id)
 
     if not row:
         await call.message.answer("Товар не найден в базе.")
-        await call.answer()
-        return
+        return call.answer()
 
     # Распаковываем значения
-    name, description, price, photo_path, category_display, safe_id, subcat, logic_type = row
+    name, description, price, photo_path, category_display, safe_id, subcat, logic_type, subcat_id = row
 
     # Формируем базовый текст описания
     text = f"<b>{name}</b>\n{description}\n\nЦена: {price} GEL\n"
@@ -169,35 +194,39 @@ async def select_product_callback(call: CallbackQuery):
 
     if logic_type == 'appointment':
         text += "Формат услуги: Запись на услугу"
-        kb.button(text="Оставить заявку", callback_data=f"request_service_{prod_id}")
+        kb.button(text="Оставить заявку", callback_data=RequestService(product_id=prod_id))
     elif logic_type == 'physical':
         text += "Формат заказа: Доставка или Самовывоз. Оплата: Наличные, Card2Card"
-        kb.button(text="Оформить заказ", callback_data=f"order_product_{prod_id}")
+        kb.button(text="Оформить заказ", callback_data=OrderProduct(product_id=prod_id))
     else:
         text += "Формат покупки: Цифровой Товар. После оплаты оператор свяжется с Вами в рабочее время для оказания услуги."
-        kb.button(text="Купить", callback_data=f"buy_product_{prod_id}")
+        kb.button(text="Купить", callback_data=BuyProduct(product_id=prod_id))
 
-    # Кнопка «Назад» возвращает к выбору подкатегории; для этого используем safe_id из таблицы Categories
-    kb.button(text="Назад", callback_data=f"selectSubcat_{safe_id}_{subcat}")
+    # Кнопка «Назад» возвращает к списку подкатегории (id из таблицы Subcategories),
+    # к странице, которая начинается с этого товара
+    kb.button(text="Назад", callback_data=ProductsPage(subcategory_id=subcat_id or 0, cursor=prod_id - 1))
     kb.adjust(1)
 
     # Отправляем фото товара с подписью. Если фото не отправляется, отправляем только текст.
     try:
-        photo_file = FSInputFile(photo_path)
-        await call.message.answer_photo(
-            photo=photo_file,
+        await send_photo(
+            call.message.answer_photo,
+            photo_path,
             caption=text,
             parse_mode="HTML"
         )
     except Exception as e:
-        logging.error(f"Ошибка отправки фото товара: {e}")
+        logger.error("Ошибка отправки фото товара: %s", e)
         await call.message.answer(text, parse_mode="HTML")
 
-    logging.info(f"select_product_callback: name={name}, category_display={category_display}, subcat={subcat}, price={price}, logic_type={logic_type}")
+    logger.debug(
+        "select_product_callback: name=%s, category_display=%s, subcat=%s, price=%s, logic_type=%s",
+        name, category_display, subcat, price, logic_type
+    )
 
     # Отправляем второе сообщение с кнопками для дальнейших действий
     await call.message.answer(
         text="Что делаем дальше?",
         reply_markup=kb.as_markup()
     )
-    await call.answer()
+    return call.answer()
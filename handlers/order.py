@@ -1,14 +1,19 @@
 import logging
-import sqlite3
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from handlers.start import show_main_menu
-from config import DB_PATH, ADMIN_ID_ENCRYPTED, DEFAULT_DECRYPT_PASSWORD
-from encryption import decrypt_admin_data
-from database import get_user_by_telegram_id
+from encryption import get_admin_id
+from repository import get_product_order_info, add_purchase
+from utils.outbox import outbox
+from utils.callback_table import callbacks
+from keyboards.callbacks import (
+    MainMenu, SelectProduct, OrderProduct, OrderDelivery, OrderSelfPickup,
+    OrderConfirmSelfPickup, OrderBackToChoice,
+)
+
+logger = logging.getLogger(__name__)
 
 order_router = Router()
 
@@ -16,33 +21,22 @@ class OrderFSM(StatesGroup):
     waiting_delivery_choice = State()
     waiting_address = State()
 
-@order_router.callback_query(F.data.startswith("order_product_"))
-async def order_product_callback(call: CallbackQuery, state: FSMContext):
+callbacks.legacy("order_product_", OrderProduct, lambda rest: {"product_id": rest})
+
+@callbacks(OrderProduct)
+async def order_product_callback(call: CallbackQuery, state: FSMContext, callback_data: OrderProduct):
     """
     Пользователь выбрал товар для оформления заказа (физический товар).
     Вместо покупки бот выводит варианты: «Оформить доставку», «Забрать самовывозом», «Назад».
     """
-    try:
-        product_id = int(call.data.split("_")[2])
-    except ValueError:
-        await call.message.answer("Неверный формат запроса.")
-        return
+    product_id = callback_data.product_id
 
     # Получаем данные о товаре (имя, цену и т.д.) из БД
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT p.name, p.price, c.display_name
-            FROM Products p
-            JOIN Categories c ON p.category_id = c.id
-            WHERE p.id = ?
-        """, (product_id,))
-        row = cursor.fetchone()
+    row = await get_product_order_info(product_id)
 
     if not row:
         await call.message.answer("Товар не найден в базе.")
-        await call.answer()
-        return
+        return call.answer()
 
     name, price, category_display = row
     # Сохраняем данные в состоянии
@@ -50,9 +44,9 @@ async def order_product_callback(call: CallbackQuery, state: FSMContext):
 
     # Формируем клавиатуру выбора способа оформления заказа
     kb = InlineKeyboardBuilder()
-    kb.button(text="Оформить доставку", callback_data="order_delivery")
-    kb.button(text="Забрать самовывозом", callback_data="order_selfpickup")
-    kb.button(text="Назад", callback_data=f"select_product_{product_id}")
+    kb.button(text="Оформить доставку", callback_data=OrderDelivery())
+    kb.button(text="Забрать самовывозом", callback_data=OrderSelfPickup())
+    kb.button(text="Назад", callback_data=SelectProduct(product_id=product_id))
     kb.adjust(1)
 
     text = (
@@ -60,9 +54,9 @@ async def order_product_callback(call: CallbackQuery, state: FSMContext):
         "Выберите способ оформления заказа:"
     )
     await call.message.answer(text, reply_markup=kb.as_markup())
-    await call.answer()
+    return call.answer()
 
-@order_router.callback_query(F.data == "order_delivery")
+@callbacks(OrderDelivery)
 async def order_delivery_callback(call: CallbackQuery, state: FSMContext):
     """
     Пользователь выбирает доставку.
@@ -70,10 +64,10 @@ async def order_delivery_callback(call: CallbackQuery, state: FSMContext):
     """
     await state.set_state(OrderFSM.waiting_address)
     kb = InlineKeyboardBuilder()
-    kb.button(text="Назад", callback_data="order_back_to_choice")
+    kb.button(text="Назад", callback_data=OrderBackToChoice())
     kb.adjust(1)
     await call.message.answer("Введите адрес доставки и удобное время (одним сообщением).", reply_markup=kb.as_markup())
-    await call.answer()
+    return call.answer()
 
 @order_router.message(OrderFSM.waiting_address)
 async def handle_address(message: Message, state: FSMContext):
@@ -83,22 +77,10 @@ async def handle_address(message: Message, state: FSMContext):
     price = data.get("price", 0)
     
     # Сохраняем заказ в таблицу Purchase
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO Purchase (user_id, username, product_id, date)
-            VALUES (?, ?, ?, datetime('now'))
-        """, (message.from_user.id, message.from_user.username or "", data.get("product_id")))
-        conn.commit()
-        order_id = cursor.lastrowid
+    order_id = await add_purchase(message.from_user.id, message.from_user.username or "", data.get("product_id"))
 
     # Отправка уведомления админу о новом заказе доставки
-    try:
-        admin_id_decrypted = decrypt_admin_data(ADMIN_ID_ENCRYPTED, DEFAULT_DECRYPT_PASSWORD)
-        admin_id = int(admin_id_decrypted.decode("utf-8"))
-    except Exception as e:
-        logging.error(f"Ошибка дешифрования ADMIN_ID: {e}")
-        admin_id = None
+    admin_id = get_admin_id()  # расшифрован один раз при старте
 
     if admin_id:
         order_type = "Доставка"
@@ -110,12 +92,12 @@ async def handle_address(message: Message, state: FSMContext):
             f"User: {user_display} (id={message.from_user.id})\n"
             f"Адрес доставки: {address_info}"
         )
-        await message.bot.send_message(chat_id=admin_id, text=admin_text)
+        await outbox.send_message(admin_id, admin_text)
     else:
-        logging.error("Администратор не задан (admin_id is None).")
+        logger.error("Администратор не задан (admin_id is None).")
 
     kb = InlineKeyboardBuilder()
-    kb.button(text="В главное меню", callback_data="back_to_menu")
+    kb.button(text="В главное меню", callback_data=MainMenu())
     kb.adjust(1)
     text = (
         f"Ваш заказ оформлен!\n"
@@ -128,7 +110,7 @@ async def handle_address(message: Message, state: FSMContext):
     await message.answer(text, reply_markup=kb.as_markup())
     await state.clear()
 
-@order_router.callback_query(F.data == "order_selfpickup")
+@callbacks(OrderSelfPickup)
 async def order_selfpickup_callback(call: CallbackQuery, state: FSMContext):
     """
     Пользователь выбирает самовывоз.
@@ -138,8 +120,8 @@ async def order_selfpickup_callback(call: CallbackQuery, state: FSMContext):
     product_name = data.get("product_name", "Товар")
     price = data.get("price", 0)
     kb = InlineKeyboardBuilder()
-    kb.button(text="Подтвердить резерв", callback_data="order_confirm_selfpickup")
-    kb.button(text="Назад", callback_data=f"select_product_{data.get('product_id')}")
+    kb.button(text="Подтвердить резерв", callback_data=OrderConfirmSelfPickup())
+    kb.button(text="Назад", callback_data=SelectProduct(product_id=data.get("product_id", 0)))
     kb.adjust(1)
     text = (
         f"Вы выбрали товар «{product_name}» с самовывозом.\n"
@@ -148,30 +130,18 @@ async def order_selfpickup_callback(call: CallbackQuery, state: FSMContext):
         "Подтвердите резерв?"
     )
     await call.message.answer(text, reply_markup=kb.as_markup())
-    await call.answer()
+    return call.answer()
 
-@order_router.callback_query(F.data == "order_confirm_selfpickup")
+@callbacks(OrderConfirmSelfPickup)
 async def confirm_selfpickup_callback(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     product_name = data.get("product_name", "Товар")
     price = data.get("price", 0)
     # Сохраняем заказ в таблицу Purchase
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO Purchase (user_id, username, product_id, date)
-            VALUES (?, ?, ?, datetime('now'))
-        """, (call.from_user.id, call.from_user.username or "", data.get("product_id")))
-        conn.commit()
-        order_id = cursor.lastrowid
+    order_id = await add_purchase(call.from_user.id, call.from_user.username or "", data.get("product_id"))
 
     # Отправка уведомления админу о новом заказе самовывоза
-    try:
-        admin_id_decrypted = decrypt_admin_data(ADMIN_ID_ENCRYPTED, DEFAULT_DECRYPT_PASSWORD)
-        admin_id = int(admin_id_decrypted.decode("utf-8"))
-    except Exception as e:
-        logging.error(f"Ошибка дешифрования ADMIN_ID: {e}")
-        admin_id = None
+    admin_id = get_admin_id()  # расшифрован один раз при старте
 
     if admin_id:
         order_type = "Самовывоз"
@@ -182,12 +152,12 @@ async def confirm_selfpickup_callback(call: CallbackQuery, state: FSMContext):
             f"Товар: {product_name}\n"
             f"User: {user_display} (id={call.from_user.id})\n"
         )
-        await call.message.bot.send_message(chat_id=admin_id, text=admin_text)
+        await outbox.send_message(admin_id, admin_text)
     else:
-        logging.error("Администратор не задан (admin_id is None).")
+        logger.error("Администратор не задан (admin_id is None).")
 
     kb = InlineKeyboardBuilder()
-    kb.button(text="В главное меню", callback_data="back_to_menu")
+    kb.button(text="В главное меню", callback_data=MainMenu())
     kb.adjust(1)
     text = (
         f"Заказ оформлен!\n"
@@ -198,9 +168,9 @@ async def confirm_selfpickup_callback(call: CallbackQuery, state: FSMContext):
     )
     await call.message.answer(text, reply_markup=kb.as_markup())
     await state.clear()
-    await call.answer()
+    return call.answer()
 #возврат к выбору
-@order_router.callback_query(F.data == "order_back_to_choice")
+@callbacks(OrderBackToChoice)
 async def order_back_to_choice(call: CallbackQuery, state: FSMContext):
     """
     Кнопка "Назад" в состоянии выбора способа оформления заказа.
@@ -208,20 +178,11 @@ async def order_back_to_choice(call: CallbackQuery, state: FSMContext):
     """
     await state.set_state(OrderFSM.waiting_delivery_choice)
     kb = InlineKeyboardBuilder()
-    kb.button(text="Оформить доставку", callback_data="order_delivery")
-    kb.button(text="Забрать самовывозом", callback_data="order_selfpickup")
+    kb.button(text="Оформить доставку", callback_data=OrderDelivery())
+    kb.button(text="Забрать самовывозом", callback_data=OrderSelfPickup())
     # Возвращаемся к выбору товара
     data = await state.get_data()
-    kb.button(text="Назад", callback_data=f"select_product_{data.get('product_id')}")  
+    kb.button(text="Назад", callback_data=SelectProduct(product_id=data.get("product_id", 0)))
     kb.adjust(1)
     await call.message.answer("Выберите способ оформления заказа:", reply_markup=kb.as_markup())
-    await call.answer()
-
-@order_router.callback_query(F.data == "appointment_main_menu")
-async def go_to_main_menu_from_order(call: CallbackQuery, state: FSMContext):
-    """
-    Кнопка "В меню": пользователь выходит в главное меню, заказ не сохраняется.
-    """
-    await state.clear()
-    await show_main_menu(call.message)
-    await call.answer()
+    return call.answer()
@@ -1,18 +1,19 @@
 import logging
-import sqlite3
 
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from config import DB_PATH
+from db_pool import connection, transaction
 from database import get_balance, update_user_balance
 
+logger = logging.getLogger(__name__)
+
 orders_router = Router()
 
 @orders_router.callback_query(F.data.startswith("buy_"))
 async def buy_item_callback(call: CallbackQuery):
     prod_id = int(call.data.split("_")[1])
-    with sqlite3.connect(DB_PATH) as conn:
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT name, price, photo_path, quantity FROM Products WHERE id=?", (prod_id,))
         row = cursor.fetchone()
@@ -42,21 +43,20 @@ async def buy_item_callback(call: CallbackQuery):
     new_balance = balance - price
     update_user_balance(call.from_user.id, new_balance)
 
-    with sqlite3.connect(DB_PATH) as conn:
+    with transaction() as conn:
         cursor = conn.cursor()
         cursor.execute("UPDATE Products SET quantity = quantity - 1 WHERE id=?", (prod_id,))
         cursor.execute("INSERT INTO Purchase (username, product_id, date) VALUES (?, ?, datetime('now'))",
                        (call.from_user.username, prod_id))
-        conn.commit()
 
     try:
         await call.message.answer_photo(
             photo=open(photo_path, "rb"),
             caption=f"Товар: {name}\nСпасибо за покупку! Возвращаемся в главное меню."
         )
-        logging.info(f"Пользователь {call.from_user.id} купил товар {name} (prod_id={prod_id}).")
+        logger.info("Пользователь %s купил товар %s (prod_id=%s).", call.from_user.id, name, prod_id)
     except Exception as e:
-        logging.exception("Ошибка при отправке фото товара пользователю.")
+        logger.exception("Ошибка при отправке фото товара пользователю.")
         admin_id = None
         try:
             admin_id = int(call.router.__dict__.get("SUPER_ADMIN_ID", 0))
@@ -1,41 +1,43 @@
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from database import get_user_by_telegram_id, update_user_balance
-from config import DB_PATH
-import sqlite3
+from database import CHECKOUT_NO_USER, CHECKOUT_NO_PRODUCT, CHECKOUT_OUT_OF_STOCK, CHECKOUT_NO_FUNDS
+from repository import get_user_by_telegram_id, get_product_price, checkout
+from utils.catalog_cache import catalog_cache
+from utils.media import send_photo
+from utils.callback_table import callbacks
+from keyboards.callbacks import MainMenu, SelectProduct, BuyProduct, PayBalance, ConfirmPurchase, TopUpBalance
 
 purchase_router = Router()
 
-@purchase_router.callback_query(F.data.startswith("buy_product_"))
-async def buy_product_callback(call: CallbackQuery):
+callbacks.legacy("buy_product_", BuyProduct, lambda rest: {"product_id": rest})
+callbacks.legacy("pay_balance_", PayBalance, lambda rest: {"product_id": rest})
+callbacks.legacy("confirm_purchase_", ConfirmPurchase, lambda rest: {"product_id": rest})
+
+@callbacks(BuyProduct)
+async def buy_product_callback(call: CallbackQuery, callback_data: BuyProduct):
     """
-    1. Пользователь нажал «Купить» (callback_data="buy_product_{prod_id}")
+    1. Пользователь нажал «Купить» (BuyProduct)
     Проверяем баланс, если хватает -> кнопка «Оплатить с баланса»
     Если не хватает -> «Пополнить баланс».
     """
-    product_id = int(call.data.split("_")[2])
-    user = get_user_by_telegram_id(call.from_user.id)
+    product_id = callback_data.product_id
+    user = await get_user_by_telegram_id(call.from_user.id)
 
     if not user:
         await call.message.answer("Ошибка: пользователь не найден в базе.")
-        await call.answer()
-        return
+        return call.answer()
 
     # Извлекаем цену товара
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT price, photo_path, name FROM Products WHERE id=?", (product_id,))
-        row = cursor.fetchone()
+    row = await get_product_price(product_id)
 
     if not row:
         await call.message.answer("Ошибка: товар не найден в базе.")
-        await call.answer()
-        return
+        return call.answer()
 
-    price, photo_path, product_name = row
+    price, photo_path, product_name, _ = row
     user_balance = user[3]  # Индекс 3 = balance (по вашей структуре)
 
     text = (
@@ -49,45 +51,40 @@ async def buy_product_callback(call: CallbackQuery):
 
     if user_balance >= price:
         # Достаточно денег: «Оплатить с баланса» и «Пополнить баланс»
-        kb.button(text="Оплатить с баланса", callback_data=f"pay_balance_{product_id}")
+        kb.button(text="Оплатить с баланса", callback_data=PayBalance(product_id=product_id))
     else:
         text += "\nНедостаточно средств."
     # В любом случае кнопка «Пополнить баланс»
-    kb.button(text="Пополнить баланс", callback_data="topup_balance")
+    kb.button(text="Пополнить баланс", callback_data=TopUpBalance())
     # Кнопка «Назад» возвращает на выбор товара
-    kb.button(text="Назад", callback_data=f"select_product_{product_id}")
+    kb.button(text="Назад", callback_data=SelectProduct(product_id=product_id))
     kb.adjust(1)
 
     await call.message.answer(text, reply_markup=kb.as_markup())
-    await call.answer()
+    return call.answer()
 
 
-@purchase_router.callback_query(F.data.startswith("pay_balance_"))
-async def pay_balance_callback(call: CallbackQuery):
+@callbacks(PayBalance)
+async def pay_balance_callback(call: CallbackQuery, callback_data: PayBalance):
     """
     2. Нажата кнопка «Оплатить с баланса».
     Проверяем ещё раз баланс, предлагаем «Подтвердить покупку» или «Назад».
     """
-    product_id = int(call.data.split("_")[2])
-    user = get_user_by_telegram_id(call.from_user.id)
+    product_id = callback_data.product_id
+    user = await get_user_by_telegram_id(call.from_user.id)
 
     if not user:
         await call.message.answer("Ошибка: пользователь не найден.")
-        await call.answer()
-        return
+        return call.answer()
 
     # Повторно берём цену товара
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT price, photo_path, name FROM Products WHERE id=?", (product_id,))
-        row = cursor.fetchone()
+    row = await get_product_price(product_id)
 
     if not row:
         await call.message.answer("Товар не найден.")
-        await call.answer()
-        return
+        return call.answer()
 
-    price, photo_path, product_name = row
+    price, photo_path, product_name, _ = row
     user_balance = user[3]
 
     if user_balance < price:
@@ -95,8 +92,7 @@ async def pay_balance_callback(call: CallbackQuery):
             f"На балансе {user_balance} GEL, товар стоит {price}GEL.\n"
             "Недостаточно средств!"
         )
-        await call.answer()
-        return
+        return call.answer()
 
     # Предлагаем «Подтвердить» или «Назад»
     text = (
@@ -107,63 +103,46 @@ async def pay_balance_callback(call: CallbackQuery):
     )
 
     kb = InlineKeyboardBuilder()
-    kb.button(text="Подтвердить покупку (Confirm)", callback_data=f"confirm_purchase_{product_id}")
-    kb.button(text="Назад (Back)", callback_data=f"buy_product_{product_id}")
+    kb.button(text="Подтвердить покупку (Confirm)", callback_data=ConfirmPurchase(product_id=product_id))
+    kb.button(text="Назад (Back)", callback_data=BuyProduct(product_id=product_id))
     kb.adjust(1)
 
     await call.message.answer(text, reply_markup=kb.as_markup())
-    await call.answer()
+    return call.answer()
 
 
-@purchase_router.callback_query(F.data.startswith("confirm_purchase_"))
-async def confirm_purchase_callback(call: CallbackQuery):
-    product_id = int(call.data.split("_")[2])
-    user = get_user_by_telegram_id(call.from_user.id)
+@callbacks(ConfirmPurchase)
+async def confirm_purchase_callback(call: CallbackQuery, callback_data: ConfirmPurchase):
+    product_id = callback_data.product_id
 
-    if not user:
-        await call.message.answer("Ошибка: пользователь не найден.")
-        await call.answer()
-        return
+    # Проверка остатка/баланса и списание — одной транзакцией в БД. call.id — ключ нажатия:
+    # тот же апдейт, обработанный повторно, не спишет деньги второй раз
+    status, price, product_name, photo_path, new_balance = await checkout(
+        call.from_user.id, call.from_user.username, product_id, call.id
+    )
 
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT price, photo_path, name, quantity FROM Products WHERE id=?", (product_id,))
-        row = cursor.fetchone()
+    if status == CHECKOUT_NO_USER:
+        await call.message.answer("Ошибка: пользователь не найден.")
+        return call.answer()
 
-    if not row:
+    if status == CHECKOUT_NO_PRODUCT:
         await call.message.answer("Товар не найден в базе.")
-        await call.answer()
-        return
-
-    price, photo_path, product_name, quantity = row
-    user_balance = user[3]
+        return call.answer()
 
-    if quantity <= 0:
+    if status == CHECKOUT_OUT_OF_STOCK:
         await call.message.answer("❌ Ошибка: товар закончился. Попробуйте выбрать другой.")
-        await call.answer()
-        return
+        return call.answer()
 
-    if user_balance < price:
+    if status == CHECKOUT_NO_FUNDS:
         await call.message.answer("Недостаточно средств для покупки! Пожалуйста, пополните баланс.")
-        await call.answer()
-        return
-
-    new_balance = user_balance - price
-    new_quantity = quantity - 1
-
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE Users SET balance=? WHERE telegram_id=?", (new_balance, call.from_user.id))
-        cursor.execute("UPDATE Products SET quantity=? WHERE id=?", (new_quantity, product_id))
-        cursor.execute("""
-            INSERT INTO Purchase (user_id, username, product_id, date)
-            VALUES (?, ?, ?, datetime('now'))
-        """, (call.from_user.id, call.from_user.username, product_id))
-        conn.commit()
+        return call.answer()
+
+    # Последняя единица товара убирает его из каталога — сверяем версию сразу
+    catalog_cache.invalidate()
 
     # Создаём кнопку "Возврат в меню"
     keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[[InlineKeyboardButton(text="Возврат в меню", callback_data="back_to_menu")]]
+        inline_keyboard=[[InlineKeyboardButton(text="Возврат в меню", callback_data=MainMenu().pack())]]
     )
 
     text = (
@@ -177,12 +156,13 @@ async def confirm_purchase_callback(call: CallbackQuery):
     )
 
     try:
-        await call.message.answer_photo(
-            photo=open(photo_path, "rb"),
+        await send_photo(
+            call.message.answer_photo,
+            photo_path,
             caption=text,
             reply_markup=keyboard
         )
     except:
         await call.message.answer(f"{text}\n(Не удалось отправить фото)", reply_markup=keyboard)
 
-    await call.answer()
+    return call.answer()
@@ -0,0 +1,90 @@
+import html
+import logging
+
+from aiogram import F, Router
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import CallbackQuery, Message
+
+from keyboards.callbacks import SearchPage, ShowSearch
+from keyboards.catalog_kb import search_results_kb
+from keyboards.menu_kb import back_to_menu_kb
+from utils.callback_table import callbacks
+from utils.search import search
+
+logger = logging.getLogger(__name__)
+
+search_router = Router()
+
+ASK_QUERY = "🔍 Введите название товара или начало слова (например, «клав»):"
+
+
+class SearchFSM(StatesGroup):
+    # Следующее текстовое сообщение — запрос; состояние остаётся, чтобы уточнять запрос
+    # следующим сообщением. Выход в главное меню его сбрасывает
+    waiting_query = State()
+
+
+def _results_text(query: str, products: list, page: int, ranked: bool) -> str:
+    query = html.escape(query)
+    if not products:
+        return f"По запросу «{query}» ничего не нашлось. Попробуйте другое слово или начало слова."
+    suffix = f" (стр. {page + 1})" if page else ""
+    text = f"🔍 Найдено по запросу «{query}»{suffix}:"
+    if not ranked:
+        text += "\nСовпадений очень много, они показаны по порядку — уточните запрос, чтобы увидеть лучшие."
+    return text
+
+
+async def _send_results(message: Message, text: str):
+    query, products, has_next, ranked = await search(text)
+    if not query:
+        await message.answer(ASK_QUERY, reply_markup=back_to_menu_kb())
+        return
+    await message.answer(
+        _results_text(query, products, 0, ranked),
+        reply_markup=search_results_kb(products, query, 0, has_next),
+    )
+
+
+@callbacks(ShowSearch)
+async def show_search_callback(call: CallbackQuery, state: FSMContext):
+    """
+    Кнопка «Поиск» в главном меню: ждём запрос следующим сообщением.
+    """
+    await state.set_state(SearchFSM.waiting_query)
+    await call.message.answer(ASK_QUERY, reply_markup=back_to_menu_kb())
+    return call.answer()
+
+
+@search_router.message(Command("search"))
+async def cmd_search(message: Message, state: FSMContext, command: CommandObject):
+    """
+    /search <запрос> — сразу результаты; /search без текста — как кнопка «Поиск».
+    """
+    if not command.args:
+        await state.set_state(SearchFSM.waiting_query)
+        await message.answer(ASK_QUERY, reply_markup=back_to_menu_kb())
+        return
+    await _send_results(message, command.args)
+
+
+@search_router.message(SearchFSM.waiting_query, F.text)
+async def handle_search_query(message: Message):
+    await _send_results(message, message.text)
+
+
+@callbacks(SearchPage)
+async def search_page_callback(call: CallbackQuery, callback_data: SearchPage):
+    """
+    Листание результатов (SearchPage: номер страницы и нормализованный запрос).
+    """
+    query, products, has_next, ranked = await search(callback_data.query, callback_data.page)
+    text = _results_text(query, products, callback_data.page, ranked)
+    markup = search_results_kb(products, query, callback_data.page, has_next)
+    if call.message.text:
+        await call.message.edit_text(text=text, reply_markup=markup)
+    else:
+        await call.message.answer(text=text, reply_markup=markup)
+    return call.answer()
@@ -1,72 +1,66 @@
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message, CallbackQuery, InputFile
-from aiogram.types import FSInputFile
+from aiogram.fsm.context import FSMContext
+from utils.media import send_photo
 from aiogram.filters import Command  # Импорт Command для aiogram 3.x
-from database import get_user_by_telegram_id, add_new_user
-from utils.helpers import get_user_language
-import json
+from repository import get_or_create_user
+from utils.helpers import get_user_language, language_from_row
+from utils.i18n import get_translations
 from pathlib import Path
 from keyboards.menu_kb import main_menu_kb
+from keyboards.callbacks import MainMenu
+from utils.callback_table import callbacks
 import logging
 
+logger = logging.getLogger(__name__)
+
 start_router = Router()
 
 @start_router.message(Command("start"))
 async def cmd_start(message: Message):
     # 1) Логируем вход в handler и базовые данные из объекта message
-    logging.info(
-        f"[cmd_start] Начало обработки /start\n"
-        f" message_id={message.message_id}, "
-        f" from_user_id={message.from_user.id}, "
-        f" username={message.from_user.username}, "
-        f" language_code={message.from_user.language_code}"
+    logger.debug(
+        "[cmd_start] /start: message_id=%s, from_user_id=%s, username=%s, language_code=%s",
+        message.message_id, message.from_user.id, message.from_user.username, message.from_user.language_code
     )
 
-    # 2) Пытаемся получить пользователя из базы
-    user_data = get_user_by_telegram_id(message.from_user.id)
-    logging.info(f"[cmd_start] get_user_by_telegram_id => {user_data}")
-
-    # 3) Если пользователь не найден, записываем нового
-    if not user_data:
-        language = get_user_language(message.from_user)
-        logging.info(f"[cmd_start] Новый пользователь, get_user_language вернул: {language}")
-        add_new_user(message.from_user.id, message.from_user.username or "", language)
-        logging.info(f"[cmd_start] add_new_user(telegram_id={message.from_user.id}, language={language}) выполнен")
+    # 2) Берём пользователя из кэша; если его там нет — один upsert (создать или обновить username).
+    #    Язык по language_code используется только для нового пользователя.
+    language = language_from_row(None, message.from_user)
+    user_data = await get_or_create_user(message.from_user.id, message.from_user.username or "", language)
+    logger.debug("[cmd_start] get_or_create_user(telegram_id=%s) => %s", message.from_user.id, user_data)
 
-    # 4) Ещё раз определяем язык из базы (или через fallback)
-    lang_code = get_user_language(message.from_user)
-    logging.info(f"[cmd_start] Итоговый язык для пользователя {message.from_user.id}: {lang_code}")
+    # 3) Определяем язык по той же строке (или через fallback)
+    lang_code = language_from_row(user_data, message.from_user)
+    logger.debug("[cmd_start] Итоговый язык для пользователя %s: %s", message.from_user.id, lang_code)
 
-    # 5) Загружаем JSON-файл перевода
-    translations_path = Path(__file__).parent.parent / "translations" / f"{lang_code}.json"
-    logging.info(f"[cmd_start] Загружаем переводы из файла {translations_path}")
-    with open(translations_path, "r", encoding="utf-8") as f:
-        t = json.load(f)
+    # 4) Переводы уже загружены в память при старте
+    t = get_translations(lang_code)
 
-    # 6) Путь к приветственному фото
+    # 5) Путь к приветственному фото
     welcome_photo_path = Path(__file__).parent.parent / "data" / "welcome.jpg"
-    logging.info(f"[cmd_start] Пытаемся отправить фото из: {welcome_photo_path.resolve()}")
+    logger.debug("[cmd_start] Пытаемся отправить фото из: %s", welcome_photo_path)
 
     try:
-        photo_file = FSInputFile(str(welcome_photo_path))
-        await message.answer_photo(
-            photo=photo_file,
+        await send_photo(
+            message.answer_photo,
+            welcome_photo_path,
             caption=t["start_greeting"],
             parse_mode="HTML",
-            reply_markup=main_menu_kb(t)
+            reply_markup=main_menu_kb(t, lang_code)
         )
-        logging.info("[cmd_start] Фото отправлено успешно")
+        logger.debug("[cmd_start] Фото отправлено успешно")
     except Exception as e:
-        logging.error(f"Ошибка отправки приветственного фото: {e}")
+        logger.error("Ошибка отправки приветственного фото: %s", e)
         # Если фото не отправляется, просто отправляем текст
         await message.answer(
             text=t["start_greeting"],
-            reply_markup=main_menu_kb(t)
+            reply_markup=main_menu_kb(t, lang_code)
         )
-        logging.info("[cmd_start] Фото не отправлено, отправлен текст")
+        logger.debug("[cmd_start] Фото не отправлено, отправлен текст")
 
-    # 7) Логируем завершение
-    logging.info("[cmd_start] Завершение обработки /start")
+    # 6) Логируем завершение
+    logger.debug("[cmd_start] Завершение обработки /start")
 
 async def show_main_menu(call: CallbackQuery):
     """
@@ -78,33 +72,38 @@ async def show_main_menu(call: CallbackQuery):
     user_id = call.from_user.id
 
     # Получаем язык из БД или fallback
-    lang_code = get_user_language(call.from_user)  # <-- Теперь вызов без проблемы ID бота
-    translations_path = Path(__file__).parent.parent / "translations" / f"{lang_code}.json"
-    with open(translations_path, "r", encoding="utf-8") as f:
-        t = json.load(f)
+    lang_code = await get_user_language(call.from_user)  # <-- Теперь вызов без проблемы ID бота
+    t = get_translations(lang_code)
 
     # Приветственное фото
     welcome_photo_path = Path(__file__).parent.parent / "data" / "welcome.jpg"
-    logging.info(f"[show_main_menu] Отправка фото {welcome_photo_path} для user_id={user_id}")
+    logger.debug("[show_main_menu] Отправка фото %s для user_id=%s", welcome_photo_path, user_id)
 
     try:
-        photo_file = FSInputFile(str(welcome_photo_path))
         # Вызываем answer_photo от имени того же чата,
         # но через call.message (у него есть chat_id = call.message.chat.id)
-        await call.message.answer_photo(
-            photo=photo_file,
+        await send_photo(
+            call.message.answer_photo,
+            welcome_photo_path,
             caption=t["start_greeting"],
             parse_mode="HTML",
-            reply_markup=main_menu_kb(t)
+            reply_markup=main_menu_kb(t, lang_code)
         )
     except Exception as e:
-        logging.error(f"[show_main_menu] Ошибка отправки фото: {e}")
+        logger.error("[show_main_menu] Ошибка отправки фото: %s", e)
         await call.message.answer(
             text=t["start_greeting"],
-            reply_markup=main_menu_kb(t)
+            reply_markup=main_menu_kb(t, lang_code)
         )
-# обновленная кнопка бэк ту меню
-@start_router.callback_query(F.data == "back_to_menu")
-async def back_to_menu(call: CallbackQuery):
+# Все кнопки «В главное меню» — один хэндлер. Старые варианты callback_data на уже
+# отправленных сообщениях ведут сюда же
+callbacks.alias("back_to_menu", MainMenu)
+callbacks.alias("back_to_main_menu", MainMenu)
+callbacks.alias("appointment_main_menu", MainMenu)
+
+@callbacks(MainMenu)
+async def main_menu_callback(call: CallbackQuery, state: FSMContext):
+    # Выход в меню прерывает начатый сценарий (оплата, заказ, заявка)
+    await state.clear()
     await show_main_menu(call)
-    await call.answer()
\ No newline at end of file
+    return call.answer()
\ No newline at end of file
@@ -0,0 +1,53 @@
+from aiogram.filters.callback_data import CallbackData
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from utils.callback_codec import CompactCallbackData
+
+
+# Кнопки адресуют платёж по первичному ключу: "ac:<payment_id в base36>" (прежде "admin_confirm:<payment_id>")
+class AdminConfirm(CompactCallbackData, prefix="ac", previous="admin_confirm"):
+    payment_id: int
+
+
+class AdminReject(CompactCallbackData, prefix="ar", previous="admin_reject"):
+    payment_id: int
+
+
+# Следующая страница /pending: платежи с id > after_id
+class PendingPage(CompactCallbackData, prefix="pp", previous="pending"):
+    after_id: int
+
+
+# Кнопки старого формата "admin_confirm_<user_id>_<amount>" в уже отправленных уведомлениях
+class AdminConfirmLegacy(CallbackData, prefix="admin_confirm_legacy"):
+    user_id: int
+    amount: float
+
+
+class AdminRejectLegacy(CallbackData, prefix="admin_reject_legacy"):
+    user_id: int
+    amount: float
+
+
+def payment_review_kb(payment_id: int):
+    kb = InlineKeyboardBuilder()
+    kb.button(text="Подтвердить платеж", callback_data=AdminConfirm(payment_id=payment_id))
+    kb.button(text="Отклонить платеж", callback_data=AdminReject(payment_id=payment_id))
+    kb.adjust(1)
+    return kb.as_markup()
+
+
+def pending_payments_kb(payment_ids: list[int], next_after_id: int | None = None):
+    """
+    По паре кнопок ✅/❌ на каждый платёж страницы и «Далее», если очередь не закончилась.
+    """
+    kb = InlineKeyboardBuilder()
+    for payment_id in payment_ids:
+        kb.button(text=f"✅ #{payment_id}", callback_data=AdminConfirm(payment_id=payment_id))
+        kb.button(text=f"❌ #{payment_id}", callback_data=AdminReject(payment_id=payment_id))
+    sizes = [2] * len(payment_ids)
+    if next_after_id is not None:
+        kb.button(text="Далее ➡️", callback_data=PendingPage(after_id=next_after_id))
+        sizes.append(1)
+    kb.adjust(*sizes)
+    return kb.as_markup()
@@ -0,0 +1,36 @@
+from aiogram.types import InlineKeyboardMarkup
+
+
+class KeyboardCache:
+    """
+    Готовые InlineKeyboardMarkup по ключу (экран, язык, версия каталога).
+    Клавиатуры, не зависящие от каталога, кладутся с version=None и живут до перезапуска.
+    При появлении новой версии каталога клавиатуры старых версий удаляются.
+    """
+
+    def __init__(self):
+        self._items: dict[tuple, InlineKeyboardMarkup] = {}
+        self._catalog_version = None
+
+    def get(self, screen, lang, build, version=None) -> InlineKeyboardMarkup:
+        key = (screen, lang, version)
+        markup = self._items.get(key)
+        if markup is not None:
+            return markup
+
+        markup = build()
+        if version is not None and version != self._catalog_version:
+            if self._catalog_version is not None and version < self._catalog_version:
+                # Запоздавший апдейт со старым снимком — отдаём, но не кэшируем
+                return markup
+            self._items = {k: v for k, v in self._items.items() if k[2] is None}
+            self._catalog_version = version
+        self._items[key] = markup
+        return markup
+
+    def clear(self):
+        self._items = {}
+        self._catalog_version = None
+
+
+keyboard_cache = KeyboardCache()
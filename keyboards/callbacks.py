@@ -0,0 +1,173 @@
+from aiogram.filters.callback_data import CallbackData
+
+from utils.callback_codec import CompactCallbackData
+
+# Типизированные callback_data всех инлайн-кнопок бота (кроме админских — они в keyboards/admin_kb.py).
+# Префикс — ключ таблицы маршрутизации (utils/callback_table.py), поэтому он уникален на весь бот.
+# Кнопки без параметров упаковываются ровно в префикс ("show_categories"), как и раньше.
+# Кнопки с числами — в компактном формате (utils/callback_codec.py): "p:h" вместо "select_product:17";
+# previous — префикс прежнего формата, такие кнопки в старых сообщениях тоже разбираются.
+# Категории и подкатегории передаются числовыми id (Categories.id, Subcategories.id), не названиями.
+
+
+# --- Главное меню ---
+
+class MainMenu(CallbackData, prefix="main_menu"):
+    pass
+
+
+class ChooseLanguage(CallbackData, prefix="choose_language"):
+    pass
+
+
+class SetLanguage(CallbackData, prefix="setlang"):
+    lang: str
+
+
+class AboutBot(CallbackData, prefix="about_bot"):
+    pass
+
+
+class ShowProfile(CallbackData, prefix="show_profile"):
+    pass
+
+
+# --- Каталог ---
+
+class ShowCategories(CallbackData, prefix="show_categories"):
+    pass
+
+
+class SelectCategory(CompactCallbackData, prefix="c"):
+    category_id: int
+
+
+class SelectSubcategory(CompactCallbackData, prefix="s"):
+    subcategory_id: int
+
+
+# Листание списков (keyset): cursor — id последней (▶) или первой (◀, back=True) строки текущей страницы.
+# Подкатегории идут по алфавиту, товары — по id.
+class SubcategoriesPage(CompactCallbackData, prefix="sg"):
+    category_id: int
+    cursor: int
+    back: bool = False
+
+
+class ProductsPage(CompactCallbackData, prefix="pg"):
+    subcategory_id: int
+    cursor: int
+    back: bool = False
+
+
+class SelectProduct(CompactCallbackData, prefix="p", previous="select_product"):
+    product_id: int
+
+
+# --- Поиск ---
+
+class ShowSearch(CallbackData, prefix="search"):
+    pass
+
+
+# query — нормализованный запрос (utils/search.normalize): слова через пробел, без ":".
+# Длинный запрос в 64 байта не влезет — тогда кнопка получит токен (utils/callback_codec.py)
+class SearchPage(CompactCallbackData, prefix="sr"):
+    page: int
+    query: str
+
+
+# --- Покупка цифрового товара ---
+
+class BuyProduct(CompactCallbackData, prefix="b", previous="buy_product"):
+    product_id: int
+
+
+class PayBalance(CompactCallbackData, prefix="pb", previous="pay_balance"):
+    product_id: int
+
+
+class ConfirmPurchase(CompactCallbackData, prefix="cp", previous="confirm_purchase"):
+    product_id: int
+
+
+# --- Заказ физического товара ---
+
+class OrderProduct(CompactCallbackData, prefix="op", previous="order_product"):
+    product_id: int
+
+
+class OrderDelivery(CallbackData, prefix="order_delivery"):
+    pass
+
+
+class OrderSelfPickup(CallbackData, prefix="order_selfpickup"):
+    pass
+
+
+class OrderConfirmSelfPickup(CallbackData, prefix="order_confirm_selfpickup"):
+    pass
+
+
+class OrderBackToChoice(CallbackData, prefix="order_back_to_choice"):
+    pass
+
+
+# --- Заявка на услугу ---
+
+class RequestService(CompactCallbackData, prefix="rs", previous="request_service"):
+    product_id: int
+
+
+class AppointmentEdit(CallbackData, prefix="appointment_edit"):
+    pass
+
+
+class AppointmentCancel(CallbackData, prefix="appointment_cancel"):
+    pass
+
+
+class ConfirmAppointment(CallbackData, prefix="confirm_appointment"):
+    pass
+
+
+# --- Пополнение баланса ---
+
+class TopUpBalance(CallbackData, prefix="topup_balance"):
+    pass
+
+
+class TopUpAmount(CompactCallbackData, prefix="a", previous="amount"):
+    value: int
+
+
+class EnterCustomAmount(CallbackData, prefix="enter_custom_amount"):
+    pass
+
+
+class BackToAmountList(CallbackData, prefix="back_to_amount_list"):
+    pass
+
+
+class TopUpCurrency(CallbackData, prefix="currency"):
+    code: str
+
+
+class PaymentDone(CallbackData, prefix="confirm_done"):
+    pass
+
+
+class TopUpBack(CallbackData, prefix="back_main"):
+    pass
+
+
+class BackToAmount(CallbackData, prefix="back_to_amount"):
+    pass
+
+
+class BackToCurrency(CallbackData, prefix="back_to_currency"):
+    pass
+
+
+class BackToConfirm(CallbackData, prefix="back_to_confirm"):
+    pass
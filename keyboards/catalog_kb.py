@@ -0,0 +1,84 @@
+from aiogram.types import InlineKeyboardButton
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from keyboards.cache import keyboard_cache
+from keyboards.callbacks import (
+    MainMenu, ShowCategories, SelectCategory, SelectSubcategory, SelectProduct, SubcategoriesPage, ProductsPage,
+    SearchPage,
+)
+from utils.catalog_cache import CatalogSnapshot
+
+# Клавиатуры каталога строятся из снимка каталога и кэшируются по его версии.
+# Тексты кнопок пока только на русском, поэтому язык в ключе — "ru".
+# Списки подкатегорий и товаров — постранично; ключ кэша страницы — её первая строка,
+# поэтому страница, открытая и кнопкой ▶, и кнопкой ◀, строится один раз.
+
+def _nav_row(kb: InlineKeyboardBuilder, has_prev: bool, has_next: bool, page) -> None:
+    # page(back) -> callback_data соседней страницы (◀ — back=True)
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(text="◀", callback_data=page(True).pack()))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="▶", callback_data=page(False).pack()))
+    if buttons:
+        kb.row(*buttons)
+
+def categories_kb(catalog: CatalogSnapshot):
+    def build():
+        kb = InlineKeyboardBuilder()
+        for safe_id, display_name in catalog.categories:
+            kb.button(text=display_name, callback_data=SelectCategory(category_id=catalog.category_id(safe_id)))
+        kb.button(text="Назад", callback_data=MainMenu())
+        kb.adjust(1)
+        return kb.as_markup()
+    return keyboard_cache.get("categories", "ru", build, catalog.version)
+
+def subcategories_kb(catalog: CatalogSnapshot, safe_id: str, cursor: int = 0, back: bool = False):
+    names, has_prev, has_next = catalog.subcategories_page(safe_id, cursor, back)
+    category_id = catalog.category_id(safe_id)
+
+    def build():
+        kb = InlineKeyboardBuilder()
+        for sc in names:
+            kb.button(text=sc, callback_data=SelectSubcategory(subcategory_id=catalog.subcategory_id(safe_id, sc)))
+        kb.adjust(1)
+        _nav_row(kb, has_prev, has_next, lambda back: SubcategoriesPage(
+            category_id=category_id,
+            cursor=catalog.subcategory_id(safe_id, names[0] if back else names[-1]),
+            back=back,
+        ))
+        kb.row(InlineKeyboardButton(text="Назад", callback_data=ShowCategories().pack()))
+        return kb.as_markup()
+    first = names[0] if names else None
+    return keyboard_cache.get(("subcategories", safe_id, first), "ru", build, catalog.version)
+
+def products_kb(catalog: CatalogSnapshot, safe_id: str, subcat: str, cursor: int = 0, back: bool = False):
+    products, has_prev, has_next = catalog.products_page(safe_id, subcat, cursor, back)
+    subcategory_id = catalog.subcategory_id(safe_id, subcat)
+
+    def build():
+        kb = InlineKeyboardBuilder()
+        for (prod_id, name, price, qty) in products:
+            kb.button(text=f"{name} — {price} (GEL)", callback_data=SelectProduct(product_id=prod_id))
+        kb.adjust(1)
+        _nav_row(kb, has_prev, has_next, lambda back: ProductsPage(
+            subcategory_id=subcategory_id, cursor=products[0][0] if back else products[-1][0], back=back,
+        ))
+        # Кнопка «Назад» возвращает к выбору категории (по её id)
+        kb.row(InlineKeyboardButton(
+            text="⬅ Назад", callback_data=SelectCategory(category_id=catalog.category_id(safe_id)).pack()
+        ))
+        return kb.as_markup()
+    first = products[0][0] if products else None
+    return keyboard_cache.get(("products", safe_id, subcat, first), "ru", build, catalog.version)
+
+
+def search_results_kb(products: list[tuple], query: str, page: int, has_next: bool):
+    # Результаты поиска зависят от запроса — не кэшируются
+    kb = InlineKeyboardBuilder()
+    for (prod_id, name, price, qty) in products:
+        kb.button(text=f"{name} — {price} (GEL)", callback_data=SelectProduct(product_id=prod_id))
+    kb.adjust(1)
+    _nav_row(kb, page > 0, has_next, lambda back: SearchPage(page=page - 1 if back else page + 1, query=query))
+    kb.row(InlineKeyboardButton(text="⬅️ В главное меню", callback_data=MainMenu().pack()))
+    return kb.as_markup()
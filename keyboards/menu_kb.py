@@ -1,12 +1,35 @@
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
+from keyboards.cache import keyboard_cache
+from keyboards.callbacks import ShowCategories, ShowSearch, AboutBot, ShowProfile, ChooseLanguage, SetLanguage, MainMenu
 # meny keboard
-def main_menu_kb(t: dict):
-    kb = InlineKeyboardBuilder()
-    kb.button(text=t["btn_categories"], callback_data="show_categories")
-    kb.button(text=t["btn_about"], callback_data="about_bot")
-    kb.button(text=t["btn_profile"], callback_data="show_profile")
-    # Новая кнопка для выбора языка:
-    kb.button(text=t["btn_language"], callback_data="choose_language")
-    kb.adjust(1)
-    return kb.as_markup()
+def main_menu_kb(t: dict, lang: str):
+    def build():
+        kb = InlineKeyboardBuilder()
+        kb.button(text=t["btn_categories"], callback_data=ShowCategories())
+        kb.button(text=t["btn_search"], callback_data=ShowSearch())
+        kb.button(text=t["btn_about"], callback_data=AboutBot())
+        kb.button(text=t["btn_profile"], callback_data=ShowProfile())
+        # Новая кнопка для выбора языка:
+        kb.button(text=t["btn_language"], callback_data=ChooseLanguage())
+        kb.adjust(1)
+        return kb.as_markup()
+    return keyboard_cache.get("main_menu", lang, build)
+
+def language_kb():
+    def build():
+        kb = InlineKeyboardBuilder()
+        kb.button(text="Русский", callback_data=SetLanguage(lang="ru"))
+        kb.button(text="English", callback_data=SetLanguage(lang="en"))
+        kb.button(text="Назад", callback_data=MainMenu())
+        kb.adjust(1)
+        return kb.as_markup()
+    return keyboard_cache.get("choose_language", None, build)
+
+def back_to_menu_kb():
+    def build():
+        kb = InlineKeyboardBuilder()
+        kb.button(text="⬅️ В главное меню", callback_data=MainMenu())
+        kb.adjust(1)
+        return kb.as_markup()
+    return keyboard_cache.get("back_to_menu", None, build)
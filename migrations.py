@@ -0,0 +1,481 @@
+import logging
+import sqlite3
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Версия схемы хранится в PRAGMA user_version.
+# Каждая миграция — функция (cursor) -> None; применяются по порядку, каждая ровно один раз.
+# Новые миграции добавляются только в конец списка MIGRATIONS.
+
+
+def _m001_base_schema(cursor: sqlite3.Cursor):
+    """
+    Исходные таблицы (IF NOT EXISTS — БД, созданные до появления миграций, тоже имеют user_version=0).
+    """
+    # Таблица пользователей
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_id INTEGER UNIQUE,
+        telegram_username TEXT,
+        balance REAL DEFAULT 0,
+        language TEXT
+    )
+    """)
+
+    # Таблица категорий
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        safe_id TEXT UNIQUE,
+        display_name TEXT
+    )
+    """)
+
+    # Таблица товаров/услуг с внешним ключом на Categories
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category_id INTEGER,
+        type TEXT,
+        name TEXT,
+        description TEXT,
+        price REAL,
+        photo_path TEXT,
+        quantity INTEGER,
+        FOREIGN KEY(category_id) REFERENCES Categories(id)
+    )
+    """)
+
+    # Таблица платежей
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Payments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        amount REAL,
+        currency TEXT,
+        status TEXT,
+        screenshot_path TEXT,
+        date TEXT
+    )
+    """)
+
+    # Таблица покупок
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Purchase (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        username TEXT,
+        product_id INTEGER,
+        date TEXT
+    )
+    """)
+
+    # Таблица курсов валют
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS RatesY (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        currency TEXT,
+        rate_to_y REAL
+    )
+    """)
+
+
+def _m002_appointments_and_logic_type(cursor: sqlite3.Cursor):
+    """
+    Таблица заявок на услуги и Categories.logic_type, которые используют хэндлеры.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS appointments_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        product_id INTEGER,
+        description TEXT,
+        status TEXT,
+        date TEXT
+    )
+    """)
+
+    # В старых БД колонку могли добавить вручную
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(Categories)")]
+    if "logic_type" not in columns:
+        cursor.execute("ALTER TABLE Categories ADD COLUMN logic_type TEXT DEFAULT 'digital'")
+
+
+def _m003_hot_path_indexes(cursor: sqlite3.Cursor):
+    """
+    Индексы под горячие запросы (см. HOT_QUERIES / check_query_plans).
+    """
+    # Каталог: get_unique_categories / get_unique_subcategories / get_products.
+    # Частичный покрывающий индекс — товары с нулевым остатком в него не попадают.
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_products_in_stock
+    ON Products (category_id, type, id, name, price, quantity)
+    WHERE quantity > 0
+    """)
+    # Поиск pending-платежа админом по (user_id, amount), последний — по id DESC
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_payments_pending_user_amount
+    ON Payments (user_id, amount, id)
+    WHERE status = 'pending'
+    """)
+    # Курс по валюте (покрывающий)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_ratesy_currency
+    ON RatesY (currency, rate_to_y)
+    """)
+    # История покупок пользователя
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_purchase_user
+    ON Purchase (user_id, id)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_appointments_user
+    ON appointments_requests (user_id, id)
+    """)
+
+
+def _m004_catalog_version(cursor: sqlite3.Cursor):
+    """
+    Счётчик версии каталога для utils/catalog_cache.py. Увеличивается триггерами при любом
+    изменении, видимом в каталоге: правки категорий/товаров и покупки, обнулившие остаток.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS CatalogVersion (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO CatalogVersion (id, version) VALUES (1, 1)")
+
+    bump = "UPDATE CatalogVersion SET version = version + 1 WHERE id = 1;"
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_products_insert_catalog_version
+    AFTER INSERT ON Products
+    BEGIN {bump} END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_products_delete_catalog_version
+    AFTER DELETE ON Products
+    BEGIN {bump} END
+    """)
+    # Обычная покупка (10 -> 9) каталог не меняет, поэтому остаток учитываем
+    # только при переходе через ноль
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_products_update_catalog_version
+    AFTER UPDATE ON Products
+    WHEN NEW.category_id IS NOT OLD.category_id
+      OR NEW.type IS NOT OLD.type
+      OR NEW.name IS NOT OLD.name
+      OR NEW.description IS NOT OLD.description
+      OR NEW.price IS NOT OLD.price
+      OR NEW.photo_path IS NOT OLD.photo_path
+      OR (NEW.quantity > 0) IS NOT (OLD.quantity > 0)
+    BEGIN {bump} END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_insert_catalog_version
+    AFTER INSERT ON Categories
+    BEGIN {bump} END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_update_catalog_version
+    AFTER UPDATE ON Categories
+    BEGIN {bump} END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_delete_catalog_version
+    AFTER DELETE ON Categories
+    BEGIN {bump} END
+    """)
+
+
+def _m005_media_cache(cursor: sqlite3.Cursor):
+    """
+    Telegram file_id уже загруженных картинок (utils/media.py): (путь, хэш содержимого) -> file_id.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS MediaCache (
+        path TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        file_id TEXT NOT NULL,
+        date TEXT,
+        PRIMARY KEY (path, content_hash)
+    ) WITHOUT ROWID
+    """)
+
+
+def _m006_pending_payments_index(cursor: sqlite3.Cursor):
+    """
+    Очередь платежей на проверку (/pending): частичный покрывающий индекс только по pending-строкам,
+    список по порядку id читается из индекса, не касаясь таблицы и обработанных платежей.
+    """
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_payments_pending_queue
+    ON Payments(id, user_id, amount, currency, date)
+    WHERE status = 'pending'
+    """)
+
+
+def _m007_payments_screenshot_index(cursor: sqlite3.Cursor):
+    """
+    Поиск платежа по скриншоту: повторно присланный тот же скриншот не создаёт новый платёж.
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_screenshot ON Payments(screenshot_path)")
+
+
+def _m008_outbox(cursor: sqlite3.Cursor):
+    """
+    Очередь исходящих уведомлений (utils/outbox.py): строка живёт, пока сообщение не доставлено,
+    поэтому после перезапуска недоставленное отправляется заново.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        method TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        created_at REAL NOT NULL
+    )
+    """)
+
+
+def _m009_fsm_storage(cursor: sqlite3.Cursor):
+    """
+    Состояния FSM (utils/fsm_storage.py): переживают перезапуск бота.
+    Индекс по updated_at — для удаления брошенных сценариев по TTL.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS FSMState (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL DEFAULT '{}',
+        updated_at REAL NOT NULL
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fsmstate_updated ON FSMState(updated_at)")
+
+
+def _m010_callback_ids(cursor: sqlite3.Cursor):
+    """
+    Компактные callback_data (utils/callback_codec.py).
+    Subcategories — постоянные числовые id подкатегорий (Products.type) для кнопок вместо названий:
+    строки только добавляются (AUTOINCREMENT, без удаления), поэтому id на старых кнопках не переходят
+    к другой подкатегории. CallbackTokens — короткоживущие токены для данных, не влезающих в 64 байта.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Subcategories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        UNIQUE (category_id, name)
+    )
+    """)
+    cursor.execute("""
+    INSERT OR IGNORE INTO Subcategories (category_id, name)
+    SELECT DISTINCT category_id, type FROM Products ORDER BY category_id, type
+    """)
+    intern = "INSERT OR IGNORE INTO Subcategories (category_id, name) VALUES (NEW.category_id, NEW.type);"
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_products_insert_subcategory
+    AFTER INSERT ON Products
+    BEGIN {intern} END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_products_update_subcategory
+    AFTER UPDATE OF category_id, type ON Products
+    BEGIN {intern} END
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS CallbackTokens (
+        token TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_callbacktokens_expires ON CallbackTokens(expires_at)")
+
+
+def _m011_products_category_index(cursor: sqlite3.Cursor):
+    """
+    Раздел «О боте» (get_about_stats): COUNT(*) по узкому индексу вместо строк Products
+    и проверка «у категории есть товары» одним поиском — с учётом товаров без остатка,
+    которых нет в idx_products_in_stock.
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_category ON Products(category_id)")
+
+
+def _m012_product_search(cursor: sqlite3.Cursor):
+    """
+    Полнотекстовый поиск товаров (utils/search.py): FTS5-таблица ProductSearch, rowid = Products.id,
+    колонки — название, описание, подкатегория (type) и название категории. Триггеры держат её
+    в согласии с Products и Categories; покупки (меняется только quantity) индекс не трогают.
+    unicode61 приводит к нижнему регистру и кириллицу, remove_diacritics 2 снимает диакритику
+    с латиницы (café = cafe); «ё» он не трогает, поэтому в индекс она пишется как «е»
+    (запрос приводится так же). prefix — индексы префиксов из 2 и 3 символов для «слово*».
+    """
+    def fold(column: str) -> str:
+        return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS ProductSearch USING fts5(
+        name, description, type, category,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """)
+    cursor.execute(f"""
+    INSERT INTO ProductSearch (rowid, name, description, type, category)
+    SELECT p.id, {fold("p.name")}, {fold("p.description")}, {fold("p.type")}, {fold("c.display_name")}
+    FROM Products p
+    LEFT JOIN Categories c ON c.id = p.category_id
+    WHERE p.id NOT IN (SELECT rowid FROM ProductSearch)
+    """)
+    index = f"""
+        INSERT INTO ProductSearch (rowid, name, description, type, category)
+        VALUES (NEW.id, {fold("NEW.name")}, {fold("NEW.description")}, {fold("NEW.type")},
+                (SELECT {fold("display_name")} FROM Categories WHERE id = NEW.category_id));
+    """
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_products_insert_search
+    AFTER INSERT ON Products
+    BEGIN {index} END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_products_update_search
+    AFTER UPDATE OF id, category_id, type, name, description ON Products
+    BEGIN
+        DELETE FROM ProductSearch WHERE rowid = OLD.id;
+        {index}
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_products_delete_search
+    AFTER DELETE ON Products
+    BEGIN
+        DELETE FROM ProductSearch WHERE rowid = OLD.id;
+    END
+    """)
+    # Переименование категории — по idx_products_category (миграция 011)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_update_search
+    AFTER UPDATE OF display_name ON Categories
+    BEGIN
+        UPDATE ProductSearch SET category = {fold("NEW.display_name")}
+        WHERE rowid IN (SELECT id FROM Products WHERE category_id = NEW.id);
+    END
+    """)
+
+
+def _m013_processed_updates(cursor: sqlite3.Cursor):
+    """
+    Повтор апдейтов после падения рабочего процесса (supervisor.py): ProcessedUpdates — уже
+    обработанные update_id, повторно они не выполняются; строки старше PROCESSED_UPDATES_TTL_SECONDS
+    удаляет супервизор. Purchase.callback_id — id нажатия «Подтвердить покупку»: то же нажатие
+    не списывает баланс второй раз (database.checkout), даже если процесс упал сразу после покупки.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ProcessedUpdates (
+        update_id INTEGER PRIMARY KEY,
+        processed_at REAL NOT NULL
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_processedupdates_at ON ProcessedUpdates(processed_at)")
+    cursor.execute("ALTER TABLE Purchase ADD COLUMN callback_id TEXT")
+    cursor.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_purchase_callback
+    ON Purchase(callback_id) WHERE callback_id IS NOT NULL
+    """)
+
+
+MIGRATIONS = [
+    _m001_base_schema,
+    _m002_appointments_and_logic_type,
+    _m003_hot_path_indexes,
+    _m004_catalog_version,
+    _m005_media_cache,
+    _m006_pending_payments_index,
+    _m007_payments_screenshot_index,
+    _m008_outbox,
+    _m009_fsm_storage,
+    _m010_callback_ids,
+    _m011_products_category_index,
+    _m012_product_search,
+    _m013_processed_updates,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Применяет недостающие миграции. Вызывается внутри транзакции (см. database.init_db),
+    поэтому при ошибке откатывается вся пачка вместе с user_version.
+    Возвращает итоговую версию схемы.
+    """
+    current = get_schema_version(conn)
+    if current > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Версия схемы БД ({current}) новее, чем знает код ({SCHEMA_VERSION})."
+        )
+    cursor = conn.cursor()
+    for version in range(current + 1, SCHEMA_VERSION + 1):
+        step = MIGRATIONS[version - 1]
+        logger.info("[migrations] Применяем миграцию %s: %s", version, step.__name__)
+        step(cursor)
+        # PRAGMA не принимает параметры, version — int из range
+        cursor.execute(f"PRAGMA user_version = {version}")
+    return SCHEMA_VERSION
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: tuple) -> list[str]:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+# Справочники из единиц строк: их полный просмотр в плане — не регрессия
+SMALL_TABLES = {"Categories"}
+
+
+def check_query_plans(conn: sqlite3.Connection, queries: list[tuple] | None = None) -> list[str]:
+    """
+    Прогоняет EXPLAIN QUERY PLAN для горячих запросов из database.HOT_QUERIES
+    (или для queries в том же формате — так проверки из bench/ проверяют свои запросы).
+    Возвращает список проблем: полный просмотр таблицы (SCAN без индекса)
+    или неиспользование ожидаемого индекса. Пустой список — всё в порядке.
+    """
+    if queries is None:
+        from database import HOT_QUERIES as queries
+
+    problems = []
+    for name, sql, params, expected_index in queries:
+        plan = explain(conn, sql, params)
+        for detail in plan:
+            if detail.startswith("SCAN") and "INDEX" not in detail and detail.split()[1] not in SMALL_TABLES:
+                problems.append(f"{name}: полный просмотр таблицы ({detail})")
+        if expected_index and not any(expected_index in detail for detail in plan):
+            problems.append(f"{name}: не используется индекс {expected_index} (план: {'; '.join(plan)})")
+    return problems
+
+
+if __name__ == "__main__":
+    # python migrations.py — применить миграции и проверить планы запросов (код возврата 1 при регрессии)
+    logging.basicConfig(level=logging.INFO)
+    from db_pool import connection, transaction
+
+    with transaction() as conn:
+        version = migrate(conn)
+    print(f"Версия схемы: {version}")
+    with connection() as conn:
+        problems = check_query_plans(conn)
+    for problem in problems:
+        print(f"REGRESSION: {problem}")
+    if not problems:
+        print("Планы горячих запросов в порядке.")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,173 @@
+# Асинхронный доступ к БД для хэндлеров.
+# Функции повторяют database.py, но выполняются в отдельном пуле потоков БД,
+# поэтому медленный диск задерживает только тот апдейт, который сделал запрос,
+# а не весь event loop диспетчера.
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from config import DB_POOL_SIZE
+from db_pool import close_pool
+from utils.metrics import metrics
+from utils.user_cache import user_cache
+
+# Потоков столько же, сколько соединений в пуле: больше всё равно будут ждать соединение
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+    return _executor
+
+
+def _timed(func, args, kwargs):
+    started = time.perf_counter()
+    return func(*args, **kwargs), started, time.perf_counter()
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    Выполняет синхронную функцию работы с БД в потоке БД и возвращает её результат.
+    Время ожидания потока и выполнения (по имени функции) уходит в метрики — записываются
+    они уже здесь, в потоке event loop.
+    """
+    loop = asyncio.get_running_loop()
+    queued = time.perf_counter()
+    try:
+        result, started, finished = await loop.run_in_executor(_get_executor(), _timed, func, args, kwargs)
+    except Exception:
+        metrics.db_errors.inc(getattr(func, "__name__", "other"))
+        raise
+    metrics.db_wait_seconds.observe(started - queued)
+    metrics.db_seconds.observe(finished - started, getattr(func, "__name__", "other"))
+    return result
+
+
+def shutdown_db():
+    """
+    Останавливает потоки БД и закрывает соединения пула (вызывается при остановке бота).
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    close_pool()
+
+
+async def init_db():
+    return await run_db(database.init_db)
+
+async def initialize_demo_products():
+    return await run_db(database.initialize_demo_products)
+
+# Пользователи читаются через user_cache (read-through), а записи баланса/языка
+# сразу обновляют кэш (write-through). Прочитанное при промахе кладётся через
+# begin_read/end_read — запись, прошедшая во время чтения, не затирается старой строкой.
+async def _read_user(telegram_id: int, func, *args):
+    row = user_cache.get(telegram_id)
+    if row is None:
+        token = user_cache.begin_read(telegram_id)
+        try:
+            row = await run_db(func, *args)
+        finally:
+            user_cache.end_read(telegram_id, token, row)
+    return row
+
+async def get_user_by_telegram_id(telegram_id: int):
+    return await _read_user(telegram_id, database.get_user_by_telegram_id, telegram_id)
+
+async def get_or_create_user(telegram_id: int, username: str, language: str):
+    return await _read_user(telegram_id, database.get_or_create_user, telegram_id, username, language)
+
+async def add_new_user(telegram_id: int, username: str, language: str):
+    await run_db(database.add_new_user, telegram_id, username, language)
+    user_cache.invalidate(telegram_id)
+
+async def get_balance(telegram_id: int) -> float:
+    user = await get_user_by_telegram_id(telegram_id)
+    if user:
+        return user[3]
+    return 0.0
+
+async def update_user_balance(telegram_id: int, new_balance: float):
+    await run_db(database.update_user_balance, telegram_id, new_balance)
+    user_cache.update(telegram_id, balance=new_balance)
+
+async def update_user_language(telegram_id: int, language: str):
+    await run_db(database.update_user_language, telegram_id, language)
+    user_cache.update(telegram_id, language=language)
+
+async def get_rate(currency: str) -> float:
+    return await run_db(database.get_rate, currency)
+
+async def get_unique_categories() -> list[str]:
+    return await run_db(database.get_unique_categories)
+
+async def get_unique_subcategories(category_safe_id: str) -> list[str]:
+    return await run_db(database.get_unique_subcategories, category_safe_id)
+
+async def get_products(category_safe_id: str, subcat: str) -> list[tuple]:
+    return await run_db(database.get_products, category_safe_id, subcat)
+
+async def get_product_card(product_id: int):
+    return await run_db(database.get_product_card, product_id)
+
+async def get_product_price(product_id: int):
+    return await run_db(database.get_product_price, product_id)
+
+async def get_product_order_info(product_id: int):
+    return await run_db(database.get_product_order_info, product_id)
+
+async def get_product_name(product_id: int):
+    return await run_db(database.get_product_name, product_id)
+
+async def checkout(telegram_id: int, username: str, product_id: int, callback_id: str | None = None):
+    result = await run_db(database.checkout, telegram_id, username, product_id, callback_id)
+    if result[0] == database.CHECKOUT_OK:
+        user_cache.update(telegram_id, balance=result[4])
+    return result
+
+async def add_purchase(telegram_id: int, username: str, product_id) -> int:
+    return await run_db(database.add_purchase, telegram_id, username, product_id)
+
+async def add_payment(telegram_id: int, amount: float, currency: str, screenshot_path: str) -> int:
+    return await run_db(database.add_payment, telegram_id, amount, currency, screenshot_path)
+
+async def confirm_pending_payment(telegram_id: int, amount: float):
+    result = await run_db(database.confirm_pending_payment, telegram_id, amount)
+    if result and result[1] is not None:
+        user_cache.update(telegram_id, balance=result[1])
+    return result
+
+async def find_payment_by_screenshot(screenshot_path: str):
+    return await run_db(database.find_payment_by_screenshot, screenshot_path)
+
+async def confirm_payment(payment_id: int):
+    result = await run_db(database.confirm_payment, payment_id)
+    if result and result[2] is not None:
+        user_cache.update(result[0], balance=result[2])
+    return result
+
+async def reject_payment(payment_id: int):
+    return await run_db(database.reject_payment, payment_id)
+
+async def list_pending_payments(after_id: int = 0, limit: int = 20) -> list[tuple]:
+    return await run_db(database.list_pending_payments, after_id, limit)
+
+async def count_pending_payments() -> int:
+    return await run_db(database.count_pending_payments)
+
+async def reject_pending_payment(telegram_id: int, amount: float):
+    return await run_db(database.reject_pending_payment, telegram_id, amount)
+
+async def add_appointment_request(telegram_id: int, product_id, description: str) -> int:
+    return await run_db(database.add_appointment_request, telegram_id, product_id, description)
+
+async def get_about_stats() -> tuple[int, int]:
+    return await run_db(database.get_about_stats)
+
+async def get_product_photo_paths() -> list[str]:
+    return await run_db(database.get_product_photo_paths)
@@ -0,0 +1,588 @@
+# Многопроцессный режим (WORKER_PROCESSES > 1).
+# Процесс-супервизор один раз получает апдейты (getUpdates или webhook) и раздаёт их
+# N рабочим процессам по from_user.id: все апдейты одного пользователя обрабатывает один
+# процесс и строго по порядку, поэтому кэши FSM и профилей в его памяти остаются верными.
+# Общее состояние — SQLite (WAL): FSM (utils/fsm_storage.py), пользователи, платежи, Outbox.
+# Уведомления рабочие процессы только записывают в Outbox, доставляет их супервизор —
+# так лимиты Telegram соблюдаются на всего бота, а не на каждый процесс.
+import asyncio
+import collections
+import json
+import logging
+import multiprocessing
+import secrets
+import signal
+import threading
+import time
+
+import aiohttp
+from aiogram import Bot
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+from aiohttp import web
+
+from config import (
+    BOT_MODE, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET,
+    WORKER_HEARTBEAT_INTERVAL, WORKER_HEARTBEAT_TIMEOUT, WORKER_MAX_CONCURRENT_UPDATES,
+    OUTBOX_POLL_INTERVAL, PROCESSED_UPDATES_TTL_SECONDS,
+)
+from utils.metrics import metrics, start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+POLL_TIMEOUT = 30               # long polling getUpdates, сек.
+SEND_BATCH = 200                # апдейтов в одной посылке рабочему процессу
+MAX_BUFFERED_UPDATES = 10000    # больше не разобрано рабочими — перестаём забирать новые
+MAX_RESTART_DELAY = 60.0
+START_TIMEOUT = 120.0           # на импорт и инициализацию до первого heartbeat
+PRUNE_INTERVAL = 600.0          # как часто удаляются старые записи ProcessedUpdates, сек.
+METRICS_TIMEOUT = 2.0           # столько ждём снимок метрик от рабочего процесса при запросе /metrics
+
+
+def shard_key(update: dict) -> int:
+    """
+    id пользователя, от которого пришёл апдейт (from / user), иначе id чата; 0 — ни того, ни другого.
+    """
+    for field, value in update.items():
+        if field == "update_id" or not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+
+def shard_of(key: int, count: int) -> int:
+    return key % count
+
+
+# --- рабочий процесс ---
+
+def _worker_main(index: int, count: int, conn):
+    # Ctrl+C получает вся группа процессов; останавливает рабочих супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        asyncio.run(_worker(index, count, conn))
+    finally:
+        # Процесс завершится через os._exit — дописываем очередь логов сами
+        from utils.log_setup import stop_logging
+        stop_logging()
+
+
+async def _worker(index: int, count: int, conn):
+    import bot as bot_app
+    import database
+    from repository import run_db, shutdown_db
+    from utils.callback_codec import callback_tokens
+    from utils.fsm_storage import SQLiteStorage
+    from utils.image_optimizer import load_manifest
+    from utils.media import media_registry
+    from utils.outbox import outbox
+    from utils.user_cache import user_cache
+
+    if not bot_app.load_admin():
+        return
+    bot = bot_app.create_bot()
+    storage = SQLiteStorage()
+    dp = bot_app.create_dispatcher(storage)
+    outbox.store_only = True
+
+    def on_user_write(telegram_id: int):
+        # Пользователя обслуживает другой процесс — пусть сбросит свою копию строки
+        if shard_of(telegram_id, count) != index:
+            conn.send(("invalidate_user", telegram_id))
+
+    user_cache.on_write = on_user_write
+
+    # Картинки готовит только процесс 0, остальные перечитают манифест по "media_reload"
+    media_task = await bot_app.startup(bot, with_media=index == 0)
+    if media_task is not None:
+        media_task.add_done_callback(lambda _: conn.send(("media_ready", None)))
+
+    loop = asyncio.get_running_loop()
+    inbox: asyncio.Queue[list] = asyncio.Queue()
+
+    def reader():
+        # recv блокирующий — читаем в отдельном потоке, в цикл передаём готовые пачки
+        try:
+            while True:
+                loop.call_soon_threadsafe(inbox.put_nowait, conn.recv())
+        except (EOFError, OSError):
+            loop.call_soon_threadsafe(inbox.put_nowait, (None, [("stop", None)]))
+
+    threading.Thread(target=reader, name=f"worker-{index}-reader", daemon=True).start()
+
+    limiter = asyncio.Semaphore(WORKER_MAX_CONCURRENT_UPDATES)
+    chains: dict[int, asyncio.Task] = {}  # пользователь -> его последний апдейт в обработке
+    last_ack: asyncio.Task | None = None   # подтверждение последней полученной пачки
+    processed = 0
+
+    async def process(data: dict, previous: asyncio.Task | None, replayed: bool):
+        nonlocal processed
+        if previous is not None:
+            # Апдейты одного пользователя — строго по очереди
+            await asyncio.wait([previous])
+        async with limiter:
+            update_id = data.get("update_id")
+            try:
+                if replayed and await run_db(database.update_processed, update_id):
+                    # Упавший процесс успел его обработать, но не подтвердить пачку
+                    logger.info("[worker %s] Апдейт %s уже обработан, повтор пропущен", index, update_id)
+                    return
+                update = Update.model_validate(data, context={"bot": bot})
+                result = await dp.feed_update(bot, update)
+                if isinstance(result, TelegramMethod):
+                    # В webhook-режиме супервизор отвечает Telegram сразу, поэтому метод,
+                    # возвращённый хэндлером (`return call.answer()`), вызываем сами
+                    await bot(result)
+            except Exception as e:
+                logger.exception("[worker %s] Ошибка обработки апдейта %s: %s", index, update_id, e)
+            try:
+                # Повтор пачки после падения процесса пропустит этот апдейт
+                await run_db(database.mark_update_processed, update_id, time.time())
+            except Exception as e:
+                logger.error("[worker %s] Не удалось отметить апдейт %s: %s", index, update_id, e)
+        processed += 1
+
+    def schedule(data: dict, replayed: bool = False) -> asyncio.Task:
+        key = shard_key(data)
+        task = asyncio.create_task(process(data, chains.get(key), replayed))
+        chains[key] = task
+        task.add_done_callback(lambda t: chains.get(key) is t and chains.pop(key))
+        return task
+
+    async def ack(seq: int, tasks: list[asyncio.Task], previous: asyncio.Task | None):
+        # Пачка подтверждается, когда обработаны все её апдейты: до этого супервизор держит её
+        # в unacked и после падения процесса отправит новому. Подтверждения накопительные
+        # (ack N снимает все пачки до N), поэтому уходят строго по порядку пачек
+        if previous is not None:
+            await asyncio.wait([previous])
+        if tasks:
+            await asyncio.wait(tasks)
+        conn.send(("ack", seq))
+
+    async def reload_media():
+        await asyncio.to_thread(load_manifest)
+        await media_registry.load()
+
+    async def heartbeat():
+        while True:
+            conn.send(("heartbeat", {"processed": processed, "active": len(chains)}))
+            await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+
+    heartbeat_task = asyncio.create_task(heartbeat())
+    logger.info("[worker %s] Запущен", index)
+    try:
+        stopping = False
+        while not stopping:
+            seq, batch = await inbox.get()
+            tasks = []
+            for kind, payload in batch:
+                if kind in ("update", "replay"):
+                    tasks.append(schedule(payload, kind == "replay"))
+                elif kind == "invalidate_user":
+                    user_cache.invalidate(payload, notify=False)
+                elif kind == "media_reload":
+                    asyncio.create_task(reload_media())
+                elif kind == "metrics":
+                    # Снимок — только по запросу /metrics у супервизора, без него рабочий ничего не шлёт
+                    conn.send(("metrics", metrics.snapshot()))
+                elif kind == "stop":
+                    stopping = True
+            if seq is not None:
+                last_ack = asyncio.create_task(ack(seq, tasks, last_ack))
+        # Дорабатываем то, что уже взяли, и подтверждаем
+        if last_ack is not None:
+            await asyncio.wait([last_ack])
+    finally:
+        heartbeat_task.cancel()
+        await storage.close()
+        await callback_tokens.flush()
+        await bot.session.close()
+        shutdown_db()
+        logger.info("[worker %s] Остановлен, обработано апдейтов: %s", index, processed)
+
+
+# --- супервизор ---
+
+class WorkerHandle:
+    """
+    Рабочий процесс и канал к нему (duplex Pipe): вниз — пачки апдейтов и команд,
+    вверх — heartbeat, подтверждения пачек и служебные сообщения. Неотправленное копится
+    в buffer, отправленное, но не подтверждённое — в unacked; после перезапуска процесса
+    и то и другое уходит новому. Рабочий подтверждает пачку, только когда обработаны все её
+    апдейты; неподтверждённые апдейты новый процесс получает как "replay" и пропускает те,
+    что упавший успел обработать (ProcessedUpdates в общей БД).
+    """
+
+    def __init__(self, ctx, index: int, count: int, on_message, target=_worker_main):
+        self._ctx = ctx
+        self._target = target
+        self.index = index
+        self.count = count
+        self._on_message = on_message
+        self.process = None
+        self.conn = None
+        self.buffer: collections.deque = collections.deque()
+        self.unacked: collections.deque = collections.deque()  # (seq, batch)
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._sender: asyncio.Task | None = None
+        self.last_seen = 0.0
+        self.stats: dict = {}
+        self.ready = False
+        self.restarts = 0
+        self._failures = 0
+        self._restart_at = 0.0
+        self._metrics_waiters: list[asyncio.Future] = []
+
+    def start(self):
+        parent, child = self._ctx.Pipe()
+        self.process = self._ctx.Process(
+            target=self._target, args=(self.index, self.count, child), name=f"bot-worker-{self.index}"
+        )
+        self.process.start()
+        child.close()
+        self.conn = parent
+        self.last_seen = time.monotonic()
+        self.ready = False
+        asyncio.get_running_loop().add_reader(parent.fileno(), self._on_readable)
+        if self._sender is None:
+            self._sender = asyncio.create_task(self._send_loop())
+        self._wakeup.set()
+
+    def push(self, kind: str, payload=None):
+        self.buffer.append((kind, payload))
+        self._wakeup.set()
+
+    def _on_readable(self):
+        try:
+            while self.conn is not None and self.conn.poll():
+                kind, payload = self.conn.recv()
+                self.last_seen = time.monotonic()
+                if kind == "ack":
+                    while self.unacked and self.unacked[0][0] <= payload:
+                        self.unacked.popleft()
+                elif kind == "heartbeat":
+                    self.stats = payload
+                    self.ready = True
+                    self._failures = 0
+                elif kind == "metrics":
+                    waiters, self._metrics_waiters = self._metrics_waiters, []
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_result(payload)
+                else:
+                    self._on_message(self, kind, payload)
+        except (EOFError, OSError):
+            self._detach()
+
+    def _detach(self):
+        if self.conn is not None:
+            asyncio.get_running_loop().remove_reader(self.conn.fileno())
+            self.conn.close()
+            self.conn = None
+
+    async def _send_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.buffer and self.conn is not None:
+                batch = [self.buffer.popleft() for _ in range(min(len(self.buffer), SEND_BATCH))]
+                self._seq += 1
+                self.unacked.append((self._seq, batch))
+                try:
+                    await asyncio.to_thread(self.conn.send, (self._seq, batch))
+                except (OSError, ValueError, AttributeError):
+                    # Процесс умер — пачка в unacked, уйдёт новому после перезапуска
+                    break
+
+    async def metrics(self, timeout: float = METRICS_TIMEOUT) -> dict | None:
+        """
+        Снимок метрик рабочего процесса (utils/metrics.py) или None, если он не ответил.
+        Одновременные запросы ждут один ответ.
+        """
+        if not self.ready or self.conn is None:
+            return None
+        waiter = asyncio.get_running_loop().create_future()
+        if not self._metrics_waiters:
+            self.push("metrics")
+        self._metrics_waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            # Ответ потерян (процесс перезапущен) — следующий запрос отправит команду заново
+            if waiter in self._metrics_waiters:
+                self._metrics_waiters.remove(waiter)
+            return None
+
+    def check(self, now: float):
+        """
+        Перезапускает упавший или зависший (нет heartbeat) процесс. Подряд падающий
+        процесс перезапускается с растущей паузой.
+        """
+        alive = self.process.is_alive()
+        timeout = WORKER_HEARTBEAT_TIMEOUT if self.ready else START_TIMEOUT
+        if alive and now - self.last_seen <= timeout:
+            return
+        if now < self._restart_at:
+            return
+        if alive:
+            logger.error("[supervisor] Рабочий процесс %s не отвечает %.0f c, перезапуск", self.index, now - self.last_seen)
+            self.process.kill()
+        else:
+            logger.error("[supervisor] Рабочий процесс %s завершился (код %s), перезапуск", self.index, self.process.exitcode)
+        self.process.join(timeout=5)
+        self._detach()
+        # Всё, что процесс мог не успеть обработать, — в начало очереди, порядок сохраняется
+        while self.unacked:
+            _, batch = self.unacked.pop()
+            self.buffer.extendleft(
+                ("replay", payload) if kind == "update" else (kind, payload) for kind, payload in reversed(batch)
+            )
+        self.restarts += 1
+        self._failures += 1
+        self._restart_at = now + min(2 ** self._failures, MAX_RESTART_DELAY)
+        self.start()
+
+    async def stop(self, timeout: float):
+        self.push("stop")
+        await asyncio.to_thread(self.process.join, timeout)
+        if self.process.is_alive():
+            logger.warning("[supervisor] Рабочий процесс %s не остановился за %s c", self.index, timeout)
+            self.process.terminate()
+            await asyncio.to_thread(self.process.join, 5)
+        self._detach()
+        if self._sender is not None:
+            self._sender.cancel()
+
+    def health(self, now: float) -> dict:
+        return {
+            "alive": self.process is not None and self.process.is_alive(),
+            "ready": self.ready,
+            "pid": self.process.pid if self.process else None,
+            "last_seen_seconds": round(now - self.last_seen, 1),
+            "buffered": len(self.buffer) + sum(len(batch) for _, batch in self.unacked),
+            "restarts": self.restarts,
+            **self.stats,
+        }
+
+
+class Supervisor:
+    def __init__(self, count: int, worker_target=_worker_main):
+        ctx = multiprocessing.get_context("spawn")  # чистые процессы: без чужого event loop и соединений SQLite
+        self.workers = [
+            WorkerHandle(ctx, index, count, self._on_message, worker_target) for index in range(count)
+        ]
+        self.received = 0
+        metrics.collect(
+            "bot_supervisor_received_total", "Апдейты, полученные супервизором", "counter", (),
+            lambda: {(): self.received},
+        )
+        metrics.collect(
+            "bot_worker_buffered_updates", "Апдейты, ещё не подтверждённые рабочим процессом", "gauge", ("worker",),
+            lambda: {(str(w.index),): len(w.buffer) + sum(len(batch) for _, batch in w.unacked) for w in self.workers},
+        )
+        metrics.collect(
+            "bot_worker_up", "Рабочий процесс жив и присылает heartbeat", "gauge", ("worker",),
+            lambda: {(str(w.index),): int(w.ready and w.process is not None and w.process.is_alive()) for w in self.workers},
+        )
+        metrics.collect(
+            "bot_worker_restarts_total", "Перезапуски рабочего процесса", "counter", ("worker",),
+            lambda: {(str(w.index),): w.restarts for w in self.workers},
+        )
+
+    def dispatch(self, update: dict):
+        self.received += 1
+        self.workers[shard_of(shard_key(update), len(self.workers))].push("update", update)
+
+    def buffered(self) -> int:
+        # Не подтверждённые пачки ещё в обработке — тоже считаются
+        return sum(len(worker.buffer) + sum(len(batch) for _, batch in worker.unacked) for worker in self.workers)
+
+    def _on_message(self, source: WorkerHandle, kind: str, payload):
+        if kind == "invalidate_user":
+            self.workers[shard_of(payload, len(self.workers))].push("invalidate_user", payload)
+        elif kind == "media_ready":
+            for worker in self.workers:
+                if worker is not source:
+                    worker.push("media_reload")
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    async def watch(self):
+        import database
+        from repository import run_db
+
+        pruned_at = time.monotonic()
+        while True:
+            await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+            now = time.monotonic()
+            for worker in self.workers:
+                worker.check(now)
+            if now - pruned_at >= PRUNE_INTERVAL:
+                pruned_at = now
+                try:
+                    await run_db(database.processed_updates_delete_expired, time.time() - PROCESSED_UPDATES_TTL_SECONDS)
+                except Exception as e:
+                    logger.error("[supervisor] Не удалось удалить старые ProcessedUpdates: %s", e)
+
+    async def stop(self, timeout: float = 30.0):
+        await asyncio.gather(*(worker.stop(timeout) for worker in self.workers))
+
+    async def render_metrics(self) -> str:
+        """
+        Метрики супервизора и снимки всех рабочих процессов (метка worker) одним текстом.
+        Не ответивший процесс просто отсутствует в выдаче — его состояние видно по bot_worker_up.
+        """
+        snapshots = await asyncio.gather(*(worker.metrics() for worker in self.workers))
+        sources = [({}, metrics.snapshot())]
+        sources += [
+            ({"worker": str(worker.index)}, snapshot)
+            for worker, snapshot in zip(self.workers, snapshots) if snapshot is not None
+        ]
+        return metrics.render(sources)
+
+    def health(self) -> dict:
+        now = time.monotonic()
+        workers = [worker.health(now) for worker in self.workers]
+        return {
+            "ok": all(worker["alive"] and worker["ready"] for worker in workers),
+            "received": self.received,
+            "buffered": self.buffered(),
+            "workers": workers,
+        }
+
+
+async def _poll_updates(bot: Bot, supervisor: Supervisor, allowed_updates: list[str]):
+    """
+    Long polling без разбора апдейтов в объекты aiogram: супервизору нужен только from.id,
+    объекты строят рабочие процессы. Работает до отмены задачи.
+    """
+    await bot.delete_webhook(drop_pending_updates=False)
+    url = bot.session.api.api_url(bot.token, "getUpdates")
+    offset = 0
+    backoff = 1.0
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=POLL_TIMEOUT + 10)) as session:
+        try:
+            while True:
+                while supervisor.buffered() > MAX_BUFFERED_UPDATES:
+                    await asyncio.sleep(0.1)
+                params = {"offset": offset, "timeout": POLL_TIMEOUT, "allowed_updates": allowed_updates}
+                try:
+                    async with session.post(url, json=params) as response:
+                        body = await response.json(loads=json.loads)
+                    if not body.get("ok"):
+                        raise RuntimeError(body.get("description"))
+                    backoff = 1.0
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error("[supervisor] Ошибка getUpdates: %s", e)
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 30.0)
+                    continue
+                for update in body["result"]:
+                    offset = update["update_id"] + 1
+                    supervisor.dispatch(update)
+        finally:
+            if offset:
+                # Подтверждаем последние полученные апдейты, иначе после перезапуска они придут снова
+                try:
+                    async with session.post(url, json={"offset": offset, "timeout": 0, "limit": 1}):
+                        pass
+                except Exception:
+                    pass
+
+
+def build_app(supervisor: Supervisor, secret_token: str, path: str = WEBHOOK_PATH) -> web.Application:
+    """
+    Webhook супервизора: апдейт сразу отдаётся рабочему процессу, Telegram получает пустой 200.
+    Ответить методом в теле HTTP-ответа здесь нельзя — такие методы вызывают рабочие процессы.
+    GET /health — состояние рабочих процессов (503, если какой-то не работает).
+    """
+
+    async def handle_update(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secrets.compare_digest(token, secret_token):
+            return web.Response(status=401, text="Unauthorized")
+        supervisor.dispatch(await request.json(loads=json.loads))
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        state = supervisor.health()
+        return web.json_response(state, status=200 if state["ok"] else 503)
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get("/health", health)
+    return app
+
+
+async def run_supervisor(count: int):
+    # Импорт здесь: bot.py сам импортирует этот модуль в main()
+    from bot import create_bot, create_dispatcher
+    from repository import init_db, shutdown_db
+    from utils.outbox import outbox
+
+    bot = create_bot()
+    # Диспетчер нужен только чтобы узнать, какие типы апдейтов обрабатывают роутеры
+    allowed_updates = create_dispatcher().resolve_used_update_types()
+    # Миграции — до старта рабочих, чтобы они не применяли их наперегонки
+    await init_db()
+
+    supervisor = Supervisor(count)
+    supervisor.start()
+    watcher = asyncio.create_task(supervisor.watch())
+    # Уведомления пишут в Outbox рабочие процессы, доставляет их супервизор
+    await outbox.start(bot, poll_interval=OUTBOX_POLL_INTERVAL)
+    metrics_runner = await start_metrics_server(supervisor.render_metrics)
+    logger.info("[supervisor] Рабочих процессов: %s, режим: %s", count, BOT_MODE)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    runner = None
+    try:
+        if BOT_MODE == "webhook":
+            if not WEBHOOK_BASE_URL:
+                raise RuntimeError("BOT_MODE = 'webhook', но WEBHOOK_BASE_URL не задан в config.py")
+            secret_token = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+            runner = web.AppRunner(build_app(supervisor, secret_token))
+            await runner.setup()
+            await web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT).start()
+            await bot.set_webhook(
+                url=WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=secret_token,
+                allowed_updates=allowed_updates,
+            )
+            logger.info("[supervisor] Webhook: %s:%s%s, /health", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+            await stop.wait()
+        else:
+            poller = asyncio.create_task(_poll_updates(bot, supervisor, allowed_updates))
+            await asyncio.wait([poller, asyncio.create_task(stop.wait())], return_when=asyncio.FIRST_COMPLETED)
+            poller.cancel()
+            try:
+                await poller
+            except asyncio.CancelledError:
+                pass
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        watcher.cancel()
+        await supervisor.stop()
+        await outbox.stop()
+        await bot.session.close()
+        shutdown_db()
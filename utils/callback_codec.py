@@ -0,0 +1,257 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import time
+import types
+import typing
+from typing import Any, ClassVar
+
+from aiogram.filters.callback_data import MAX_CALLBACK_LENGTH, CallbackData
+
+import database
+from config import CALLBACK_TOKEN_TTL_SECONDS
+from repository import run_db
+
+logger = logging.getLogger(__name__)
+
+# Компактные callback_data. Версии формата кнопок:
+#   v0 — "select_product_17": строки с "_" (до typed CallbackData), разбираются callbacks.legacy();
+#   v1 — "select_product:17": aiogram CallbackData по умолчанию, десятичные числа, длинные префиксы;
+#   v2 — "p:h": CompactCallbackData, короткий префикс, целые в base36.
+# Класс v2 помнит префикс своей v1 (previous=...), таблица callbacks разбирает и его — кнопки
+# в уже отправленных сообщениях продолжают работать. Данные длиннее 64 байт заменяются токеном
+# "~<хэш>", сама строка хранится на сервере (CallbackTokens).
+
+TOKEN_PREFIX = "~"
+TOKEN_RETRY_INTERVAL = 5.0      # после ошибки записи токенов в БД повторяем через столько секунд
+TOKEN_SWEEP_INTERVAL = 600.0    # как часто из памяти убираются истёкшие токены
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+_UNION_TYPES = {typing.Union, types.UnionType}
+
+
+def encode_int(value: int) -> str:
+    if value < 0:
+        return "-" + encode_int(-value)
+    if value < 36:
+        return _DIGITS[value]
+    digits = []
+    while value:
+        value, digit = divmod(value, 36)
+        digits.append(_DIGITS[digit])
+    return "".join(reversed(digits))
+
+
+def _decode_int(value: str) -> int:
+    return int(value, 36)
+
+
+def _decode_bool(value: str) -> bool:
+    return value == "1"
+
+
+def _identity(value: str) -> str:
+    return value
+
+
+# Тип поля -> (кодирование в v2, разбор v2, разбор v1)
+_CODECS = {
+    int: (encode_int, _decode_int, int),
+    bool: (lambda value: "1" if value else "0", _decode_bool, _decode_bool),
+    float: (repr, float, float),
+    str: (_identity, _identity, _identity),
+}
+
+
+def _field_codec(name: str, field) -> tuple:
+    annotation, optional = field.annotation, False
+    if typing.get_origin(annotation) in _UNION_TYPES:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        optional = len(args) < len(typing.get_args(annotation))
+        annotation = args[0] if len(args) == 1 else None
+    if annotation not in _CODECS:
+        raise TypeError(f"Поле {name}: тип {field.annotation!r} не поддерживается компактным форматом")
+    encode, decode, decode_v1 = _CODECS[annotation]
+    default = field.default if optional or not field.is_required() else ...
+    return name, encode, decode, decode_v1, default
+
+
+class CompactCallbackData(CallbackData, prefix="compact"):
+    """
+    CallbackData в компактном формате v2: короткий префикс, целые в base36.
+    Кнопка с одним полем (таких большинство) разбирается одним срезом строки, без split;
+    экземпляр создаётся обычным конструктором (валидация pydantic-core быстрее model_construct).
+
+        class SelectProduct(CompactCallbackData, prefix="p", previous="select_product"):
+            product_id: int
+
+    previous — префикс прежнего формата (v1, те же поля, десятичные числа);
+    callbacks регистрирует его сам. Если упакованная строка не влезает в 64 байта,
+    pack() возвращает токен из callback_tokens.
+    """
+    __previous__: ClassVar[str | None] = None
+    __codec__: ClassVar[tuple] = ()
+
+    def __init_subclass__(cls, **kwargs: Any):
+        cls.__previous__ = kwargs.pop("previous", None)
+        super().__init_subclass__(**kwargs)
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any):
+        super().__pydantic_init_subclass__(**kwargs)
+        cls.__codec__ = tuple(_field_codec(name, field) for name, field in cls.model_fields.items())
+
+    def pack(self) -> str:
+        sep = self.__separator__
+        parts = [self.__prefix__]
+        for name, encode, _, _, _ in self.__codec__:
+            value = getattr(self, name)
+            encoded = "" if value is None else encode(value)
+            if sep in encoded:
+                raise ValueError(f"Символ {sep!r} в значении {name}={encoded!r}")
+            parts.append(encoded)
+        data = sep.join(parts)
+        if len(data) > MAX_CALLBACK_LENGTH // 4 and len(data.encode()) > MAX_CALLBACK_LENGTH:
+            return callback_tokens.put(data)
+        return data
+
+    @classmethod
+    def unpack(cls, value: str):
+        return cls._from_parts(value, 2)
+
+    @classmethod
+    def unpack_previous(cls, value: str):
+        """
+        Разбор формата v1 ("<previous>:<поля>", десятичные числа).
+        """
+        return cls._from_parts(value, 3)
+
+    @classmethod
+    def _from_parts(cls, value: str, decoder: int):
+        codec = cls.__codec__
+        start = value.find(cls.__separator__) + 1
+        if len(codec) == 1:
+            # Частый случай — одно поле: один срез строки, без split
+            if not start:
+                raise TypeError(f"{cls.__name__}: нет значения в {value!r}")
+            field = codec[0]
+            raw = value[start:]
+            return cls(**{field[0]: field[decoder](raw) if raw else cls._default(field)})
+        parts = value[start:].split(cls.__separator__) if start else []
+        if len(parts) != len(codec):
+            raise TypeError(f"{cls.__name__}: ожидается полей {len(codec)}, получено {len(parts)}")
+        return cls(**{
+            field[0]: field[decoder](raw) if raw else cls._default(field)
+            for field, raw in zip(codec, parts)
+        })
+
+    @classmethod
+    def _default(cls, field):
+        if field[4] is ...:
+            raise ValueError(f"{cls.__name__}: пустое обязательное поле {field[0]}")
+        return field[4]
+
+
+class CallbackTokens:
+    """
+    Серверная таблица для callback_data длиннее 64 байт: в кнопку уходит "~" + 12 символов
+    хэша строки, сама строка — в память процесса и (пачкой, в фоне) в таблицу CallbackTokens,
+    чтобы токен разбирался и после перезапуска, и в другом рабочем процессе.
+    Токен детерминирован: одна и та же кнопка всегда получает тот же токен.
+    Не записанные из-за ошибки БД токены пишутся повторно каждые TOKEN_RETRY_INTERVAL,
+    истёкшие убираются из памяти раз в TOKEN_SWEEP_INTERVAL.
+    """
+
+    def __init__(self, ttl: float = CALLBACK_TOKEN_TTL_SECONDS):
+        self.ttl = ttl
+        self._memory: dict[str, tuple[str, float]] = {}   # токен -> (data, expires_at)
+        self._pending: dict[str, tuple[str, float]] = {}
+        self._flusher: asyncio.Task | None = None
+        self._sweeper: asyncio.Task | None = None
+
+    def put(self, data: str) -> str:
+        digest = hashlib.blake2b(data.encode(), digest_size=9).digest()
+        token = TOKEN_PREFIX + base64.urlsafe_b64encode(digest).decode()
+        entry = (data, time.time() + self.ttl)
+        self._memory[token] = entry
+        self._pending[token] = entry
+        self._schedule_flush()
+        return token
+
+    async def expand(self, token: str) -> str | None:
+        entry = self._memory.get(token)
+        now = time.time()
+        if entry is None or entry[1] <= now:
+            row = await run_db(database.callback_token_get, token, now)
+            if row is None:
+                self._memory.pop(token, None)
+                return None
+            entry = self._memory[token] = (row[0], row[1])
+            self._schedule_sweep()
+        return entry[0]
+
+    def _schedule_flush(self):
+        if self._flusher is not None and not self._flusher.done():
+            return
+        try:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+        except RuntimeError:
+            pass  # вне event loop (скрипты) — запишется со следующим токеном
+        self._schedule_sweep()
+
+    def _schedule_sweep(self):
+        if self._sweeper is not None and not self._sweeper.done():
+            return
+        try:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop())
+        except RuntimeError:
+            pass
+
+    async def _flush_loop(self):
+        await asyncio.sleep(0)  # клавиатура строится целиком — все её токены одной транзакцией
+        while self._pending:
+            if not await self._write():
+                # БД недоступна — не ждём следующего токена: без записи кнопки не переживут перезапуск
+                await asyncio.sleep(TOKEN_RETRY_INTERVAL)
+
+    async def _write(self) -> bool:
+        batch, self._pending = self._pending, {}
+        written = False
+        try:
+            await run_db(
+                database.callback_tokens_put, [(t, data, exp) for t, (data, exp) in batch.items()], time.time()
+            )
+            written = True
+        except Exception as e:
+            logger.error("[callback_tokens] Не сохранены токены (%s): %s", len(batch), e)
+        finally:
+            # Не записанное (ошибка или отмена из flush()) — обратно в очередь
+            if not written:
+                for token, entry in batch.items():
+                    self._pending.setdefault(token, entry)
+        return written
+
+    async def _sweep_loop(self):
+        # Истёкшие токены — из памяти; в БД их удаляет callback_tokens_put
+        while self._memory:
+            await asyncio.sleep(TOKEN_SWEEP_INTERVAL)
+            now = time.time()
+            expired = [token for token, (_, expires_at) in self._memory.items() if expires_at <= now]
+            for token in expired:
+                del self._memory[token]
+
+    async def flush(self):
+        """
+        Дописать в БД всё, что ещё не записано (при остановке): одна последняя попытка,
+        без ожидания повторов фоновой записи.
+        """
+        for task in (self._flusher, self._sweeper):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._flusher = self._sweeper = None
+        if self._pending:
+            await self._write()
+
+
+callback_tokens = CallbackTokens()
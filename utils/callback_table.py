@@ -0,0 +1,212 @@
+import logging
+from typing import Callable
+
+from aiogram import Router
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery
+
+from utils.callback_codec import TOKEN_PREFIX, CompactCallbackData, callback_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class _Route:
+    __slots__ = ("handler", "states", "name")
+
+    def __init__(self, callback, states: frozenset | None):
+        self.handler = CallableObject(callback)
+        self.states = states          # None — в любом состоянии FSM
+        self.name = f"{callback.__module__}.{callback.__qualname__}"
+
+
+class _Entry:
+    """
+    Всё, что висит на одном префиксе: класс callback_data, как из строки получить его экземпляр,
+    и хэндлеры (по состояниям FSM).
+    """
+    __slots__ = ("callback_data", "parse", "routes")
+
+    def __init__(self, callback_data: type[CallbackData], parse: Callable[[str], CallbackData], routes: list):
+        self.callback_data = callback_data
+        self.parse = parse
+        self.routes = routes
+
+
+class CallbackTable:
+    """
+    Маршрутизация инлайн-кнопок по префиксу callback_data вместо перебора цепочек
+    F.data.startswith(...) во всех роутерах: префикс ("select_category" из "select_category:keys")
+    ищется в словаре, разбирается только подошедший класс, дальше — выбор хэндлера
+    по состоянию FSM среди нескольких (обычно одного) зарегистрированных на этот префикс.
+    Кнопки-токены ("~...", см. utils/callback_codec.py) сначала разворачиваются в исходную строку.
+
+    Хэндлеры регистрируются декоратором @callbacks(SelectCategory) или
+    @callbacks(TopUpAmount, BalanceFSM.choosing_amount) и получают те же аргументы, что
+    в aiogram (call, callback_data, state, bot, ...). check() при старте находит конфликты:
+    один префикс у разных классов, пересекающиеся состояния у хэндлеров одного класса,
+    callback-хэндлеры в обход таблицы.
+    """
+
+    def __init__(self, name: str = "callbacks"):
+        self.router = Router(name=name)
+        self.router.callback_query.register(self._dispatch, self._match)
+        self._entries: dict[str, _Entry] = {}
+        self._legacy: list[tuple[str, _Entry]] = []
+        self._conflicts: list[str] = []
+
+    # --- регистрация ---
+
+    def __call__(self, callback_data: type[CallbackData], *states: State | str | None):
+        """
+        Декоратор хэндлера. Без states — в любом состоянии FSM.
+        """
+        def decorator(callback):
+            self._entry(callback_data).routes.append(_Route(callback, self._states(states)))
+            return callback
+        return decorator
+
+    @staticmethod
+    def _states(states) -> frozenset | None:
+        if not states:
+            return None
+        return frozenset(state.state if isinstance(state, State) else state for state in states)
+
+    def _entry(self, callback_data: type[CallbackData]) -> _Entry:
+        prefix = callback_data.__prefix__
+        entry = self._entries.get(prefix)
+        if entry is None:
+            entry = self._entries[prefix] = _Entry(callback_data, callback_data.unpack, [])
+            if issubclass(callback_data, CompactCallbackData) and callback_data.__previous__:
+                self.previous(callback_data.__previous__, callback_data, callback_data.unpack_previous)
+        elif entry.callback_data is not callback_data:
+            self._conflicts.append(
+                f"префикс {prefix!r}: {entry.callback_data.__name__} и {callback_data.__name__}"
+            )
+        return entry
+
+    def alias(self, data: str, callback_data: type[CallbackData]):
+        """
+        Старая кнопка без параметров с другим текстом callback_data ("back_to_menu" -> MainMenu).
+        """
+        if data in self._entries:
+            self._conflicts.append(f"псевдоним {data!r} совпадает с префиксом {self._entries[data].callback_data.__name__}")
+            return
+        entry = self._entry(callback_data)
+        self._entries[data] = _Entry(callback_data, lambda _: callback_data(), entry.routes)
+
+    def previous(self, prefix: str, callback_data: type[CallbackData], parse: Callable[[str], CallbackData]):
+        """
+        Прежний префикс формата "<prefix>:<поля>" (см. версии в utils/callback_codec.py):
+        ищется в словаре, как и текущие. parse получает строку кнопки целиком.
+        Для CompactCallbackData с previous=... вызывается автоматически.
+        """
+        if prefix in self._entries:
+            if self._entries[prefix].parse != parse:
+                self._conflicts.append(
+                    f"прежний префикс {prefix!r} совпадает с префиксом {self._entries[prefix].callback_data.__name__}"
+                )
+            return
+        entry = self._entry(callback_data)
+        self._entries[prefix] = _Entry(callback_data, parse, entry.routes)
+
+    def legacy(self, prefix: str, callback_data: type[CallbackData], parse: Callable[[str], dict]):
+        """
+        Старый формат "<prefix><параметры>" на кнопках уже отправленных сообщений.
+        parse получает остаток строки после prefix и возвращает поля callback_data.
+        Проверяется, только если префикс не нашёлся в таблице.
+        """
+        entry = self._entry(callback_data)
+        self._legacy.append(
+            (prefix, _Entry(callback_data, lambda data: callback_data(**parse(data[len(prefix):])), entry.routes))
+        )
+
+    # --- маршрутизация ---
+
+    def resolve(self, data: str, raw_state: str | None):
+        """
+        (хэндлер, callback_data) для строки кнопки и текущего состояния FSM либо None.
+        """
+        entry = self._entries.get(data.partition(":")[0])
+        if entry is None:
+            for prefix, legacy_entry in self._legacy:
+                if data.startswith(prefix):
+                    entry = legacy_entry
+                    break
+            else:
+                return None
+        route = None
+        for candidate in entry.routes:
+            if candidate.states is None or raw_state in candidate.states:
+                # Хэндлер конкретного состояния важнее хэндлера "в любом состоянии"
+                route = candidate
+                if candidate.states is not None:
+                    break
+        if route is None:
+            return None
+        try:
+            callback_data = entry.parse(data)
+        except (TypeError, ValueError) as e:
+            logger.warning("[callbacks] Не разобрана кнопка %r: %s", data, e)
+            return None
+        return route, callback_data
+
+    async def _match(self, call: CallbackQuery, raw_state: str | None = None):
+        # Фильтр асинхронный: синхронные aiogram выполняет через asyncio.to_thread
+        data = call.data
+        if not data:
+            return False
+        if data[0] == TOKEN_PREFIX:
+            data = await callback_tokens.expand(data)
+            if data is None:
+                logger.warning("[callbacks] Токен кнопки %r истёк или неизвестен", call.data)
+                return False
+        resolved = self.resolve(data, raw_state)
+        if resolved is None:
+            return False
+        return {"callback_route": resolved[0], "callback_data": resolved[1]}
+
+    async def _dispatch(self, call: CallbackQuery, callback_route: _Route, **kwargs):
+        return await callback_route.handler.call(call, **kwargs)
+
+    # --- проверка при старте ---
+
+    def conflicts(self, dispatcher=None) -> list[str]:
+        problems = list(self._conflicts)
+        for prefix, entry in self._entries.items():
+            if entry.parse != entry.callback_data.unpack:
+                continue  # псевдоним или прежний префикс делит хэндлеры с основным
+            seen_any = None
+            seen_states: dict[str, str] = {}
+            for route in entry.routes:
+                if route.states is None:
+                    if seen_any is not None:
+                        problems.append(f"{prefix!r}: {seen_any} и {route.name} (оба в любом состоянии)")
+                    seen_any = route.name
+                    continue
+                for state in route.states:
+                    if state in seen_states:
+                        problems.append(f"{prefix!r} в состоянии {state}: {seen_states[state]} и {route.name}")
+                    seen_states[state] = route.name
+        if dispatcher is not None:
+            for router in dispatcher.chain_tail:
+                if router is self.router:
+                    continue
+                for handler in router.callback_query.handlers:
+                    problems.append(
+                        f"роутер {router.name!r}: callback-хэндлер {handler.callback.__qualname__} в обход таблицы"
+                    )
+        return problems
+
+    def check(self, dispatcher=None):
+        """
+        Вызывается при сборке диспетчера: конфликтующие регистрации — ошибка запуска.
+        """
+        problems = self.conflicts(dispatcher)
+        if problems:
+            raise RuntimeError("Конфликты callback-хэндлеров:\n  " + "\n  ".join(problems))
+        logger.info("[callbacks] Префиксов: %s, старых форматов с '_': %s", len(self._entries), len(self._legacy))
+
+
+callbacks = CallbackTable()
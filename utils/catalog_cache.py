@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left, bisect_right
+
+import database
+from config import CATALOG_PAGE_SIZE, CATALOG_VERSION_POLL_SECONDS
+from repository import run_db
+
+logger = logging.getLogger(__name__)
+
+
+def _page_bounds(keys: list, cursor, back: bool, size: int) -> tuple[int, int]:
+    """
+    Границы [start, end) страницы в отсортированном списке keys (keyset): size строк после cursor
+    или (back=True) перед ним, cursor=None — первая страница. Бинарный поиск, поэтому цена
+    не зависит от номера страницы. Курсор за концом списка (товары раскупили) — последняя страница,
+    «назад» к началу, где строк меньше size, — первая полная.
+    """
+    if cursor is None:
+        start = 0
+    elif back:
+        start = max(0, bisect_left(keys, cursor) - size)
+    else:
+        start = bisect_right(keys, cursor)
+        if start >= len(keys):
+            start = max(0, len(keys) - size)
+    return start, min(len(keys), start + size)
+
+
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок каталога: категория (safe_id) -> подкатегория -> товары.
+    Содержит только товары с quantity > 0, как и запросы get_unique_* / get_products.
+    """
+
+    def __init__(self, version: int, rows: list[tuple]):
+        self.version = version
+        self.categories: list[tuple[str, str]] = []             # [(safe_id, display_name)]
+        self.display_names: dict[str, str] = {}                 # safe_id -> display_name
+        self.subcategories: dict[str, list[str]] = {}           # safe_id -> [type]
+        self.products: dict[tuple[str, str], list[tuple]] = {}  # (safe_id, type) -> [(id, name, price, quantity)]
+        # Числовые id для callback_data (Categories.id, Subcategories.id) в обе стороны
+        self.category_ids: dict[str, int] = {}                  # safe_id -> id
+        self.category_by_id: dict[int, str] = {}                # id -> safe_id
+        self.subcategory_ids: dict[tuple[str, str], int] = {}   # (safe_id, type) -> id
+        self.subcategory_by_id: dict[int, tuple[str, str]] = {}  # id -> (safe_id, type)
+        # id товаров подкатегории по возрастанию (ключи для products_page), заполняется при первом листании
+        self._product_ids: dict[tuple[str, str], list[int]] = {}
+
+        for category_id, safe_id, display_name, subcat_id, subcat, prod_id, name, price, quantity in rows:
+            if safe_id not in self.display_names:
+                self.display_names[safe_id] = display_name
+                self.categories.append((safe_id, display_name))
+                self.subcategories[safe_id] = []
+                self.category_ids[safe_id] = category_id
+                self.category_by_id[category_id] = safe_id
+            key = (safe_id, subcat)
+            if key not in self.products:
+                self.subcategories[safe_id].append(subcat)
+                self.products[key] = []
+                if subcat_id is not None:
+                    self.subcategory_ids[key] = subcat_id
+                    self.subcategory_by_id[subcat_id] = key
+            self.products[key].append((prod_id, name, price, quantity))
+
+    def get_display_name(self, safe_id: str) -> str:
+        return self.display_names.get(safe_id, safe_id)
+
+    def get_subcategories(self, safe_id: str) -> list[str]:
+        return self.subcategories.get(safe_id, [])
+
+    def get_products(self, safe_id: str, subcat: str) -> list[tuple]:
+        return self.products.get((safe_id, subcat), [])
+
+    def subcategories_page(self, safe_id: str, cursor: int = 0, back: bool = False,
+                           size: int = CATALOG_PAGE_SIZE) -> tuple[list[str], bool, bool]:
+        """
+        Страница подкатегорий (по алфавиту) рядом с подкатегорией с id cursor (0 — первая страница).
+        Возвращает (подкатегории, есть ли страница до, есть ли после).
+        """
+        names = self.get_subcategories(safe_id)
+        key = self.subcategory_by_id.get(cursor)
+        start, end = _page_bounds(names, key[1] if key and key[0] == safe_id else None, back, size)
+        return names[start:end], start > 0, end < len(names)
+
+    def products_page(self, safe_id: str, subcat: str, cursor: int = 0, back: bool = False,
+                      size: int = CATALOG_PAGE_SIZE) -> tuple[list[tuple], bool, bool]:
+        """
+        Страница товаров подкатегории (по id): после товара cursor или (back=True) перед ним.
+        Возвращает (товары, есть ли страница до, есть ли после).
+        """
+        key = (safe_id, subcat)
+        products = self.products.get(key, [])
+        ids = self._product_ids.get(key)
+        if ids is None:
+            ids = self._product_ids[key] = [row[0] for row in products]
+        start, end = _page_bounds(ids, cursor or None, back, size)
+        return products[start:end], start > 0, end < len(products)
+
+    def category_id(self, safe_id: str) -> int:
+        return self.category_ids.get(safe_id, 0)
+
+    def subcategory_id(self, safe_id: str, subcat: str) -> int:
+        return self.subcategory_ids.get((safe_id, subcat), 0)
+
+
+class CatalogCache:
+    """
+    Держит текущий CatalogSnapshot. Версию каталога (таблица CatalogVersion, её увеличивают
+    триггеры) сверяет не чаще раза в poll_interval секунд; если версия изменилась —
+    загружает новый снимок и атомарно подменяет ссылку на него.
+    """
+
+    def __init__(self, poll_interval: float = CATALOG_VERSION_POLL_SECONDS):
+        self.poll_interval = poll_interval
+        self._snapshot: CatalogSnapshot | None = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.poll_interval:
+            return snapshot
+
+        async with self._lock:
+            # Пока ждали блокировку, снимок мог обновить другой апдейт
+            if self._snapshot is not None and time.monotonic() - self._checked_at < self.poll_interval:
+                return self._snapshot
+            version = await run_db(database.get_catalog_version)
+            if self._snapshot is None or self._snapshot.version != version:
+                version, rows = await run_db(database.load_catalog)
+                self._snapshot = CatalogSnapshot(version, rows)
+                logger.info("[catalog_cache] Загружен каталог v%s: %s товаров", version, len(rows))
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    @property
+    def snapshot(self) -> CatalogSnapshot | None:
+        """
+        Последний загруженный снимок без сверки версии (для синхронного кода: разбор старых кнопок).
+        """
+        return self._snapshot
+
+    def invalidate(self):
+        """
+        Сверить версию при следующем обращении (вызывается после записей, меняющих остатки).
+        """
+        self._checked_at = 0.0
+
+
+catalog_cache = CatalogCache()
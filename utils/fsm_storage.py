@@ -0,0 +1,158 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StorageKey, StateType
+
+import database
+from config import FSM_STATE_TTL_SECONDS, FSM_FLUSH_INTERVAL, FSM_CACHE_SIZE
+from repository import run_db
+
+logger = logging.getLogger(__name__)
+
+# Как часто удаляем из БД просроченные состояния
+SWEEP_INTERVAL = 600.0
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище FSM в таблице FSMState вместо MemoryStorage: состояние оплаты/заказа
+    переживает перезапуск бота.
+
+    - Чтение идёт через кэш в памяти (LRU); в БД — только при промахе.
+    - Запись сначала в кэш, в БД — пачкой раз в FSM_FLUSH_INTERVAL одной транзакцией
+      (и при close()). При аварийном падении теряются изменения последних долей секунды.
+    - Состояние, не менявшееся дольше FSM_STATE_TTL_SECONDS, считается брошенным:
+      читается как пустое и удаляется из БД фоновой чисткой.
+
+    Кэш корректен, пока апдейты одного пользователя обрабатывает один процесс
+    (так и есть при polling и при шардировании по user_id).
+    """
+
+    def __init__(self, ttl: float = FSM_STATE_TTL_SECONDS, flush_interval: float = FSM_FLUSH_INTERVAL,
+                 cache_size: int = FSM_CACHE_SIZE):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        # key -> [state, data, updated_at]
+        self._cache: OrderedDict[str, list] = OrderedDict()
+        self._dirty: set[str] = set()
+        # Ключи пачки, которая сейчас пишется в БД: до успешной записи их тоже нельзя выгружать
+        self._flushing: set[str] = set()
+        self._flusher: asyncio.Task | None = None
+        self._last_sweep = 0.0
+
+    # --- кэш ---
+
+    async def _entry(self, key: str) -> list:
+        entry = self._cache.get(key)
+        if entry is None:
+            row = await run_db(database.fsm_load, key)
+            # Пока ждали БД, ключ могли записать — запись новее прочитанного
+            entry = self._cache.get(key)
+            if entry is None:
+                if row is None:
+                    entry = [None, {}, time.time()]
+                else:
+                    entry = [row[0], json.loads(row[1]), row[2]]
+                self._cache[key] = entry
+        self._cache.move_to_end(key)
+
+        if (entry[0] is not None or entry[1]) and entry[2] < time.time() - self.ttl:
+            # Брошенный сценарий
+            entry[0], entry[1] = None, {}
+            self._touch(key, entry)
+        self._evict()
+        return entry
+
+    def _touch(self, key: str, entry: list):
+        entry[2] = time.time()
+        self._dirty.add(key)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    def _evict(self):
+        # Выгружаем только уже записанные в БД ключи
+        while len(self._cache) > self.cache_size:
+            for key in self._cache:
+                if key not in self._dirty and key not in self._flushing:
+                    del self._cache[key]
+                    break
+            else:
+                return
+
+    # --- запись в БД ---
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        self._flushing |= keys
+        rows = []
+        for key in keys:
+            entry = self._cache.get(key)
+            if entry is not None:
+                rows.append((key, entry[0], json.dumps(entry[1], ensure_ascii=False), entry[2]))
+        try:
+            await run_db(database.fsm_save_many, rows)
+        except BaseException:
+            # Не потеряли: ключи остались в кэше, попробуем со следующей пачкой
+            # (при отмене из close() — допишет его flush(); повторная запись безвредна)
+            self._dirty |= keys
+            raise
+        finally:
+            self._flushing -= keys
+            self._evict()
+
+    async def _flush_loop(self):
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("[fsm] Ошибка записи состояний FSM: %s", e)
+            now = time.time()
+            if now - self._last_sweep > SWEEP_INTERVAL:
+                self._last_sweep = now
+                try:
+                    removed = await run_db(database.fsm_delete_expired, now - self.ttl)
+                    if removed:
+                        logger.info("[fsm] Удалено брошенных состояний: %s", removed)
+                except Exception as e:
+                    logger.error("[fsm] Ошибка очистки состояний FSM: %s", e)
+
+    # --- BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        entry = await self._entry(storage_key)
+        entry[0] = state.state if isinstance(state, State) else state
+        self._touch(storage_key, entry)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._entry(self.key_builder.build(key)))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        entry = await self._entry(storage_key)
+        entry[1] = copy.deepcopy(dict(data))
+        self._touch(storage_key, entry)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return copy.deepcopy((await self._entry(self.key_builder.build(key)))[1])
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
@@ -1,20 +1,28 @@
 from aiogram.types import User
-from database import get_user_by_telegram_id
+from repository import get_user_by_telegram_id
 import logging
 
-def get_user_language(user: User) -> str:
-    db_user = get_user_by_telegram_id(user.id)
+logger = logging.getLogger(__name__)
+
+async def get_user_language(user: User) -> str:
+    db_user = await get_user_by_telegram_id(user.id)
+    return language_from_row(db_user, user)
+
+def language_from_row(db_user, user: User) -> str:
+    """
+    Язык из строки Users (если он задан и поддерживается), иначе — по language_code Telegram.
+    """
     if db_user:
         db_lang = db_user[4]  # индекс 4 = поле language
         if db_lang:
             # Логируем и нормализуем
-            logging.info(f"[get_user_language] Для пользователя {user.id} БД вернула язык='{db_lang}'")
+            logger.debug("[get_user_language] Для пользователя %s БД вернула язык='%s'", user.id, db_lang)
             db_lang = db_lang.strip().lower()
-            logging.info(f"[get_user_language] Нормализованное значение='{db_lang}'")
+            logger.debug("[get_user_language] Нормализованное значение='%s'", db_lang)
             if db_lang in ["ru", "en"]:
                 return db_lang  # <-- если нормализованный язык подходит
     # fallback
-    logging.info(f"[get_user_language] fallback, user.language_code={user.language_code}")
+    logger.debug("[get_user_language] fallback, user.language_code=%s", user.language_code)
     # user.language_code может быть None или, например, "uk"
     if user.language_code in ["ru", "uk"]:
         return "ru"
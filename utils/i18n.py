@@ -0,0 +1,120 @@
+import asyncio
+import json
+import logging
+from pathlib import Path
+from types import MappingProxyType
+
+from config import TRANSLATIONS_HOT_RELOAD, TRANSLATIONS_RELOAD_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+TRANSLATIONS_DIR = Path(__file__).parent.parent / "translations"
+
+# Цепочка fallback: язык пользователя -> ru -> en
+FALLBACK_CHAIN = ("ru", "en")
+
+
+class _Translations(dict):
+    """
+    Словарь переводов одного языка. Отсутствующий во всей цепочке ключ
+    не роняет хэндлер: логируем один раз и показываем сам ключ.
+    """
+
+    _reported: set = set()
+
+    def __missing__(self, key):
+        if key not in self._reported:
+            self._reported.add(key)
+            logger.error("[i18n] Ключ перевода '%s' отсутствует во всех языках", key)
+        return key
+
+
+# lang -> неизменяемый словарь (с уже применённым fallback); подменяется целиком при перезагрузке
+_registry: dict[str, MappingProxyType] = {}
+_mtimes: dict[str, float] = {}
+
+
+def _read_files() -> tuple[dict[str, dict], dict[str, float]]:
+    raw, mtimes = {}, {}
+    for path in sorted(TRANSLATIONS_DIR.glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            raw[path.stem] = json.load(f)
+        mtimes[path.stem] = path.stat().st_mtime
+    return raw, mtimes
+
+
+def _build_registry(raw: dict[str, dict]) -> dict[str, MappingProxyType]:
+    all_keys = set().union(*raw.values()) if raw else set()
+    registry = {}
+    for lang, texts in raw.items():
+        missing = all_keys - texts.keys()
+        if missing:
+            logger.warning("[i18n] В %s.json нет ключей: %s", lang, ', '.join(sorted(missing)))
+        merged = _Translations()
+        # Сначала самые дальние fallback, затем язык пользователя поверх
+        for fallback in reversed(FALLBACK_CHAIN):
+            merged.update(raw.get(fallback, {}))
+        merged.update(texts)
+        registry[lang] = MappingProxyType(merged)
+    return registry
+
+
+def load_translations():
+    """
+    Читает все translations/*.json один раз (при старте или перезагрузке).
+    """
+    global _registry, _mtimes
+    raw, mtimes = _read_files()
+    _registry = _build_registry(raw)
+    _mtimes = mtimes
+    logger.info("[i18n] Загружены переводы: %s", ', '.join(sorted(_registry)))
+
+
+def get_translations(lang_code: str) -> MappingProxyType:
+    """
+    Переводы для языка пользователя с fallback ru -> en. Без обращения к диску.
+    """
+    if not _registry:
+        load_translations()
+    translations = _registry.get(lang_code)
+    if translations is None:
+        for fallback in FALLBACK_CHAIN:
+            translations = _registry.get(fallback)
+            if translations is not None:
+                break
+    return translations
+
+
+def _current_mtimes() -> dict[str, float]:
+    return {path.stem: path.stat().st_mtime for path in TRANSLATIONS_DIR.glob("*.json")}
+
+
+async def watch_translations(interval: float = TRANSLATIONS_RELOAD_INTERVAL):
+    """
+    Фоновая задача: перечитывает переводы, если файлы изменились (правки переводчиков без рестарта).
+    Битый JSON не ломает бота — остаются предыдущие переводы.
+    """
+    from keyboards.cache import keyboard_cache
+    global _registry, _mtimes
+
+    while True:
+        await asyncio.sleep(interval)
+        current = await asyncio.to_thread(_current_mtimes)
+        if current == _mtimes:
+            continue
+        try:
+            raw, current = await asyncio.to_thread(_read_files)
+            _registry = _build_registry(raw)
+            # Тексты кнопок главного меню берутся из переводов
+            keyboard_cache.clear()
+            logger.info("[i18n] Переводы перезагружены")
+        except Exception as e:
+            logger.error("[i18n] Ошибка перезагрузки переводов: %s", e)
+        # Запоминаем mtime и при ошибке — ждём следующей правки файла, а не повторяем ошибку
+        _mtimes = current
+
+
+def start_translations_watcher():
+    if TRANSLATIONS_HOT_RELOAD:
+        return asyncio.create_task(watch_translations())
+    return None
@@ -0,0 +1,199 @@
+"""
+Оптимизация картинок для Telegram.
+
+Исходники в data/ (в т.ч. PNG по ~1 МБ) уменьшаются до размера, в котором Telegram
+всё равно показывает фото (1280 px по большей стороне), и пережимаются в progressive JPEG.
+Варианты лежат в data/optimized/ под именем по хэшу исходника, manifest.json хранит
+путь исходника -> (mtime, размер, хэш, вариант), поэтому повторно обрабатываются
+только изменённые файлы.
+
+Запуск вручную (этап сборки):  python -m utils.image_optimizer
+При старте бота то же самое выполняется в фоне в пуле процессов (start_image_optimizer).
+Pillow — необязательная зависимость: без неё отправляются исходные файлы.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from config import IMAGE_MAX_SIDE, IMAGE_JPEG_QUALITY, IMAGE_OPTIMIZER_WORKERS
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow не установлен
+    Image = None
+
+PROJECT_ROOT = Path(__file__).parent.parent
+DATA_DIR = PROJECT_ROOT / "data"
+OPTIMIZED_DIR = DATA_DIR / "optimized"
+MANIFEST_PATH = OPTIMIZED_DIR / "manifest.json"
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+# Исходник (относительно корня проекта) -> {"mtime_ns", "size", "hash", "variant"}.
+# variant = None: оптимизированный файл не меньше исходника, отправляем исходник.
+_manifest: dict[str, dict] = {}
+
+
+def _relative(path) -> str:
+    absolute = os.path.abspath(str(path))
+    try:
+        return os.path.relpath(absolute, PROJECT_ROOT)
+    except ValueError:
+        return absolute
+
+
+def load_manifest() -> dict[str, dict]:
+    global _manifest
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            _manifest = json.load(f)
+    except FileNotFoundError:
+        _manifest = {}
+    except (OSError, ValueError) as e:
+        logger.error("[images] Не удалось прочитать %s: %s", MANIFEST_PATH, e)
+        _manifest = {}
+    return _manifest
+
+
+def _save_manifest(manifest: dict[str, dict]):
+    OPTIMIZED_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = MANIFEST_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def resolve(path) -> str:
+    """
+    Путь, который нужно отправлять вместо path: оптимизированный вариант,
+    если он есть и исходник с тех пор не менялся, иначе сам path. Без чтения файлов, только stat.
+    """
+    entry = _manifest.get(_relative(path))
+    if not entry or not entry.get("variant"):
+        return str(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return str(path)
+    if st.st_mtime_ns != entry["mtime_ns"] or st.st_size != entry["size"]:
+        return str(path)
+    variant = PROJECT_ROOT / entry["variant"]
+    return str(variant) if variant.is_file() else str(path)
+
+
+def _optimize(source: str, max_side: int, quality: int) -> dict:
+    """
+    Выполняется в процессе пула: хэширует исходник и, если нужно, пишет вариант.
+    """
+    st = os.stat(source)
+    with open(source, "rb") as f:
+        content = f.read()
+    content_hash = hashlib.sha256(content).hexdigest()
+    entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "hash": content_hash, "variant": None}
+
+    variant = OPTIMIZED_DIR / f"{content_hash[:20]}.jpg"
+    if not variant.is_file():
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ("RGBA", "LA", "P"):
+                # JPEG без альфа-канала: прозрачность на белый фон
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            tmp_path = variant.with_suffix(".tmp")
+            img.save(tmp_path, "JPEG", quality=quality, optimize=True, progressive=True)
+            os.replace(tmp_path, variant)
+
+    if variant.stat().st_size < st.st_size:
+        entry["variant"] = _relative(variant)
+    return entry
+
+
+def collect_sources(extra_paths=()) -> set[str]:
+    """
+    Картинки интерфейса из data/ плюс Products.photo_path (переданные снаружи).
+    """
+    sources = {_relative(p) for p in DATA_DIR.iterdir() if p.is_file() and p.suffix.lower() in IMAGE_SUFFIXES}
+    for path in extra_paths:
+        if path and Path(path).suffix.lower() in IMAGE_SUFFIXES and os.path.isfile(path):
+            sources.add(_relative(path))
+    return sources
+
+
+def build_variants(sources, max_side: int = IMAGE_MAX_SIDE, quality: int = IMAGE_JPEG_QUALITY) -> dict[str, dict]:
+    """
+    Обрабатывает изменившиеся исходники (по mtime/размеру, затем по хэшу) и обновляет манифест.
+    """
+    global _manifest
+    if Image is None:
+        logger.warning("[images] Pillow не установлен — отправляются исходные картинки")
+        return _manifest
+
+    manifest = dict(load_manifest())
+    pending = []
+    for source in sorted(sources):
+        st = os.stat(PROJECT_ROOT / source)
+        entry = manifest.get(source)
+        if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            continue
+        pending.append(source)
+
+    if pending:
+        OPTIMIZED_DIR.mkdir(parents=True, exist_ok=True)
+        # spawn: бот к этому моменту уже держит потоки (пул БД), fork с потоками небезопасен
+        with ProcessPoolExecutor(
+            max_workers=IMAGE_OPTIMIZER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            futures = {
+                source: executor.submit(_optimize, str(PROJECT_ROOT / source), max_side, quality)
+                for source in pending
+            }
+            for source, future in futures.items():
+                try:
+                    manifest[source] = future.result()
+                except Exception as e:
+                    logger.error("[images] Не удалось обработать %s: %s", source, e)
+
+    # Удалённые исходники убираем из манифеста, неиспользуемые варианты — с диска
+    manifest = {source: entry for source, entry in manifest.items() if source in sources}
+    known = {entry["hash"][:20] for entry in manifest.values()}
+    for variant in OPTIMIZED_DIR.glob("*.jpg"):
+        if variant.stem not in known:
+            variant.unlink(missing_ok=True)
+
+    _save_manifest(manifest)
+    _manifest = manifest
+    logger.info("[images] Обработано файлов: %s, всего в манифесте: %s", len(pending), len(manifest))
+    return manifest
+
+
+async def start_image_optimizer(photo_paths=()):
+    """
+    Фоновая обработка при старте: до её завершения resolve() отдаёт то,
+    что уже есть в манифесте (или исходники).
+    """
+    await asyncio.to_thread(load_manifest)
+    sources = await asyncio.to_thread(collect_sources, photo_paths)
+    await asyncio.to_thread(build_variants, sources)
+
+
+if __name__ == "__main__":
+    from config import DB_PATH
+
+    logging.basicConfig(level=logging.INFO)
+    photo_paths = []
+    if os.path.exists(DB_PATH):
+        from database import get_product_photo_paths
+        photo_paths = get_product_photo_paths()
+    build_variants(collect_sources(photo_paths))
@@ -0,0 +1,145 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+from config import LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_FILE, LOG_DEBUG_RATE, LOG_DEBUG_BURST
+
+# Логирование без записи в поток на event loop: хэндлер на корневом логгере только кладёт
+# запись в очередь, форматирует и пишет её фоновый поток (QueueListener).
+# Сообщения — в %-стиле: logger.debug("get_products => %s", rows) — строка собирается
+# только для записи, прошедшей уровень и выборку, и уже в фоновом потоке.
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке: очередь в памяти того же процесса,
+    запись передаётся как есть (стандартный prepare() склеивает msg % args сразу).
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class DebugSampler(logging.Filter):
+    """
+    Ограничение DEBUG-записей: не больше rate в секунду (с запасом burst) с одного места в коде
+    (файл + строка), лишние отбрасываются до постановки в очередь. Число отброшенных
+    дописывается к следующей прошедшей записи с этого места (поле sampled_out).
+    Записи INFO и выше проходят всегда.
+    """
+
+    def __init__(self, rate: float = LOG_DEBUG_RATE, burst: int = LOG_DEBUG_BURST):
+        super().__init__()
+        self.rate = rate
+        self.burst = float(burst)
+        self._buckets: dict[tuple[str, int], list] = {}  # место -> [токены, время, отброшено]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        key = (record.pathname, record.lineno)
+        now = record.created
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now, 0]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1.0:
+            bucket[2] += 1
+            return False
+        bucket[0] -= 1.0
+        if bucket[2]:
+            record.sampled_out = bucket[2]
+            bucket[2] = 0
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        sampled_out = getattr(record, "sampled_out", 0)
+        return f"{text} (+{sampled_out} пропущено)" if sampled_out else text
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Одна JSON-строка на запись: ts, level, logger, msg, pid; exc — если есть исключение,
+    sampled_out — сколько таких же DEBUG-записей отброшено выборкой.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        sampled_out = getattr(record, "sampled_out", 0)
+        if sampled_out:
+            entry["sampled_out"] = sampled_out
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: str | None = None, fmt: str | None = None, log_file: str | None = LOG_FILE):
+    """
+    Настраивает корневой логгер (заменяет logging.basicConfig). Повторный вызов перенастраивает:
+    старый фоновый поток дописывает очередь и останавливается.
+    """
+    global _listener
+    stop_logging()
+
+    output: list[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        output.append(logging.handlers.WatchedFileHandler(log_file, encoding="utf-8"))
+    formatter = JsonFormatter() if (fmt or LOG_FORMAT) == "json" else TextFormatter()
+    for handler in output:
+        handler.setFormatter(formatter)
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(records)
+    queue_handler.addFilter(DebugSampler())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level or LOG_LEVEL)
+    for name, logger_level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener = logging.handlers.QueueListener(records, *output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """
+    Дописать очередь и остановить фоновый поток. Вызывается при выходе (atexit) и в рабочих
+    процессах supervisor.py — они завершаются через os._exit, atexit там не срабатывает.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
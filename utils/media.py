@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile
+
+import database
+from config import MEDIA_STORAGE_CHAT_ID
+from repository import run_db
+from utils import image_optimizer
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent
+DATA_DIR = PROJECT_ROOT / "data"
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def _file_hash(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class MediaRegistry:
+    """
+    Реестр загруженных в Telegram картинок: (путь, sha256 содержимого) -> file_id.
+    Первая отправка файла загружает байты и запоминает file_id из ответа,
+    дальше отправляется только file_id. Изменился файл — изменился хэш — загрузка заново.
+    Сохраняется в таблицу MediaCache, поэтому переживает перезапуск.
+    """
+
+    def __init__(self):
+        self._file_ids: dict[tuple[str, str], str] = {}
+        self._hashes: dict[str, tuple[int, int, str]] = {}  # путь -> (mtime_ns, size, hash)
+        self._loaded = False
+
+    async def load(self):
+        rows = await run_db(database.load_media_cache)
+        self._file_ids = {(path, content_hash): file_id for path, content_hash, file_id in rows}
+        self._loaded = True
+        logger.info("[media] Загружено file_id: %s", len(self._file_ids))
+
+    @staticmethod
+    def normalize(path) -> str:
+        """
+        Один ключ для "data/x.jpg" и абсолютного пути к тому же файлу.
+        """
+        absolute = os.path.abspath(str(path))
+        try:
+            return os.path.relpath(absolute, PROJECT_ROOT)
+        except ValueError:
+            return absolute
+
+    async def _content_hash(self, path: str) -> str:
+        # stat дешёвый, хэш пересчитываем (в потоке) только если файл изменился
+        st = os.stat(path)
+        cached = self._hashes.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        content_hash = await asyncio.to_thread(_file_hash, path)
+        self._hashes[path] = (st.st_mtime_ns, st.st_size, content_hash)
+        return content_hash
+
+    async def send_photo(self, send, path, **kwargs):
+        """
+        send — метод отправки фото (message.answer_photo, partial(bot.send_photo, chat_id) ...).
+        Если файла нет — пробрасывает исключение, хэндлеры откатываются на текст как раньше.
+        """
+        if not self._loaded:
+            await self.load()
+        # Оптимизированный вариант (если уже готов), иначе исходный файл
+        path = image_optimizer.resolve(path)
+        key_path = self.normalize(path)
+        content_hash = await self._content_hash(str(path))
+        key = (key_path, content_hash)
+
+        file_id = self._file_ids.get(key)
+        if file_id:
+            try:
+                return await send(photo=file_id, **kwargs)
+            except TelegramBadRequest as e:
+                # file_id протух (другой бот/токен) — забываем и загружаем заново
+                logger.warning("[media] file_id для %s недействителен: %s", key_path, e)
+                self._file_ids.pop(key, None)
+                await run_db(database.delete_media_file_id, key_path, content_hash)
+
+        result = await send(photo=FSInputFile(str(path)), **kwargs)
+        photos = getattr(result, "photo", None)
+        if photos:
+            file_id = photos[-1].file_id
+            self._file_ids[key] = file_id
+            await run_db(database.save_media_file_id, key_path, content_hash, file_id)
+        return result
+
+    def known_paths(self) -> set[str]:
+        return {path for path, _ in self._file_ids}
+
+    async def warm_up(self, bot, chat_id: int = MEDIA_STORAGE_CHAT_ID):
+        """
+        Загружает в служебный чат все картинки data/ и фото товаров, для которых ещё нет file_id,
+        чтобы первая отправка пользователю тоже шла по file_id.
+        """
+        if not chat_id:
+            return
+        if not self._loaded:
+            await self.load()
+        paths = {str(p) for p in DATA_DIR.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES}
+        paths.update(await run_db(database.get_product_photo_paths))
+
+        uploaded = 0
+        for path in sorted(paths):
+            if not os.path.isfile(path):
+                continue
+            path = image_optimizer.resolve(path)
+            try:
+                key = (self.normalize(path), await self._content_hash(path))
+                if key in self._file_ids:
+                    continue
+                message = await self.send_photo(lambda **kw: bot.send_photo(chat_id=chat_id, disable_notification=True, **kw), path)
+                uploaded += 1
+                try:
+                    await bot.delete_message(chat_id=chat_id, message_id=message.message_id)
+                except Exception:
+                    pass
+            except Exception as e:
+                logger.error("[media] Не удалось предзагрузить %s: %s", path, e)
+        logger.info("[media] Предзагрузка завершена, загружено файлов: %s", uploaded)
+
+
+media_registry = MediaRegistry()
+
+
+async def send_photo(send, path, **kwargs):
+    return await media_registry.send_photo(send, path, **kwargs)
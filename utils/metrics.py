@@ -0,0 +1,347 @@
+import bisect
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Метрики в формате Prometheus: латентность хэндлеров, запросов к БД и к Bot API, апдейты
+# в обработке, ошибки. Запись — счётчики в памяти процесса (словарь + сложение, без блокировок:
+# всё пишется из потока event loop); текст для Prometheus собирается только при запросе /metrics.
+
+HANDLER_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+API_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    kind = "counter"
+    buckets = None
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def values(self) -> dict:
+        return dict(self._values)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин (le). Хранит по каждому набору меток
+    число наблюдений в каждой корзине (не накопительно) и сумму; накопительные счётчики
+    _bucket, _sum и _count считаются при выдаче.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = HANDLER_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}  # метки -> [счётчики корзин (+Inf последней), сумма]
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def values(self) -> dict:
+        return {labels: (tuple(counts), total) for labels, (counts, total) in self._series.items()}
+
+
+class Collected:
+    """
+    Значение, которое считается только при выдаче (размер очереди Outbox, буферы рабочих
+    процессов): collect() возвращает {кортеж меток: число}.
+    """
+
+    def __init__(self, name: str, help: str, kind: str, labels: tuple, collect: Callable[[], dict]):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = labels
+        self.buckets = None
+        self.collect = collect
+
+    def values(self) -> dict:
+        try:
+            return self.collect()
+        except Exception as e:
+            logger.error("[metrics] Ошибка сбора %s: %s", self.name, e)
+            return {}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs: list) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Any] = {}
+
+    def _add(self, metric):
+        # Повторная регистрация под тем же именем заменяет метрику (перезапуск супервизора в тестах)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = HANDLER_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def collect(self, name: str, help: str, kind: str, labels: tuple, collect: Callable[[], dict]) -> Collected:
+        return self._add(Collected(name, help, kind, labels, collect))
+
+    def snapshot(self) -> dict:
+        """
+        Текущие значения всех метрик — обычный словарь (pickle), его рабочие процессы
+        передают супервизору: имя -> (тип, описание, метки, корзины, {метки: значение}).
+        """
+        return {
+            name: (metric.kind, metric.help, metric.labels, metric.buckets, metric.values())
+            for name, metric in self._metrics.items()
+        }
+
+    def render(self, sources: list[tuple[dict, dict]] | None = None) -> str:
+        """
+        Текст в формате Prometheus. sources — список (доп. метки, snapshot()); по умолчанию —
+        метрики этого процесса. Супервизор передаёт свои и снимки рабочих с меткой worker.
+        """
+        if sources is None:
+            sources = [({}, self.snapshot())]
+        families: dict[str, tuple] = {}
+        for extra, snapshot in sources:
+            for name, (kind, help, labels, buckets, values) in snapshot.items():
+                if name not in families:
+                    families[name] = (kind, help, labels, buckets, [])
+                families[name][4].append((list(extra.items()), values))
+
+        lines = []
+        for name, (kind, help, labels, buckets, parts) in families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for extra, values in parts:
+                for label_values, value in values.items():
+                    pairs = extra + list(zip(labels, label_values))
+                    if kind != "histogram":
+                        lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                        continue
+                    counts, total = value
+                    cumulative = 0
+                    for le, count in zip(buckets + (math.inf,), counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(pairs + [('le', _number(le))])} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(pairs)} {_number(total)}")
+                    lines.append(f"{name}_count{_labels(pairs)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+class BotMetrics(MetricsRegistry):
+    """
+    Метрики бота. handler — модуль и имя функции хэндлера ("handlers.catalog.select_category_callback");
+    для инлайн-кнопок это хэндлер из таблицы callbacks, а не её общий диспетчер.
+    query — имя функции из database.py, выполненной через repository.run_db.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.updates = self.counter("bot_updates_total", "Апдейты, прошедшие через диспетчер", ("type",))
+        self.update_errors = self.counter("bot_update_errors_total", "Апдейты, обработка которых завершилась исключением", ("type",))
+        self.updates_in_flight = self.gauge("bot_updates_in_flight", "Апдейты в обработке сейчас (очередь диспетчера)")
+        self.update_seconds = self.histogram("bot_update_seconds", "Обработка апдейта целиком: middleware, фильтры, хэндлер", ("type",))
+        self.handler_seconds = self.histogram("bot_handler_seconds", "Время работы хэндлера", ("event", "handler"))
+        self.handler_errors = self.counter("bot_handler_errors_total", "Исключения в хэндлерах", ("event", "handler"))
+        self.db_seconds = self.histogram("bot_db_query_seconds", "Выполнение запроса к БД в потоке БД", ("query",), DB_BUCKETS)
+        self.db_wait_seconds = self.histogram("bot_db_wait_seconds", "Ожидание свободного потока БД", (), DB_BUCKETS)
+        self.db_errors = self.counter("bot_db_errors_total", "Запросы к БД, завершившиеся исключением", ("query",))
+        self.api_seconds = self.histogram("bot_api_seconds", "Запрос к Bot API", ("method",), API_BUCKETS)
+        self.api_errors = self.counter("bot_api_errors_total", "Ошибки запросов к Bot API", ("method", "error"))
+        self.collect("bot_outbox_messages", "Уведомления Outbox: в очереди и отправляются сейчас", "gauge", ("state",), _outbox_queue)
+        self.collect("bot_outbox_total", "Уведомления Outbox по итогу", "counter", ("result",), _outbox_totals)
+
+
+def _outbox_queue() -> dict:
+    from utils.outbox import outbox  # outbox сам пишет через repository, который импортирует метрики
+    stats = outbox.stats()
+    return {("queued",): stats["queued"], ("in_flight",): stats["in_flight"]}
+
+
+def _outbox_totals() -> dict:
+    from utils.outbox import outbox
+    stats = outbox.stats()
+    return {(result,): stats[result] for result in ("enqueued", "sent", "failed", "retried", "rate_limited")}
+
+
+metrics = BotMetrics()
+
+
+# --- сбор ---
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    Внешний middleware на dp.update: число апдейтов в обработке и время обработки целиком.
+    """
+
+    async def __call__(self, handler: Callable[..., Awaitable], event, data: dict):
+        try:
+            kind = event.event_type
+        except Exception:
+            kind = "unknown"
+        metrics.updates_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.update_errors.inc(kind)
+            raise
+        finally:
+            metrics.update_seconds.observe(time.perf_counter() - started, kind)
+            metrics.updates_in_flight.dec()
+            metrics.updates.inc(kind)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware одного типа событий (message, callback_query, ...): вызывается, когда
+    хэндлер уже выбран, и меряет только его. Хэндлер инлайн-кнопки берётся из callback_route.
+    """
+
+    def __init__(self, event: str):
+        self.event = event
+        self._names: dict[Any, str] = {}
+
+    def _name(self, data: dict) -> str:
+        route = data.get("callback_route")
+        if route is not None:
+            return route.name
+        callback = data["handler"].callback
+        name = self._names.get(callback)
+        if name is None:
+            name = self._names[callback] = f"{callback.__module__}.{getattr(callback, '__qualname__', callback)}"
+        return name
+
+    async def __call__(self, handler: Callable[..., Awaitable], event, data: dict):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.handler_errors.inc(self.event, self._name(data))
+            raise
+        finally:
+            metrics.handler_seconds.observe(time.perf_counter() - started, self.event, self._name(data))
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: время каждого запроса к Bot API по методу (sendMessage, answerCallbackQuery...).
+    """
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            metrics.api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            metrics.api_seconds.observe(time.perf_counter() - started, name)
+
+
+def instrument_dispatcher(dp: Dispatcher):
+    """
+    Вешает middleware метрик на диспетчер и все его роутеры (внутренние middleware в aiogram
+    действуют только в своём роутере). Вызывается после include_router; роутеры — синглтоны
+    модулей, поэтому уже подключённые middleware второй раз не вешаются.
+    """
+    if not METRICS_ENABLED:
+        return
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    middlewares: dict[str, HandlerMetricsMiddleware] = {}
+    for router in dp.chain_tail:
+        for event, observer in router.observers.items():
+            if event in ("update", "error"):
+                continue
+            if any(isinstance(middleware, HandlerMetricsMiddleware) for middleware in observer.middleware):
+                continue
+            if event not in middlewares:
+                middlewares[event] = HandlerMetricsMiddleware(event)
+            observer.middleware(middlewares[event])
+
+
+def instrument_bot(bot):
+    if METRICS_ENABLED:
+        bot.session.middleware(ApiMetricsMiddleware())
+
+
+async def start_metrics_server(render: Callable[[], Awaitable[str]] | None = None, host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """
+    Локальный HTTP-сервер с GET /metrics. render — корутина, возвращающая текст (у супервизора
+    она собирает метрики рабочих процессов); по умолчанию — метрики этого процесса.
+    Возвращает AppRunner (runner.cleanup() при остановке) или None, если метрики выключены
+    или порт занят — бот при этом работает дальше.
+    """
+    if not METRICS_ENABLED:
+        return None
+    from aiohttp import web
+
+    async def handle(request: web.Request) -> web.Response:
+        text = await render() if render is not None else metrics.render()
+        return web.Response(body=text.encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host=host, port=port).start()
+    except OSError as e:
+        logger.error("[metrics] Не удалось открыть %s:%s: %s", host, port, e)
+        await runner.cleanup()
+        return None
+    logger.info("[metrics] http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,324 @@
+import asyncio
+import bisect
+import json
+import logging
+import time
+
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramMigrateToChat, TelegramForbiddenError,
+    TelegramBadRequest, TelegramNotFound, TelegramUnauthorizedError,
+)
+from aiogram.types import InlineKeyboardMarkup
+
+import database
+from config import (
+    OUTBOX_GLOBAL_RATE, OUTBOX_CHAT_RATE, OUTBOX_CHAT_BURST,
+    OUTBOX_CONCURRENCY, OUTBOX_MAX_ATTEMPTS, OUTBOX_MAX_BACKOFF,
+)
+from repository import run_db
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых повторять бессмысленно: бот заблокирован, чат не найден, битый запрос
+PERMANENT_ERRORS = (TelegramForbiddenError, TelegramBadRequest, TelegramNotFound, TelegramUnauthorizedError)
+
+
+class TokenBucket:
+    """
+    rate токенов в секунду, не больше capacity подряд.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """
+        Через сколько секунд будет доступен токен (0 — уже доступен).
+        """
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float):
+        # Ответ 429 от Telegram: ничего не отправляем до конца паузы
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+class _Message:
+    __slots__ = ("id", "chat_id", "method", "payload", "attempts", "next_attempt_at", "created_at")
+
+    def __init__(self, id, chat_id, method, payload, attempts, next_attempt_at, created_at):
+        self.id = id
+        self.chat_id = chat_id
+        self.method = method
+        self.payload = payload
+        self.attempts = attempts
+        self.next_attempt_at = next_attempt_at
+        self.created_at = created_at
+
+
+class Outbox:
+    """
+    Фоновая очередь исходящих уведомлений (админу о платежах/заказах, пользователю о подтверждении).
+    Хэндлер вызывает send_message()/send_photo() и сразу продолжает работу; доставкой занимается
+    воркер с общим (~30 сообщений/с у Telegram) и по-чатовым (~1/с) token bucket.
+    Сообщения одного чата уходят по порядку. TelegramRetryAfter ставит чат на паузу на указанное время,
+    сетевые ошибки повторяются с экспоненциальной задержкой. Каждое сообщение хранится в таблице
+    Outbox до доставки, поэтому переживает перезапуск.
+    """
+
+    def __init__(self):
+        self._pending: list[_Message] = []          # по возрастанию id
+        self._in_flight: set[int] = set()           # чаты, в которые сейчас идёт отправка
+        self._global_bucket = TokenBucket(OUTBOX_GLOBAL_RATE, OUTBOX_GLOBAL_RATE)
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+        self._tasks: set[asyncio.Task] = set()
+        self._worker: asyncio.Task | None = None
+        self._poller: asyncio.Task | None = None
+        self._last_loaded_id = 0
+        self._bot = None
+        # В рабочих процессах (supervisor.py) сообщения только записываются в БД,
+        # доставляет их один процесс-супервизор
+        self.store_only = False
+        self.metrics = {
+            "enqueued": 0,
+            "sent": 0,
+            "failed": 0,
+            "retried": 0,
+            "rate_limited": 0,
+            "delivery_seconds_sum": 0.0,
+            "delivery_seconds_max": 0.0,
+        }
+
+    # --- постановка в очередь ---
+
+    async def send_message(self, chat_id: int, text: str, reply_markup: InlineKeyboardMarkup | None = None, **kwargs):
+        kwargs["text"] = text
+        return await self._enqueue(chat_id, "send_message", reply_markup, kwargs)
+
+    async def send_photo(self, chat_id: int, photo: str, reply_markup: InlineKeyboardMarkup | None = None, **kwargs):
+        """
+        photo — file_id (или URL): в очередь кладём только то, что можно сохранить в БД.
+        """
+        kwargs["photo"] = photo
+        return await self._enqueue(chat_id, "send_photo", reply_markup, kwargs)
+
+    async def _enqueue(self, chat_id: int, method: str, reply_markup, kwargs: dict) -> int:
+        if reply_markup is not None:
+            kwargs["reply_markup"] = reply_markup.model_dump(mode="json", exclude_none=True)
+        payload = json.dumps(kwargs, ensure_ascii=False)
+        now = time.time()
+        message_id = await run_db(database.outbox_add, chat_id, method, payload, now)
+        self.metrics["enqueued"] += 1
+        if not self.store_only:
+            self._push(_Message(message_id, chat_id, method, payload, 0, now, now))
+        return message_id
+
+    def _push(self, message: _Message):
+        bisect.insort(self._pending, message, key=lambda m: m.id)
+        self._wakeup.set()
+
+    # --- запуск / остановка ---
+
+    async def start(self, bot, poll_interval: float | None = None):
+        """
+        Подхватывает недоставленное из БД и запускает воркер.
+        poll_interval — если задан, новые строки Outbox (записанные другими процессами)
+        подхватываются из БД с таким периодом.
+        """
+        self._bot = bot
+        loaded = await self._load_new()
+        if loaded:
+            logger.info("[outbox] Недоставленных сообщений из БД: %s", loaded)
+        self._worker = asyncio.create_task(self._run())
+        if poll_interval:
+            self._poller = asyncio.create_task(self._poll(poll_interval))
+
+    async def _load_new(self) -> int:
+        rows = await run_db(database.outbox_load, self._last_loaded_id)
+        known = {message.id for message in self._pending}
+        for row in rows:
+            self._last_loaded_id = max(self._last_loaded_id, row[0])
+            if row[0] not in known:
+                self._push(_Message(*row))
+        return len(rows)
+
+    async def _poll(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._load_new()
+            except Exception as e:
+                logger.error("[outbox] Ошибка чтения очереди из БД: %s", e)
+
+    async def stop(self, timeout: float = 5.0):
+        """
+        Останавливает воркер; текущим отправкам даём timeout секунд. Остальное остаётся в БД.
+        """
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+
+    # --- доставка ---
+
+    def _next_ready(self, now_wall: float, now: float):
+        """
+        Первое сообщение, которое можно отправить прямо сейчас, либо (None, через сколько проверить снова).
+        Из каждого чата рассматривается только самое раннее сообщение — порядок внутри чата сохраняется.
+        """
+        wait = None
+        global_delay = self._global_bucket.delay(now)
+        seen = set()
+        for message in self._pending:
+            if message.chat_id in seen:
+                continue
+            seen.add(message.chat_id)
+            if message.chat_id in self._in_flight:
+                continue
+            bucket = self._chat_buckets.get(message.chat_id)
+            delay = max(
+                message.next_attempt_at - now_wall,
+                bucket.delay(now) if bucket else 0.0,
+                global_delay,
+            )
+            if delay <= 0:
+                return message, None
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(OUTBOX_CHAT_RATE, OUTBOX_CHAT_BURST)
+        return bucket
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                while True:
+                    self._wakeup.clear()
+                    message, wait = self._next_ready(time.time(), time.monotonic())
+                    if message is not None:
+                        break
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                self._slots.release()
+                raise
+
+            now = time.monotonic()
+            self._global_bucket.take(now)
+            self._chat_bucket(message.chat_id).take(now)
+            self._pending.remove(message)
+            self._in_flight.add(message.chat_id)
+            task = asyncio.create_task(self._deliver(message))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+            # Полные (давно не использованные) bucket'ы не нужны — не копим их по всем чатам
+            if len(self._chat_buckets) > 1000:
+                self._chat_buckets = {
+                    chat_id: bucket for chat_id, bucket in self._chat_buckets.items()
+                    if not bucket.idle(now) or chat_id in self._in_flight
+                }
+
+    async def _deliver(self, message: _Message):
+        # chat_id может смениться (миграция группы), а в _in_flight записан исходный
+        chat_id = message.chat_id
+        try:
+            kwargs = json.loads(message.payload)
+            if "reply_markup" in kwargs:
+                kwargs["reply_markup"] = InlineKeyboardMarkup.model_validate(kwargs["reply_markup"])
+            await getattr(self._bot, message.method)(chat_id=message.chat_id, **kwargs)
+        except TelegramRetryAfter as e:
+            self.metrics["rate_limited"] += 1
+            logger.warning("[outbox] Flood control для чата %s: пауза %s c", message.chat_id, e.retry_after)
+            self._chat_bucket(message.chat_id).block(time.monotonic(), e.retry_after)
+            await self._retry(message, delay=e.retry_after, count_attempt=False)
+        except TelegramMigrateToChat as e:
+            # Группа стала супергруппой — у неё новый id; переносим на него и остальные сообщения чата
+            await self._migrate_chat(chat_id, e.migrate_to_chat_id)
+            message.chat_id = e.migrate_to_chat_id
+            await self._retry(message, delay=0, count_attempt=False)
+        except PERMANENT_ERRORS as e:
+            self.metrics["failed"] += 1
+            logger.error("[outbox] Сообщение #%s в чат %s не доставлено: %s", message.id, message.chat_id, e)
+            await run_db(database.outbox_delete, message.id)
+        except Exception as e:
+            # Сеть, 5xx Telegram и прочее временное — повторяем с экспоненциальной задержкой
+            logger.warning("[outbox] Ошибка отправки #%s в чат %s: %s", message.id, message.chat_id, e)
+            await self._retry(message, delay=min(2 ** message.attempts, OUTBOX_MAX_BACKOFF))
+        else:
+            latency = time.time() - message.created_at
+            self.metrics["sent"] += 1
+            self.metrics["delivery_seconds_sum"] += latency
+            self.metrics["delivery_seconds_max"] = max(self.metrics["delivery_seconds_max"], latency)
+            await run_db(database.outbox_delete, message.id)
+        finally:
+            self._in_flight.discard(chat_id)
+            self._slots.release()
+            self._wakeup.set()
+
+    async def _migrate_chat(self, old_chat_id: int, new_chat_id: int):
+        """
+        Очередь чата old_chat_id -> new_chat_id: в памяти и в БД (в том числе строки,
+        ещё не подхваченные из БД, — их записали другие процессы).
+        """
+        logger.info("[outbox] Чат %s перенесён в %s", old_chat_id, new_chat_id)
+        for message in self._pending:
+            if message.chat_id == old_chat_id:
+                message.chat_id = new_chat_id
+        await run_db(database.outbox_migrate_chat, old_chat_id, new_chat_id)
+
+    async def _retry(self, message: _Message, delay: float, count_attempt: bool = True):
+        if count_attempt:
+            message.attempts += 1
+            if message.attempts >= OUTBOX_MAX_ATTEMPTS:
+                self.metrics["failed"] += 1
+                logger.error("[outbox] Сообщение #%s отброшено после %s попыток", message.id, message.attempts)
+                await run_db(database.outbox_delete, message.id)
+                return
+        self.metrics["retried"] += 1
+        message.next_attempt_at = time.time() + delay
+        await run_db(database.outbox_reschedule, message.id, message.chat_id, message.attempts, message.next_attempt_at)
+        self._push(message)
+
+    def stats(self) -> dict:
+        stats = dict(self.metrics)
+        stats["queued"] = len(self._pending)
+        stats["in_flight"] = len(self._in_flight)
+        return stats
+
+
+outbox = Outbox()
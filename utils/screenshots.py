@@ -0,0 +1,42 @@
+import asyncio
+import hashlib
+import os
+import secrets
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SCREENSHOTS_DIR = PROJECT_ROOT / "data" / "payments"
+
+
+def screenshot_path(file_unique_id: str) -> str:
+    """
+    Путь хранения скриншота по file_unique_id (одинаков для одного и того же файла
+    у любого бота и при повторной отправке): data/payments/ab/cd/<file_unique_id>.jpg.
+    Два уровня подкаталогов по хэшу — чтобы в одном каталоге не копились десятки тысяч файлов.
+    Путь относительный (от корня проекта) — так он и хранится в Payments.screenshot_path.
+    """
+    digest = hashlib.sha1(file_unique_id.encode()).hexdigest()
+    path = SCREENSHOTS_DIR / digest[:2] / digest[2:4] / f"{file_unique_id}.jpg"
+    return os.path.relpath(path, PROJECT_ROOT)
+
+
+async def save_screenshot(bot, photo) -> str:
+    """
+    Скачивает фото потоком (кусками, сразу на диск) в путь по file_unique_id.
+    Если такой файл уже сохранён — повторно не скачивает. Возвращает путь.
+    """
+    path = screenshot_path(photo.file_unique_id)
+    absolute = PROJECT_ROOT / path
+    if await asyncio.to_thread(absolute.is_file):
+        return path
+
+    await asyncio.to_thread(os.makedirs, absolute.parent, exist_ok=True)
+    # Пишем во временный файл и переименовываем: оборванная загрузка не оставит битый скриншот
+    partial = absolute.with_name(f"{absolute.name}.{secrets.token_hex(4)}.part")
+    try:
+        await bot.download(photo, destination=partial)
+        await asyncio.to_thread(os.replace, partial, absolute)
+    except BaseException:
+        await asyncio.to_thread(partial.unlink, missing_ok=True)
+        raise
+    return path
@@ -0,0 +1,64 @@
+import logging
+import re
+
+import database
+from config import CATALOG_PAGE_SIZE, SEARCH_MAX_TERMS
+from repository import run_db
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+
+# Раскладки клавиатур, с которых пишут в бот (ЙЦУКЕН и QWERTY): запрос, набранный
+# не в той раскладке («rkfdbfnehf» вместо «клавиатура»), ищется ещё раз в соседней.
+# Регистр не важен (FTS5 и так без регистра), поэтому таблица — по строчным буквам
+_EN_KEYS = "`qwertyuiop[]asdfghjkl;'zxcvbnm,.~{}:\"<>"
+_RU_KEYS = "ёйцукенгшщзхъфывапролджэячсмитьбюёхъжэбю"
+_SWAP_LAYOUT = str.maketrans(_EN_KEYS + _RU_KEYS[:33], _RU_KEYS + _EN_KEYS[:33])
+
+
+def normalize(text: str) -> str:
+    """
+    Слова запроса в нижнем регистре через пробел (не больше SEARCH_MAX_TERMS) — так запрос
+    хранится в кнопках листания: без знаков препинания и разделителя callback_data ":".
+    «ё» -> «е», как в индексе ProductSearch (migrations._m012_product_search).
+    """
+    return " ".join(_WORD.findall(text.lower().replace("ё", "е"))[:SEARCH_MAX_TERMS])
+
+
+def swap_layout(text: str) -> str:
+    return text.lower().translate(_SWAP_LAYOUT)
+
+
+def match_expression(query: str) -> str | None:
+    """
+    FTS5-выражение: все слова обязательны, каждое из двух и более символов — как начало слова
+    ("клав"* найдёт «клавиатура»). Однобуквенные — только целиком: префикс из одной буквы
+    совпал бы с половиной словаря. None — в запросе нет слов.
+    """
+    terms = [f'"{term}"*' if len(term) > 1 else f'"{term}"' for term in normalize(query).split()]
+    return " ".join(terms) or None
+
+
+async def search(text: str, page: int = 0, size: int = CATALOG_PAGE_SIZE) -> tuple[str, list[tuple], bool, bool]:
+    """
+    Страница page результатов поиска по тексту пользователя.
+    Возвращает (запрос, по которому нашлось, — для кнопок листания; товары; есть ли следующая страница;
+    ранжированы ли — False, если запрос слишком общий, см. database.search_products).
+    Если на первой странице пусто, пробуется тот же текст в другой раскладке.
+    """
+    query = normalize(text)
+    candidates = [query]
+    if page == 0:
+        swapped = normalize(swap_layout(text))
+        if swapped != query:
+            candidates.append(swapped)
+    for candidate in candidates:
+        match = match_expression(candidate)
+        if match is None:
+            continue
+        rows, ranked = await run_db(database.search_products, match, size + 1, page * size)
+        if rows:
+            logger.debug("search(%r) => %r, страница %s: %s товаров", text, candidate, page, len(rows))
+            return candidate, rows[:size], len(rows) > size, ranked
+    return query, [], False, True
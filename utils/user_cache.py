@@ -0,0 +1,107 @@
+import time
+from collections import OrderedDict
+
+from config import USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS
+
+# Индексы полей строки Users (SELECT * FROM Users)
+USER_ID, TELEGRAM_ID, USERNAME, BALANCE, LANGUAGE = range(5)
+
+
+class UserCache:
+    """
+    Ограниченный LRU-кэш строк Users (telegram_id -> строка) с TTL.
+    Заполняется при чтении в repository.py и обновляется там же при записи
+    (баланс, язык), поэтому активные пользователи не ходят в БД.
+    TTL ограничивает устаревание, если строку поменяли в обход бота.
+    Строка, прочитанная из БД после промаха, кладётся через begin_read/end_read: если пока шло
+    чтение, в строку записали, прочитанное уже старое и в кэш не попадает.
+    """
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: OrderedDict[int, tuple[float, tuple]] = OrderedDict()
+        # Вызывается с telegram_id при каждой записи в строку пользователя.
+        # В многопроцессном режиме (supervisor.py) так до процесса, который обслуживает
+        # этого пользователя, доходит инвалидация его копии строки
+        self.on_write = None
+        # Идущие чтения из БД: telegram_id -> [сколько чтений, номер записи]. Номер растёт
+        # при каждой записи в строку, пока её читают; без чтений счётчик не хранится
+        self._reads: dict[int, list[int]] = {}
+
+    def get(self, telegram_id: int):
+        item = self._items.get(telegram_id)
+        if item is None:
+            return None
+        expires_at, row = item
+        if expires_at < time.monotonic():
+            del self._items[telegram_id]
+            return None
+        self._items.move_to_end(telegram_id)
+        return row
+
+    def put(self, row: tuple):
+        telegram_id = row[TELEGRAM_ID]
+        self._items[telegram_id] = (time.monotonic() + self.ttl, tuple(row))
+        self._items.move_to_end(telegram_id)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def begin_read(self, telegram_id: int) -> int:
+        """
+        Перед чтением строки из БД при промахе. Возвращает номер записи для end_read.
+        """
+        entry = self._reads.setdefault(telegram_id, [0, 0])
+        entry[0] += 1
+        return entry[1]
+
+    def end_read(self, telegram_id: int, token: int, row):
+        """
+        После чтения (и при ошибке, с row=None): кладёт строку в кэш, если с begin_read
+        в неё не записывали.
+        """
+        entry = self._reads[telegram_id]
+        entry[0] -= 1
+        if not entry[0]:
+            del self._reads[telegram_id]
+        if row and entry[1] == token:
+            self.put(row)
+
+    def _written(self, telegram_id: int):
+        entry = self._reads.get(telegram_id)
+        if entry is not None:
+            entry[1] += 1
+
+    def update(self, telegram_id: int, balance=None, language=None):
+        """
+        Write-through: обновляет поля закэшированной строки (если она есть в кэше).
+        """
+        if self.on_write is not None:
+            self.on_write(telegram_id)
+        self._written(telegram_id)
+        row = self.get(telegram_id)
+        if row is None:
+            return
+        row = list(row)
+        if balance is not None:
+            row[BALANCE] = balance
+        if language is not None:
+            row[LANGUAGE] = language
+        self.put(tuple(row))
+
+    def invalidate(self, telegram_id: int, notify: bool = True):
+        if notify and self.on_write is not None:
+            self.on_write(telegram_id)
+        self._written(telegram_id)
+        self._items.pop(telegram_id, None)
+
+    def clear(self):
+        for entry in self._reads.values():
+            entry[1] += 1
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+user_cache = UserCache()
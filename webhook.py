@@ -0,0 +1,68 @@
+# Режим webhook: Telegram сам присылает апдейты POST-запросами на aiohttp-сервер бота,
+# вместо того чтобы бот опрашивал getUpdates.
+# Апдейт обрабатывается прямо в запросе: если хэндлер вернул метод Bot API
+# (например, `return call.answer()`), он уходит в теле HTTP-ответа, без отдельного запроса к API.
+import asyncio
+import logging
+import secrets
+import signal
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from config import WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET
+
+logger = logging.getLogger(__name__)
+
+
+def build_app(dp: Dispatcher, bot: Bot, secret_token: str, path: str = WEBHOOK_PATH) -> web.Application:
+    """
+    aiohttp-приложение с одним маршрутом. Запросы без правильного
+    X-Telegram-Bot-Api-Secret-Token получают 401 и до диспетчера не доходят.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token,
+        handle_in_background=False,   # иначе ответить методом в теле HTTP-ответа нельзя
+    ).register(app, path=path)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """
+    Регистрирует webhook в Telegram и обслуживает его до SIGINT/SIGTERM.
+    При остановке webhook не удаляется: пока бот перезапускается, апдейты копятся у Telegram.
+    """
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("BOT_MODE = 'webhook', но WEBHOOK_BASE_URL не задан в config.py")
+    secret_token = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+
+    app = build_app(dp, bot, secret_token)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    await site.start()
+    logger.info("[webhook] Слушаем %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows / не главный поток — останавливаемся по Ctrl+C через KeyboardInterrupt
+
+    try:
+        await bot.set_webhook(
+            url=WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=secret_token,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info("[webhook] Webhook установлен: %s%s", WEBHOOK_BASE_URL.rstrip('/'), WEBHOOK_PATH)
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        await bot.session.close()